@@ -0,0 +1,203 @@
+from __future__ import annotations
+import asyncio
+import socket
+from typing import AsyncIterator, Optional
+
+import paho.mqtt.client as mqtt
+
+from exceptions import ConexionError, PublicacionError
+from meshtastic_client import MeshtasticGateway
+from paquete import Paquete
+
+
+class AsyncMeshtasticGateway:
+    """
+    Variante asyncio de MeshtasticGateway.
+
+    En lugar del hilo de loop_start(), el socket de paho se registra en el
+    event loop (add_reader/add_writer), así que un único loop puede llevar
+    muchos gateways. La lógica de cifrado, decodificación y persistencia es
+    la del MeshtasticGateway envuelto.
+
+        async with AsyncMeshtasticGateway(channel="TestMQTT") as gw:
+            await gw.send_text("hola")
+            async for p in gw.iter_packets():
+                print(p.sender, p.texto)
+    """
+
+    def __init__(self, gateway: Optional[MeshtasticGateway] = None, queue_size: int = 1000,
+                 sndbuf: Optional[int] = None, **kwargs):
+        self.gw = gateway or MeshtasticGateway(**kwargs)
+        self.queue_size = queue_size
+        self.sndbuf = sndbuf  # SO_SNDBUF del socket; None = el del sistema
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._misc_task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._closed: Optional[asyncio.Future] = None
+        self._queues: list = []
+        # la ventana de publicaciones se espera aquí, sin bloquear el loop que la libera
+        self._hueco = asyncio.Event()
+        self.gw._tracker.on_hueco = self._on_hueco
+
+        c = self.gw._client
+        c.on_socket_open = self._on_socket_open
+        c.on_socket_close = self._on_socket_close
+        c.on_socket_register_write = self._on_socket_register_write
+        c.on_socket_unregister_write = self._on_socket_unregister_write
+        # envolver los callbacks del gateway para despertar a los awaits
+        c.on_connect = self._on_connect
+        c.on_subscribe = self._on_subscribe
+
+    # -------- API --------
+    async def connect(self, timeout: Optional[float] = None):
+        """Conecta y espera CONNACK + SUBACK sin bloquear el event loop."""
+        gw = self.gw
+        timeout = gw.connect_timeout if timeout is None else timeout
+        self._loop = asyncio.get_running_loop()
+        self._ready = self._loop.create_future()
+        self._closed = self._loop.create_future()
+        gw._start_pipeline()
+        gw._resume_capture()
+        gw._reset_session()
+        try:
+            gw._client.connect(gw.broker, int(gw.port), 60)
+        except Exception as e:
+            raise ConexionError(f"Fallo conectando a {gw.broker}:{gw.port} → {e}") from e
+        self._misc_task = self._loop.create_task(self._misc_loop())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+            gw._wait_ready(0)  # eventos ya resueltos: sólo traduce errores a ConexionError
+        except asyncio.TimeoutError:
+            await self.disconnect()
+            raise ConexionError(f"Sin CONNACK/SUBACK de {gw.broker}:{gw.port} en {timeout}s")
+        except ConexionError:
+            await self.disconnect()
+            raise
+
+    async def disconnect(self):
+        gw = self.gw
+        gw._client.disconnect()
+        if self._closed is not None and not self._closed.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._closed), 2.0)
+            except asyncio.TimeoutError:
+                pass
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+        gw._connected.clear()
+        gw._stop_pipeline()
+        gw.close_store()
+        gw.stop_capture()
+        gw.nodes.snapshot()
+
+    async def send_text(self, text: str, destination: Optional[str] = None,
+                        qos: Optional[int] = None) -> int:
+        """Publica y espera la confirmación de entrega; devuelve el mid."""
+        return await self._enviar(self.gw.send_text, text, destination, qos)
+
+    async def send_position(self, lat: float, lon: float, alt: float,
+                            qos: Optional[int] = None) -> int:
+        return await self._enviar(self.gw.send_position, lat, lon, alt, qos)
+
+    async def send_nodeinfo(self, want_response: bool = False, qos: Optional[int] = None) -> int:
+        return await self._enviar(self.gw.send_nodeinfo, want_response, qos)
+
+    async def iter_packets(self) -> AsyncIterator[Paquete]:
+        """Itera los paquetes recibidos (se descartan si el consumidor no da abasto)."""
+        q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._queues.append(q)
+        if len(self._queues) == 1:
+            self.gw.on_packet = self._push
+        try:
+            while True:
+                yield await q.get()
+        finally:
+            self._queues.remove(q)
+            if not self._queues:
+                self.gw.on_packet = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    # -------- puente paho ↔ asyncio --------
+    async def _enviar(self, enviar, *args) -> int:
+        """
+        Reserva un hueco de la ventana esperando de forma asíncrona y publica.
+        Entre la reserva y el envío no hay ningún await: otra corrutina no
+        puede quedarse con el hueco.
+        """
+        tracker = self.gw._tracker
+        loop = asyncio.get_running_loop()
+        fin = loop.time() + tracker.timeout
+        while True:
+            self._hueco.clear()
+            if tracker.reservar():
+                break
+            restante = fin - loop.time()
+            try:
+                if restante <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._hueco.wait(), restante)
+            except asyncio.TimeoutError:
+                raise PublicacionError(
+                    f"Ventana de {tracker.max_inflight} publicaciones llena durante {tracker.timeout}s") from None
+        try:
+            fut = enviar(*args)
+        except BaseException:
+            tracker.anular_reserva()
+            raise
+        return await asyncio.wrap_future(fut)
+
+    def _on_hueco(self):
+        # on_publish puede llegar desde otro hilo (p. ej. un gateway compartido)
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._hueco.set)
+
+    def _push(self, p: Paquete):
+        # puede llegar desde el hilo de entrega de la tubería
+        self._loop.call_soon_threadsafe(self._fan_out, p)
+
+    def _fan_out(self, p: Paquete):
+        for q in self._queues:
+            if not q.full():
+                q.put_nowait(p)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        self.gw._on_connect(client, userdata, flags, reason_code, properties)
+        if reason_code != 0:
+            self._resolve_ready()
+
+    def _on_subscribe(self, client, userdata, mid, reason_code_list, properties):
+        self.gw._on_subscribe(client, userdata, mid, reason_code_list, properties)
+        if self.gw._suback.is_set():
+            self._resolve_ready()
+
+    def _resolve_ready(self):
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_result(None)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._loop.add_reader(sock, client.loop_read)
+        if self.sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.remove_reader(sock)
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        # keepalive y reintentos de paho
+        while self.gw._client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
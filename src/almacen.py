@@ -1,14 +1,420 @@
-from typing import Generic, TypeVar, List, Optional
+from __future__ import annotations
+import threading
+import time
+from typing import Callable, Dict, Generic, Hashable, Iterator, List, Optional, TypeVar, Union
+
 T = TypeVar("T")
+
+# Políticas de expulsión al llegar a `capacidad`
+POLITICA_ANILLO = "ring"  # sale el más antiguo (orden de inserción)
+POLITICA_LRU = "lru"      # sale el menos usado: obtener() lo manda al final
+POLITICA_TTL = "ttl"      # como el anillo, y además caducan a los `ttl` segundos
+                          # (con LRU, `ttl` cuenta desde el último uso)
+POLITICAS = (POLITICA_ANILLO, POLITICA_LRU, POLITICA_TTL)
+
+_PRINCIPAL = 0  # posición de la cadena principal en los enlaces de cada nodo
+
+
+class _Nodo:
+    """
+    Eslabón de una o varias cadenas doblemente enlazadas (la principal y una
+    por índice). Al sacarlo de una cadena conserva su enlace `sig`: un
+    iterador parado en él sigue avanzando sin lock y sin copiar nada.
+    """
+    __slots__ = ("item", "clave", "t", "vivo", "sig", "ant", "valores")
+
+    def __init__(self, item, clave, t: float, n_cadenas: int):
+        self.item = item
+        self.clave = clave
+        self.t = t
+        self.vivo = True
+        self.sig: List[Optional[_Nodo]] = [None] * n_cadenas
+        self.ant: List[Optional[_Nodo]] = [None] * n_cadenas
+        self.valores: List[Hashable] = []  # valor de cada índice (None = no indexado)
+
+
+class _Cadena:
+    """Cabecera (centinela), cola y longitud de una cadena."""
+    __slots__ = ("cabeza", "cola", "n", "pos")
+
+    def __init__(self, pos: int, n_cadenas: int):
+        self.cabeza = _Nodo(None, None, 0.0, n_cadenas)
+        self.cola = self.cabeza
+        self.n = 0
+        self.pos = pos
+
+    def enlazar(self, nodo: _Nodo):
+        p = self.pos
+        nodo.ant[p] = self.cola
+        nodo.sig[p] = None
+        self.cola.sig[p] = nodo  # a partir de aquí lo ven los lectores
+        self.cola = nodo
+        self.n += 1
+
+    def desenlazar(self, nodo: _Nodo):
+        p = self.pos
+        a, s = nodo.ant[p], nodo.sig[p]
+        a.sig[p] = s
+        if s is None:
+            self.cola = a
+        else:
+            s.ant[p] = a
+        self.n -= 1
+
+    def primero(self) -> Optional[_Nodo]:
+        return self.cabeza.sig[self.pos]
+
+
 class Almacen(Generic[T]):
-    def __init__(self):
-        self._items: List[T] = []
+    """
+    Almacén en memoria, opcionalmente acotado, con índices secundarios.
+
+    Sin argumentos se comporta como antes (crece sin límite). Con `capacidad`
+    expulsa según `politica` (anillo, LRU o TTL). `clave(item)` da la clave
+    primaria para obtener() en O(1); sin ella la clave es el número de
+    secuencia que devuelve agregar(). `indices` son funciones item → valor
+    (p. ej. nodo o portnum) y por() devuelve los elementos de un valor.
 
-    def agregar(self, item: T) -> None:
-        self._items.append(item)
+    Las escrituras toman un lock; las lecturas (obtener fuera de LRU, vistas
+    e iteración) no, y no copian: son seguras con un productor en el hilo
+    MQTT y un consumidor en el de la interfaz. Un iterador ve los elementos
+    vivos al pasar por ellos; lo que se añade mientras tanto puede verlo o no.
+    """
 
-    def todos(self) -> List[T]:
-        return list(self._items)
+    def __init__(self, capacidad: Optional[int] = None, politica: str = POLITICA_ANILLO,
+                 ttl: Optional[float] = None, clave: Optional[Callable[[T], Hashable]] = None,
+                 indices: Optional[Dict[str, Callable[[T], Optional[Hashable]]]] = None):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de expulsión desconocida: {politica!r}")
+        if politica == POLITICA_TTL and not ttl:
+            raise ValueError("La política TTL necesita ttl > 0")
+        if capacidad is not None and capacidad <= 0:
+            raise ValueError("La capacidad debe ser positiva")
+        self.capacidad = capacidad
+        self.politica = politica
+        self.ttl = ttl
+        self.clave = clave
+        self.expulsados = 0
+
+        self._fns: List[Callable[[T], Optional[Hashable]]] = []
+        self._nombres: Dict[str, int] = {}  # nombre de índice → posición en los enlaces
+        self._por_valor: List[Dict[Hashable, _Cadena]] = []
+        self._cadena = _Cadena(_PRINCIPAL, 1)
+        self._nodos: Dict[Hashable, _Nodo] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        for nombre, fn in (indices or {}).items():
+            self.agregar_indice(nombre, fn)
+
+    # -------- escritura --------
+    def agregar(self, item: T) -> Hashable:
+        """Añade (o sustituye, si la clave ya existe) y devuelve la clave."""
+        ahora = time.monotonic()
+        with self._lock:
+            if self.clave is not None:
+                k = self.clave(item)
+                viejo = self._nodos.get(k)
+                if viejo is not None:
+                    self._sacar(viejo)
+            else:
+                k = self._seq
+            self._seq += 1
+            self._meter(item, k, ahora, [fn(item) for fn in self._fns])
+            self._expulsar(ahora)
+        return k
+
+    def extender(self, items) -> int:
+        n = 0
+        for item in items:
+            self.agregar(item)
+            n += 1
+        return n
+
+    def quitar(self, clave: Hashable) -> Optional[T]:
+        with self._lock:
+            nodo = self._nodos.get(clave)
+            if nodo is None:
+                return None
+            self._sacar(nodo)
+            return nodo.item
+
+    def limpiar(self):
+        with self._lock:
+            for nodo in list(self._nodos.values()):
+                self._sacar(nodo)
+
+    def purgar(self) -> int:
+        """Expulsa lo caducado (TTL) y lo que sobre de la capacidad."""
+        with self._lock:
+            antes = self.expulsados
+            self._expulsar(time.monotonic())
+            return self.expulsados - antes
+
+    def agregar_indice(self, nombre: str, fn: Callable[[T], Optional[Hashable]]):
+        """Registra un índice secundario e indexa lo que ya hay."""
+        with self._lock:
+            if nombre in self._nombres:
+                raise ValueError(f"Índice duplicado: {nombre!r}")
+            i = len(self._fns)
+            self._fns.append(fn)
+            self._nombres[nombre] = i
+            self._por_valor.append({})
+            # hueco para la nueva cadena en la cabecera y en cada nodo
+            for n in [self._cadena.cabeza, *self._por_valor_cabezas()]:
+                n.sig.append(None)
+                n.ant.append(None)
+            nodo = self._cadena.primero()
+            while nodo is not None:
+                nodo.sig.append(None)
+                nodo.ant.append(None)
+                v = fn(nodo.item)
+                nodo.valores.append(v)
+                if v is not None:
+                    self._cadena_de(i, v).enlazar(nodo)
+                nodo = nodo.sig[_PRINCIPAL]
+
+    # -------- consultas --------
+    def obtener(self, clave: Hashable, defecto: Optional[T] = None) -> Optional[T]:
+        """Búsqueda por clave primaria en O(1). En LRU cuenta como uso."""
+        if self.politica == POLITICA_LRU:
+            with self._lock:
+                nodo = self._nodos.get(clave)
+                if nodo is None or not self._vigente(nodo):
+                    return defecto
+                # nodo nuevo al final: el viejo conserva su `sig` para los iteradores
+                self._sacar(nodo)
+                self._meter(nodo.item, clave, time.monotonic(), nodo.valores)
+                return nodo.item
+        nodo = self._nodos.get(clave)
+        if nodo is None or not self._vigente(nodo):
+            return defecto
+        return nodo.item
+
+    def __contains__(self, clave: Hashable) -> bool:
+        nodo = self._nodos.get(clave)
+        return nodo is not None and self._vigente(nodo)
+
+    def __len__(self) -> int:
+        self._caducar()
+        return self._cadena.n
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self.todos())
+
+    def todos(self) -> "Vista[T]":
+        """Vista (sin copia) de todos los elementos, del más antiguo al más reciente."""
+        return Vista(self, self._cadena)
 
     def ultimo(self) -> Optional[T]:
-        return self._items[-1] if self._items else None
+        self._caducar()
+        cola = self._cadena.cola
+        return cola.item if cola is not self._cadena.cabeza else None
+
+    def ultimos(self, n: int) -> "Vista[T]":
+        return self.todos()[-n:] if n > 0 else Vista(self, self._cadena, 0, 0)
+
+    def por(self, indice: str, valor: Hashable) -> "Vista[T]":
+        """
+        Elementos con `valor` en el índice `indice`. La vista es viva aunque
+        el valor aún no exista o se quede sin elementos: la cadena se busca
+        en cada acceso.
+        """
+        return Vista(self, None, indice=self._nombres[indice], valor=valor)
+
+    def valores(self, indice: str) -> List[Hashable]:
+        """Valores presentes en un índice."""
+        return list(self._por_valor[self._nombres[indice]])
+
+    def contar(self, indice: str, valor: Hashable) -> int:
+        self._caducar()
+        cadena = self._por_valor[self._nombres[indice]].get(valor)
+        return cadena.n if cadena is not None else 0
+
+    def lista(self) -> List[T]:
+        """Copia explícita (para quien de verdad la necesite)."""
+        return list(self.todos())
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self._cadena.n, "evictions": self.expulsados,
+                **{f"index_{k}": len(self._por_valor[i]) for k, i in self._nombres.items()}}
+
+    # -------- internos --------
+    def _meter(self, item: T, k: Hashable, t: float, valores: List[Hashable]):
+        nodo = _Nodo(item, k, t, 1 + len(self._fns))
+        nodo.valores = valores
+        self._nodos[k] = nodo
+        self._cadena.enlazar(nodo)
+        for i, v in enumerate(valores):
+            if v is not None:
+                self._cadena_de(i, v).enlazar(nodo)
+
+    def _cadena_de(self, i: int, valor: Hashable) -> _Cadena:
+        tabla = self._por_valor[i]
+        cadena = tabla.get(valor)
+        if cadena is None:
+            cadena = tabla[valor] = _Cadena(1 + i, 1 + len(self._fns))
+        return cadena
+
+    def _cadena_indice(self, i: int, valor: Hashable) -> _Cadena:
+        """Cadena de (índice, valor), o una vacía si ahora mismo no hay ninguno."""
+        cadena = self._por_valor[i].get(valor)
+        return cadena if cadena is not None else _Cadena(1 + i, 1 + len(self._fns))
+
+    def _por_valor_cabezas(self) -> List[_Nodo]:
+        return [c.cabeza for tabla in self._por_valor for c in tabla.values()]
+
+    def _sacar(self, nodo: _Nodo):
+        nodo.vivo = False
+        del self._nodos[nodo.clave]
+        self._cadena.desenlazar(nodo)
+        for i, v in enumerate(nodo.valores):
+            if v is None:
+                continue
+            cadena = self._por_valor[i][v]
+            cadena.desenlazar(nodo)
+            if not cadena.n:
+                del self._por_valor[i][v]
+
+    def _expulsar(self, ahora: float):
+        cadena = self._cadena
+        if self.capacidad is not None:
+            while cadena.n > self.capacidad:
+                self._sacar(cadena.primero())
+                self.expulsados += 1
+        if self.ttl:
+            # la cadena está ordenada por t (inserción o último uso): basta mirar el principio
+            limite = ahora - self.ttl
+            primero = cadena.primero()
+            while primero is not None and primero.t < limite:
+                self._sacar(primero)
+                self.expulsados += 1
+                primero = cadena.primero()
+
+    def _caducar(self):
+        if self.ttl:
+            primero = self._cadena.primero()
+            if primero is not None and primero.t < time.monotonic() - self.ttl:
+                self.purgar()
+
+    def _vigente(self, nodo: _Nodo) -> bool:
+        return nodo.vivo and (not self.ttl or nodo.t >= time.monotonic() - self.ttl)
+
+
+class Vista(Generic[T]):
+    """
+    Vista perezosa sobre una cadena del almacén: len(), iteración, reversed()
+    e índices/cortes como en una lista, pero sin copiar. Los índices negativos
+    se resuelven desde el final en el momento de recorrerla. Las vistas de un
+    índice (por()) guardan (índice, valor) y buscan la cadena al recorrerlas.
+    """
+    __slots__ = ("_almacen", "_fija", "_indice", "_valor", "_inicio", "_fin")
+
+    def __init__(self, almacen: Almacen, cadena: Optional[_Cadena],
+                 inicio: Optional[int] = None, fin: Optional[int] = None,
+                 indice: Optional[int] = None, valor: Hashable = None):
+        self._almacen = almacen
+        self._fija = cadena
+        self._indice = indice
+        self._valor = valor
+        self._inicio = inicio
+        self._fin = fin
+
+    @property
+    def _cadena(self) -> _Cadena:
+        if self._fija is not None:
+            return self._fija
+        return self._almacen._cadena_indice(self._indice, self._valor)
+
+    def _corte(self, inicio: Optional[int], fin: Optional[int]) -> "Vista[T]":
+        return Vista(self._almacen, self._fija, inicio, fin, self._indice, self._valor)
+
+    def _rango(self, cadena: _Cadena):
+        return slice(self._inicio, self._fin).indices(cadena.n)[:2]
+
+    def _abrir(self):
+        """Caduca lo vencido y fija la cadena y el rango de este recorrido."""
+        self._almacen._caducar()
+        cadena = self._cadena
+        return (cadena, *self._rango(cadena))
+
+    def __len__(self) -> int:
+        _, a, b = self._abrir()
+        return max(0, b - a)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[T]:
+        cadena, a, b = self._abrir()
+        if b <= a:
+            return
+        n = cadena.n
+        nodo = _desde_cola(cadena, n - a) if a > n // 2 else _desde_cabeza(cadena, a)
+        p = cadena.pos
+        k = b - a
+        while nodo is not None and k:
+            if nodo.vivo:
+                yield nodo.item
+                k -= 1
+            nodo = nodo.sig[p]
+
+    def __reversed__(self) -> Iterator[T]:
+        cadena, a, b = self._abrir()
+        if b <= a:
+            return
+        nodo = _desde_cola(cadena, cadena.n - b + 1)
+        p = cadena.pos
+        k = b - a
+        while nodo is not None and nodo is not cadena.cabeza and k:
+            if nodo.vivo:
+                yield nodo.item
+                k -= 1
+            nodo = nodo.ant[p]
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            if i.step not in (None, 1):
+                raise ValueError("Las vistas sólo admiten cortes con paso 1")
+            if self._inicio is None and self._fin is None:
+                return self._corte(i.start, i.stop)
+            _, a, b = self._abrir()
+            r = range(a, b)[i]
+            return self._corte(r.start, r.stop)
+        _, a, b = self._abrir()
+        if i < 0:
+            i += b - a
+        if not 0 <= i < b - a:
+            raise IndexError("índice fuera de la vista")
+        for item in self._corte(a + i, a + i + 1):
+            return item
+        raise IndexError("índice fuera de la vista")
+
+    def lista(self) -> List[T]:
+        return list(self)
+
+    def __repr__(self):
+        return f"<Vista {len(self)} elementos>"
+
+
+def _desde_cabeza(cadena: _Cadena, saltar: int) -> Optional[_Nodo]:
+    p = cadena.pos
+    nodo = cadena.primero()
+    while nodo is not None and saltar:
+        if nodo.vivo:
+            saltar -= 1
+        nodo = nodo.sig[p]
+    return nodo
+
+
+def _desde_cola(cadena: _Cadena, contar: int) -> Optional[_Nodo]:
+    """El `contar`-ésimo nodo vivo empezando por el final (1 = el último)."""
+    p = cadena.pos
+    cabeza = cadena.cabeza
+    nodo = cadena.cola
+    while nodo is not cabeza:
+        if nodo.vivo:
+            contar -= 1
+            if contar <= 0:
+                return nodo
+        nodo = nodo.ant[p]
+    return cadena.primero()
@@ -11,5 +11,11 @@ def demo_almacen():
     almac_disp.agregar(d)
     print("Último dispositivo:", almac_disp.ultimo().nombre)
 
+    # acotado: anillo de 3 con un índice por longitud
+    almac_acot = Almacen[str](capacidad=3, indices={"len": len})
+    for s in ("a", "bb", "cc", "ddd"):
+        almac_acot.agregar(s)
+    print("Acotado:", list(almac_acot.todos()), "| len 2:", list(almac_acot.por("len", 2)))
+
 if __name__ == "__main__":
     demo_almacen()
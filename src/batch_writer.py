@@ -0,0 +1,191 @@
+from __future__ import annotations
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from codec import Codec
+
+# Qué hacer cuando la cola está llena
+LLENA_DESCARTAR = "drop"    # se descarta el registro y se cuenta
+LLENA_BLOQUEAR = "block"    # se espera hasta `block_timeout` y, si no hay hueco, se descarta
+
+_FIN = object()  # centinela de cierre
+
+
+class JsonlSink:
+    """Escribe un lote de registros como JSON Lines con un único write()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+
+    def __call__(self, records: List[Dict]):
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+
+class CodecSink:
+    """Como JsonlSink, con cualquier codec de codec.py (p. ej. el binario)."""
+
+    def __init__(self, path: str, codec: Codec):
+        self.path = path
+        self.codec = codec
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+
+    def __call__(self, records: List[Dict]):
+        with open(self.path, "ab") as f:
+            self.codec.escribir(f, records)
+
+
+class BatchWriter:
+    """
+    Escritor en segundo plano con cola acotada.
+
+    `append()` sólo encola (no toca disco); un hilo dedicado agrupa los
+    registros y llama a `sink(lote)` cada `flush_interval` segundos o en
+    cuanto hay `batch_size` registros. `close()` vacía la cola antes de salir.
+    """
+
+    def __init__(self, sink: Callable[[List[Dict]], None], max_queue: int = 10000,
+                 batch_size: int = 256, flush_interval: float = 0.5,
+                 on_full: str = LLENA_DESCARTAR, block_timeout: float = 0.05,
+                 name: str = "batch-writer", debug: bool = False,
+                 latencia=None):
+        if on_full not in (LLENA_DESCARTAR, LLENA_BLOQUEAR):
+            raise ValueError(f"Política de cola llena desconocida: {on_full!r}")
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_full = on_full
+        self.block_timeout = block_timeout
+        self.debug = debug
+        self.latencia = latencia  # histograma (metricas.Histograma) del tiempo de cada sink(lote)
+
+        # Contadores
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.errors = 0
+        self.batches = 0
+
+        self._q: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    # -------- API --------
+    def append(self, record: Dict) -> bool:
+        """Encola un registro. Devuelve False si se ha descartado."""
+        if self._closed:
+            self.dropped += 1
+            return False
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            if self.on_full == LLENA_DESCARTAR:
+                self.dropped += 1
+                return False
+            self.blocked += 1
+            try:
+                self._q.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        self.enqueued += 1
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que todo lo encolado hasta ahora esté escrito."""
+        if not self._thread.is_alive():
+            return self._q.unfinished_tasks == 0
+        fin = None if timeout is None else time.monotonic() + timeout
+        with self._q.all_tasks_done:
+            while self._q.unfinished_tasks:
+                restante = None if fin is None else fin - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._q.all_tasks_done.wait(restante)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Deja de aceptar registros, escribe lo pendiente y para el hilo."""
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(_FIN)  # bloqueante: el centinela siempre entra
+        self._thread.join(timeout)
+        cerrar = getattr(self.sink, "close", None)  # p. ej. la conexión de SqliteStore
+        if cerrar is not None and not self._thread.is_alive():
+            cerrar()
+
+    @property
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "errors": self.errors,
+            "batches": self.batches,
+        }
+
+    # -------- hilo escritor --------
+    def _run(self):
+        lote: List[Dict] = []
+        fin = False
+        while not fin:
+            # esperar al primer registro sin límite y completar el lote hasta el plazo
+            item = self._q.get()
+            limite = time.monotonic() + self.flush_interval
+            while True:
+                if item is _FIN:
+                    fin = True
+                    self._q.task_done()
+                    break
+                lote.append(item)
+                if len(lote) >= self.batch_size:
+                    break
+                restante = limite - time.monotonic()
+                try:
+                    item = self._q.get(timeout=restante) if restante > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+            if fin:
+                # vaciar lo que quede detrás del centinela
+                while True:
+                    try:
+                        lote.append(self._q.get_nowait())
+                    except queue.Empty:
+                        break
+            self._write(lote)
+            lote = []
+
+    def _write(self, lote: List[Dict]):
+        n = len(lote)
+        if n:
+            try:
+                t0 = time.perf_counter()
+                self.sink(lote)
+                if self.latencia is not None:
+                    self.latencia.observe(time.perf_counter() - t0)
+                self.written += n
+                self.batches += 1
+            except Exception as e:
+                self.errors += 1
+                if self.debug:
+                    print(f"[STORE] Error al escribir lote de {n}: {e}")
+        for _ in range(n):
+            self._q.task_done()
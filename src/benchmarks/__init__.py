@@ -0,0 +1,4 @@
+"""Micro-benchmarks del proyecto. Ejecutar desde src/: python -m benchmarks.<módulo>
+
+`python -m benchmarks` ejecuta los de extremo a extremo (recepción/envío del
+gateway, MqttClient y Dispositivo) y emite JSON comparable entre ejecuciones."""
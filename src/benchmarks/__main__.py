@@ -0,0 +1,98 @@
+"""
+Ejecuta los benchmarks de extremo a extremo y emite un JSON comparable entre
+ejecuciones (entorno + resultados por suite).
+
+    python -m benchmarks [--rapido] [--solo recepcion mqtt] [--salida res.json]
+                         [--comparar anterior.json] [--umbral 0.15]
+
+Con --comparar se listan las métricas que empeoran más que el umbral
+(ritmos *_por_s que bajan, latencias *_us que suben) y se sale con código 1.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks import bench_dispositivo, bench_mqtt, bench_recepcion
+from benchmarks.comun import entorno
+
+# suite → (función, parámetros normales, parámetros con --rapido)
+SUITES = {
+    "recepcion": (bench_recepcion.ejecutar, {"n": 20000}, {"n": 2000}),
+    "mqtt": (bench_mqtt.ejecutar, {"n": 50000, "tramos": 5}, {"n": 5000, "tramos": 5}),
+    "dispositivo": (bench_dispositivo.ejecutar, {"rondas": 200, "por_ronda": 50}, {"rondas": 40, "por_ronda": 50}),
+}
+
+# Las colas (max) y los tramos sueltos son demasiado ruidosos para comparar
+_COMPARABLES = ("_por_s", "media_us", "p50_us", "p95_us", "p99_us")
+
+
+def ejecutar(suites: List[str], rapido: bool = False) -> Dict:
+    resultados = {}
+    for nombre in suites:
+        fn, normal, reducido = SUITES[nombre]
+        t0 = time.perf_counter()
+        resultados[nombre] = fn(**(reducido if rapido else normal))
+        print(f"[BENCH] {nombre}: {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    return {"ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "rapido": rapido,
+            "entorno": entorno(), "resultados": resultados}
+
+
+def _aplanar(d: Dict, prefijo: str = "") -> Dict[str, float]:
+    out = {}
+    for k, v in d.items():
+        clave = f"{prefijo}.{k}" if prefijo else k
+        if isinstance(v, dict):
+            out.update(_aplanar(v, clave))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool) and clave.endswith(_COMPARABLES):
+            out[clave] = float(v)
+    return out
+
+
+def comparar(anterior: Dict, actual: Dict, umbral: float) -> List[Tuple[str, float, float, float]]:
+    """(métrica, antes, ahora, cambio relativo) de lo que empeora más que `umbral`."""
+    a, b = _aplanar(anterior["resultados"]), _aplanar(actual["resultados"])
+    peores = []
+    for clave in sorted(a.keys() & b.keys()):
+        antes, ahora = a[clave], b[clave]
+        if not antes:
+            continue
+        cambio = (ahora - antes) / antes
+        empeora = -cambio if clave.endswith("_por_s") else cambio
+        if empeora > umbral:
+            peores.append((clave, antes, ahora, cambio))
+    return peores
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--solo", nargs="+", choices=list(SUITES), default=list(SUITES))
+    ap.add_argument("--rapido", action="store_true", help="tamaños reducidos (humo)")
+    ap.add_argument("--salida", help="fichero JSON de resultados (por defecto stdout)")
+    ap.add_argument("--comparar", help="JSON de una ejecución anterior")
+    ap.add_argument("--umbral", type=float, default=0.15, help="empeoramiento relativo tolerado")
+    args = ap.parse_args()
+
+    res = ejecutar(args.solo, args.rapido)
+    texto = json.dumps(res, indent=1, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+        peores = comparar(anterior, res, args.umbral)
+        for clave, antes, ahora, cambio in peores:
+            print(f"[REGRESIÓN] {clave}: {antes:,.1f} → {ahora:,.1f} ({cambio:+.0%})", file=sys.stderr)
+        if peores:
+            sys.exit(1)
+        print(f"[BENCH] Sin regresiones por encima del {args.umbral:.0%}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Throughput de descifrado (paquetes/s) sobre ServiceEnvelope sintéticos.
+
+Compara la ruta antigua (base64 + Cipher nuevo por paquete) con la actual
+(`_decrypt_packet` con el AES precalculado del canal) y con la decodificación
+completa del gateway (`MeshtasticGateway._decode`: envelope, clave por hash,
+descifrado y Paquete).
+
+    python -m benchmarks.bench_cifrado [-n 20000]
+"""
+from __future__ import annotations
+import argparse
+import base64
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from meshtastic import BROADCAST_NUM
+from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2
+
+from meshtastic_client import MeshtasticGateway, _decrypt_packet
+
+
+def generar_envelopes(gw: MeshtasticGateway, n: int):
+    """n ServiceEnvelope serializados con texto cifrado."""
+    out = []
+    for i in range(n):
+        d = mesh_pb2.Data()
+        d.portnum = portnums_pb2.TEXT_MESSAGE_APP
+        d.payload = f"mensaje de prueba {i}".encode("utf-8")
+        out.append(gw._make_envelope(BROADCAST_NUM, d).SerializeToString())
+    return out
+
+
+def _decrypt_antiguo(key_b64: str, mp: mesh_pb2.MeshPacket):
+    """Copia de la implementación anterior, como referencia."""
+    key_bytes = base64.b64decode(key_b64.encode('ascii'))
+    nonce = mp.id.to_bytes(8, "little") + getattr(mp, "from").to_bytes(8, "little")
+    cipher = Cipher(algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend())
+    dec = cipher.decryptor()
+    decrypted = dec.update(getattr(mp, "encrypted")) + dec.finalize()
+    data = mesh_pb2.Data()
+    data.ParseFromString(decrypted)
+    mp.decoded.CopyFrom(data)
+
+
+def _medir(payloads, descifrar) -> float:
+    t0 = time.perf_counter()
+    for raw in payloads:
+        se = mqtt_pb2.ServiceEnvelope()
+        se.ParseFromString(raw)
+        descifrar(se.packet)
+    return len(payloads) / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("-n", type=int, default=20000, help="paquetes sintéticos")
+    args = ap.parse_args()
+
+    gw = MeshtasticGateway()
+    payloads = generar_envelopes(gw, args.n)
+
+    gw._set_topics()
+    topic = gw._publish_topic
+    antes = _medir(payloads, lambda mp: _decrypt_antiguo(gw.key_b64, mp))
+    despues = _medir(payloads, lambda mp: _decrypt_packet(mp, gw._aes))
+    t0 = time.perf_counter()
+    for raw in payloads:
+        gw._decode(topic, raw)
+    completo = len(payloads) / (time.perf_counter() - t0)
+    print(f"paquetes:  {args.n}")
+    print(f"antes:     {antes:,.0f} paq/s")
+    print(f"después:   {despues:,.0f} paq/s  (x{despues / antes:.2f})")
+    print(f"_decode:   {completo:,.0f} paq/s  (envelope + descifrado + Paquete)")
+    gw.close_store()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Tamaño y velocidad de los codecs de registros sobre data/data_store.json.
+
+Compara el fichero tal cual (array JSON con sangría), JSON Lines
+(`codec.CodecJSON`, lo que escriben gateway y segmentos) y el binario con
+prefijo de longitud (`codec.CodecBinario`). Mide también el coste en memoria
+de Mensaje con __slots__ y ts entero frente al antiguo (fecha isoformat).
+
+    python -m benchmarks.bench_codec [-r 20] [--archivo ../data/data_store.json]
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from codec import CODEC_BINARIO, CODEC_JSON, CODECS
+from mensaje import Mensaje
+from parseo import leer_registros
+
+
+class _MensajeAntiguo:
+    """Copia de la implementación anterior, como referencia."""
+
+    def __init__(self, contenido):
+        self.contenido = contenido
+        self.fecha = datetime.utcnow().isoformat()
+
+
+def _medir(fn, repeticiones: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        fn()
+    return (time.perf_counter() - t0) / repeticiones
+
+
+def _memoria(crear, n: int) -> float:
+    tracemalloc.start()
+    objetos = [crear(i) for i in range(n)]
+    actual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objetos
+    return actual / n
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("-r", type=int, default=20, help="repeticiones sobre el fichero")
+    ap.add_argument("--archivo", default=os.path.join(os.path.dirname(__file__), "..", "..", "data", "data_store.json"))
+    args = ap.parse_args()
+
+    registros = leer_registros(args.archivo)
+    n = len(registros)
+    original = os.path.getsize(args.archivo)
+    print(f"registros: {n}  ({args.archivo})")
+    print(f"{'formato':10} {'bytes':>9} {'B/reg':>7} {'ratio':>6} {'codif. reg/s':>13} {'decodif. reg/s':>15}")
+
+    t_pretty = _medir(lambda: json.dumps(registros, ensure_ascii=False, indent=2), args.r)
+    t_pretty_dec = _medir(lambda: json.loads(json.dumps(registros, ensure_ascii=False, indent=2)), args.r) - t_pretty
+    print(f"{'array':10} {original:9d} {original / n:7.1f} {1.0:6.2f} {n / t_pretty:13,.0f} {n / t_pretty_dec:15,.0f}")
+
+    for nombre in (CODEC_JSON, CODEC_BINARIO):
+        codec = CODECS[nombre]
+        buf = io.BytesIO()
+        codec.escribir(buf, registros)
+        datos = buf.getvalue()
+        leidos = list(codec.leer(io.BytesIO(datos)))
+        if leidos != registros:
+            print(f"  ¡{nombre}: la ida y vuelta no coincide!", file=sys.stderr)
+        t_cod = _medir(lambda: codec.codificar_lote(registros), args.r)
+        t_dec = _medir(lambda: list(codec.leer(io.BytesIO(datos))), args.r)
+        print(f"{nombre:10} {len(datos):9d} {len(datos) / n:7.1f} {len(datos) / original:6.2f} "
+              f"{n / t_cod:13,.0f} {n / t_dec:15,.0f}")
+
+    m = 100_000
+    antes = _memoria(lambda i: _MensajeAntiguo(i), m)
+    despues = _memoria(lambda i: Mensaje(i), m)
+    print(f"Mensaje:   {antes:.0f} B → {despues:.0f} B por objeto (x{antes / despues:.1f} menos)")
+
+
+if __name__ == "__main__":
+    main()
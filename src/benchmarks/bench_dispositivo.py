@@ -0,0 +1,70 @@
+"""
+Dispositivo.guardar_datos a medida que crece el historial.
+
+En cada ronda se registran mensajes y posiciones nuevos y se guarda; se mide
+la latencia de cada guardado (incremental al journal, con una compactación
+completa cada COMPACTAR_CADA registros) frente al tamaño del historial.
+
+    python -m benchmarks.bench_dispositivo [--rondas 200] [--por-ronda 50]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+import time
+from statistics import median
+from typing import Dict
+
+from dispositivo import Dispositivo
+
+from benchmarks.comun import resumen_latencias, tamano
+
+
+def crecimiento(rondas: int, por_ronda: int) -> Dict:
+    with tempfile.TemporaryDirectory() as d:
+        ruta = os.path.join(d, "dispositivo.json")
+        disp = Dispositivo("bench")
+        lat = []
+        muestras = []
+        cada = max(1, rondas // 10)
+        for k in range(rondas):
+            for i in range(por_ronda):
+                disp.registrar_mensaje(f"mensaje {k}.{i}", origen="!00bec401")
+                disp.registrar_posicion(40.4 + k * 1e-4 + i * 1e-6, -3.7 - i * 1e-6, 650.0)
+            t0 = time.perf_counter()
+            disp.guardar_datos(ruta)
+            lat.append(time.perf_counter() - t0)
+            if k % cada == cada - 1:
+                muestras.append({
+                    "historial": len(disp.historial),
+                    "guardado_us": lat[-1] * 1e6,
+                    "bytes_disco": tamano(d),
+                })
+        # la mediana de los guardados incrementales es la cifra a vigilar;
+        # las compactaciones aparecen como cola (p99/max)
+        decima = rondas // 10 or 1
+        return {
+            "rondas": rondas,
+            "registros": rondas * por_ronda,
+            "guardados_por_s": rondas / sum(lat),
+            "latencia": resumen_latencias(lat),
+            "ultimo_vs_primero": median(lat[-decima:]) / median(lat[:decima]),
+            "muestras": muestras,
+        }
+
+
+def ejecutar(rondas: int = 200, por_ronda: int = 50) -> Dict:
+    return {"guardar_datos": crecimiento(rondas, por_ronda)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--rondas", type=int, default=200)
+    ap.add_argument("--por-ronda", type=int, default=50, help="mensajes y posiciones por guardado")
+    args = ap.parse_args()
+    print(json.dumps(ejecutar(args.rondas, args.por_ronda), indent=1))
+
+
+if __name__ == "__main__":
+    main()
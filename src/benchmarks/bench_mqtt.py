@@ -0,0 +1,82 @@
+"""
+MqttClient._on_message → _persist a medida que crece el almacén.
+
+Entrega mensajes JSON y de texto por tramos (como paho, sin red) y mide en
+cada tramo el ritmo y la latencia por mensaje junto al tamaño en disco: con
+SegmentStore el coste por registro no debe crecer con el histórico.
+
+    python -m benchmarks.bench_mqtt [-n 50000] [--tramos 5] [--codec json]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import paho.mqtt.client as mqtt
+
+from codec import CODECS
+from mqtt_client import MqttClient
+
+from benchmarks.comun import cronometrar, resumen_latencias, tamano
+
+
+def _mensajes(desde: int, n: int) -> List[tuple]:
+    out = []
+    for i in range(desde, desde + n):
+        msg = mqtt.MQTTMessage(topic=b"bench/mqtt")
+        if i % 4:
+            msg.payload = json.dumps({"n": i, "lat": 40.4 + i * 1e-6, "lon": -3.7, "texto": f"dato {i}"}).encode()
+        else:
+            msg.payload = f"texto plano {i}".encode()
+        out.append((None, None, msg))
+    return out
+
+
+def crecimiento(n: int, tramos: int, codec: str) -> Dict:
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "data_store.json")
+        c = MqttClient(data_store=path, codec=codec)
+        c._on_json = lambda topic, dato: None
+        c._on_text = lambda topic, texto: None
+        por_tramo = n // tramos
+        filas = []
+        for k in range(tramos):
+            mensajes = _mensajes(k * por_tramo, por_tramo)
+            t0 = time.perf_counter()
+            lat = cronometrar(c._on_message, mensajes)
+            dt = time.perf_counter() - t0
+            c._store.flush()
+            filas.append({
+                "registros": (k + 1) * por_tramo,
+                "bytes_disco": tamano(d),
+                "msg_por_s": por_tramo / dt,
+                "latencia": resumen_latencias(lat),
+            })
+        c._store.close()
+        primero, ultimo = filas[0]["msg_por_s"], filas[-1]["msg_por_s"]
+        return {
+            "mensajes": por_tramo * tramos,
+            "msg_por_s": sum(f["msg_por_s"] for f in filas) / len(filas),
+            "ultimo_vs_primero": ultimo / primero,  # ≈1 si el coste no depende del tamaño
+            "tramos": filas,
+        }
+
+
+def ejecutar(n: int = 50000, tramos: int = 5, codecs: List[str] = ("json",)) -> Dict:
+    return {f"persistencia_{codec}": crecimiento(n, tramos, codec) for codec in codecs}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("-n", type=int, default=50000, help="mensajes en total")
+    ap.add_argument("--tramos", type=int, default=5)
+    ap.add_argument("--codec", nargs="+", default=list(CODECS), choices=list(CODECS))
+    args = ap.parse_args()
+    print(json.dumps(ejecutar(args.n, args.tramos, args.codec), indent=1))
+
+
+if __name__ == "__main__":
+    main()
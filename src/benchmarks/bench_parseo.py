@@ -0,0 +1,90 @@
+"""
+Parseo de posiciones sobre los mensajes reales de data/data_store.json.
+
+Compara la ruta antigua del mapa (json.loads + except, y luego el bucle de
+tokens de parsear_posicion_meshtastic) con `parseo.parsear_posicion`
+(encaminado por el primer carácter + regex de una pasada).
+
+    python -m benchmarks.bench_parseo [-r 50] [--archivo ../data/data_store.json]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+
+from parseo import leer_registros, parsear_lineas, parsear_posicion
+
+
+def _tokens_antiguo(linea: str):
+    """Copia de la implementación anterior, como referencia."""
+    linea = linea.replace("\n", " ").replace("\r", " ")
+    partes = linea.split()
+    datos = {}
+    clave_pendiente = None
+    for p in partes:
+        if p.endswith(":"):
+            clave_pendiente = p[:-1]
+        elif ":" in p:
+            k, v = p.split(":", 1)
+            datos[k] = v
+            clave_pendiente = None
+        else:
+            if clave_pendiente:
+                datos[clave_pendiente] = p
+                clave_pendiente = None
+    if "latitude_i" in datos and "longitude_i" in datos:
+        try:
+            alt_raw = datos.get("altitude_hae") or datos.get("altitude") or datos.get("alt") or "0"
+            return int(datos["latitude_i"]) / 1e7, int(datos["longitude_i"]) / 1e7, float(alt_raw)
+        except Exception:
+            return None
+    return None
+
+
+def _antiguo(texto: str):
+    try:
+        payload = json.loads(texto)
+        lat = payload.get("lat")
+        lon = payload.get("long") or payload.get("lon") or payload.get("longitude")
+        if lat is not None and lon is not None:
+            return float(lat), float(lon), float(payload.get("alt", 0.0))
+        return None
+    except:
+        pass
+    return _tokens_antiguo(texto)
+
+
+def _medir(textos, fn, repeticiones: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        for t in textos:
+            fn(t)
+    return len(textos) * repeticiones / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("-r", type=int, default=50, help="repeticiones sobre el fichero")
+    ap.add_argument("--archivo", default=os.path.join(os.path.dirname(__file__), "..", "..", "data", "data_store.json"))
+    args = ap.parse_args()
+
+    textos = [r["text"] for r in leer_registros(args.archivo) if r.get("text")]
+    distintos = sum(1 for t in textos if _antiguo(t) != parsear_posicion(t))
+    con_pos = sum(1 for p in parsear_lineas(textos) if p is not None)
+
+    antes = _medir(textos, _antiguo, args.r)
+    despues = _medir(textos, parsear_posicion, args.r)
+    t0 = time.perf_counter()
+    for _ in range(args.r):
+        parsear_lineas(textos)
+    lote = len(textos) * args.r / (time.perf_counter() - t0)
+
+    print(f"mensajes:  {len(textos)} ({con_pos} con posición, {distintos} resultados distintos)")
+    print(f"antes:     {antes:,.0f} msg/s")
+    print(f"después:   {despues:,.0f} msg/s  (x{despues / antes:.2f})")
+    print(f"lote:      {lote:,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Camino completo de MeshtasticGateway con paquetes cifrados sintéticos.
+
+recepción: _on_message → ServiceEnvelope → descifrado → decodificación →
+on_text → _persist, hasta que el escritor en segundo plano lo deja en disco.
+envío: send_text → cifrado → publish (BrokerLocal, sin red) → _on_message
+de un segundo gateway suscrito al mismo canal.
+
+    python -m benchmarks.bench_recepcion [-n 20000] [--codec json bin]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from codec import CODECS
+from meshtastic_client import MeshtasticGateway
+
+from benchmarks.comun import BrokerLocal, cronometrar, resumen_latencias, tamano
+
+
+def _gateway(directorio: str, codec: str, nombre: str) -> MeshtasticGateway:
+    gw = MeshtasticGateway(persist_path=os.path.join(directorio, f"{nombre}.json"), persist_codec=codec,
+                           dedup_window=0, node_name="!00bec400" if nombre == "tx" else "!00bec401")
+    gw._set_topics()
+    return gw
+
+
+def generar_envelopes(gw: MeshtasticGateway, n: int) -> List[bytes]:
+    """n ServiceEnvelope de texto cifrados con la clave del canal de `gw`."""
+    return [gw._make_envelope(0xFFFFFFFF, gw._text_data(f"mensaje de prueba {i}")).SerializeToString()
+            for i in range(n)]
+
+
+def recepcion(n: int, codec: str) -> Dict:
+    with tempfile.TemporaryDirectory() as d:
+        gw = _gateway(d, codec, "rx")
+        textos = []
+        gw.on_text = lambda src, text: textos.append(text)
+        broker = BrokerLocal()
+        envelopes = generar_envelopes(gw, n)
+        topic = gw._publish_topic
+        # se pasa por el broker para construir MQTTMessage como paho
+        mensajes = []
+        broker.suscribir("#", lambda c, u, msg: mensajes.append((None, None, msg)))
+        for e in envelopes:
+            broker.entregar(topic, e)
+
+        t0 = time.perf_counter()
+        lat = cronometrar(gw._on_message, mensajes)
+        t_llamadas = time.perf_counter() - t0
+        escritor = gw._writer
+        gw.close_store()  # escribe ya lo pendiente, sin esperar al flush_interval
+        t_total = time.perf_counter() - t0
+        if len(textos) != n:
+            raise RuntimeError(f"recepción: {len(textos)} textos de {n} paquetes")
+        return {
+            "paquetes": n,
+            "paq_por_s": n / t_total,            # hasta tenerlo todo en disco
+            "llamadas_por_s": n / t_llamadas,    # sólo el hilo de red
+            "latencia": resumen_latencias(lat),
+            "bytes_disco": tamano(d),
+            "descartados": escritor.dropped if escritor is not None else 0,
+        }
+
+
+def envio(n: int, codec: str) -> Dict:
+    with tempfile.TemporaryDirectory() as d:
+        tx, rx = _gateway(d, codec, "tx"), _gateway(d, codec, "rx")
+        recibidos = []
+        rx.on_text = lambda src, text: recibidos.append(text)
+        broker = BrokerLocal()
+        broker.suscribir(rx._sub_topics[0], rx._on_message)
+        tx._client = broker.cliente(tx._tracker.on_publish)
+
+        textos = [(f"mensaje de prueba {i}",) for i in range(n)]
+        t0 = time.perf_counter()
+        lat = cronometrar(tx.send_text, textos)
+        tx.close_store()
+        rx.close_store()
+        t_total = time.perf_counter() - t0
+        if len(recibidos) != n:
+            raise RuntimeError(f"envío: {len(recibidos)} recibidos de {n} enviados")
+        return {
+            "paquetes": n,
+            "paq_por_s": n / t_total,
+            "latencia": resumen_latencias(lat),  # send_text de un extremo a otro (entrega síncrona)
+            "publicaciones": tx._tracker.stats()["completed"],
+        }
+
+
+def ejecutar(n: int = 20000, codecs: List[str] = ("json", "bin")) -> Dict:
+    out = {}
+    for codec in codecs:
+        out[f"recepcion_{codec}"] = recepcion(n, codec)
+        out[f"envio_{codec}"] = envio(n // 4, codec)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("-n", type=int, default=20000, help="paquetes sintéticos")
+    ap.add_argument("--codec", nargs="+", default=list(CODECS), choices=list(CODECS))
+    args = ap.parse_args()
+    print(json.dumps(ejecutar(args.n, args.codec), indent=1))
+
+
+if __name__ == "__main__":
+    main()
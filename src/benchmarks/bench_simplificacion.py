@@ -0,0 +1,64 @@
+"""
+Simplificación de tracks sintéticos (paseo aleatorio con paradas, 1 fix/s).
+
+Mide el filtro en streaming (distancia/tiempo) y RDP por lotes: fixes/s y
+proporción de puntos conservados.
+
+    python -m benchmarks.bench_simplificacion [-n 100000 1000000] [-t 5]
+"""
+from __future__ import annotations
+import argparse
+import math
+import random
+import time
+
+import simplificacion
+from simplificacion import filtrar_track, simplificar_track
+from track import Track
+
+
+def generar_track(n: int, semilla: int = 1) -> Track:
+    """Track con tramos rectos, giros suaves, ruido GPS y paradas largas."""
+    rnd = random.Random(semilla)
+    tr = Track()
+    lat, lon, rumbo = 42.68, -2.94, 0.0
+    parado = 0
+    for i in range(n):
+        if parado:
+            parado -= 1
+        elif rnd.random() < 0.001:
+            parado = rnd.randint(30, 600)
+        else:
+            rumbo += rnd.gauss(0, 0.05)
+            paso = 1.5e-5  # ~1.5 m/s
+            lat += paso * math.cos(rumbo)
+            lon += paso * math.sin(rumbo)
+        tr.append(1.7e9 + i, lat + rnd.gauss(0, 2e-6), lon + rnd.gauss(0, 2e-6), 500.0)
+    return tr
+
+
+def _medir(nombre: str, fn, tr: Track):
+    t0 = time.perf_counter()
+    out = fn(tr)
+    dt = time.perf_counter() - t0
+    print(f"  {nombre:<22} {len(tr) / dt:>12,.0f} fixes/s  "
+          f"conserva {len(out):>8} ({len(out) / len(tr):.1%})  {dt * 1e3:8.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("-n", type=int, nargs="+", default=[100_000, 1_000_000], help="fixes por track")
+    ap.add_argument("-t", "--tolerancia", type=float, default=5.0, help="metros (RDP y filtro)")
+    args = ap.parse_args()
+
+    print(f"NumPy: {'sí' if simplificacion.np is not None else 'no'}")
+    for n in args.n:
+        tr = generar_track(n)
+        print(f"track de {n} fixes:")
+        _medir("filtro streaming", lambda t: filtrar_track(t, args.tolerancia), tr)
+        _medir("RDP", lambda t: simplificar_track(t, args.tolerancia), tr)
+        _medir("filtro + RDP", lambda t: simplificar_track(filtrar_track(t, args.tolerancia), args.tolerancia), tr)
+
+
+if __name__ == "__main__":
+    main()
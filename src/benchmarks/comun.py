@@ -0,0 +1,109 @@
+"""
+Utilidades compartidas por los benchmarks de extremo a extremo: resumen de
+latencias, datos del entorno y un broker en proceso que sustituye a paho.
+"""
+from __future__ import annotations
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Sequence
+
+import paho.mqtt.client as mqtt
+
+
+def resumen_latencias(segundos: Sequence[float]) -> Dict[str, float]:
+    """Percentiles exactos (en µs) de una lista de duraciones en segundos."""
+    if not segundos:
+        return {"n": 0}
+    s = sorted(segundos)
+    n = len(s)
+    pct = lambda q: s[min(n - 1, int(q * n))] * 1e6
+    return {
+        "n": n,
+        "media_us": sum(s) / n * 1e6,
+        "p50_us": pct(0.50),
+        "p95_us": pct(0.95),
+        "p99_us": pct(0.99),
+        "max_us": s[-1] * 1e6,
+    }
+
+
+def cronometrar(fn: Callable, args_por_llamada: Sequence) -> List[float]:
+    """Llama a fn(*a) por cada `a` y devuelve la duración de cada llamada."""
+    reloj = time.perf_counter
+    out = []
+    for a in args_por_llamada:
+        t0 = reloj()
+        fn(*a)
+        out.append(reloj() - t0)
+    return out
+
+
+def tamano(path: str) -> int:
+    """Bytes de un fichero o de todo un directorio (0 si no existe)."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for raiz, _, ficheros in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(raiz, f)) for f in ficheros)
+    return total
+
+
+def entorno() -> Dict[str, str]:
+    """Lo necesario para saber si dos ejecuciones son comparables."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), timeout=5).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "python": sys.version.split()[0],
+        "implementacion": platform.python_implementation(),
+        "plataforma": platform.platform(),
+        "cpu": platform.processor() or platform.machine(),
+        "cpus": str(os.cpu_count()),
+        "commit": commit,
+    }
+
+
+class BrokerLocal:
+    """
+    Broker MQTT en proceso para medir sin red: `cliente()` devuelve un objeto
+    con el publish() de paho que entrega el mensaje, en el mismo hilo, al
+    on_message de cada suscriptor cuyo filtro encaja, y después confirma la
+    publicación (on_publish) como haría paho con QoS 0.
+    """
+
+    def __init__(self):
+        self._subs: List[tuple] = []  # (filtro, on_message)
+
+    def suscribir(self, filtro: str, on_message: Callable):
+        self._subs.append((filtro, on_message))
+
+    def cliente(self, on_publish: Callable = None) -> "_ClienteLocal":
+        return _ClienteLocal(self, on_publish)
+
+    def entregar(self, topic: str, payload: bytes):
+        msg = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+        msg.payload = payload
+        for filtro, on_message in self._subs:
+            if mqtt.topic_matches_sub(filtro, topic):
+                on_message(None, None, msg)
+
+
+class _ClienteLocal:
+    def __init__(self, broker: BrokerLocal, on_publish: Callable = None):
+        self.broker = broker
+        self.on_publish = on_publish
+        self._mid = 0
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> mqtt.MQTTMessageInfo:
+        self._mid += 1
+        info = mqtt.MQTTMessageInfo(self._mid)
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+        self.broker.entregar(topic, payload)
+        if self.on_publish is not None:
+            self.on_publish(self, None, self._mid, None, None)
+        return info
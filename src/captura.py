@@ -0,0 +1,288 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from codec import _leer_varint, _varint
+
+# Cabecera de los ficheros de captura (formato versión 1)
+MAGIA_CAPTURA = b"MSHC\x01"
+
+# Tipos de registro (un byte)
+_SESION = 0x00  # varint(epoch ms): empieza una sesión; se reinician la tabla de topics y el reloj
+_TRAMA = 0x01   # varint(Δµs) varint(ref topic) [varint(len) topic] varint(len) payload
+
+# Límites de cordura: fuera de ellos no puede empezar ahí un registro
+_MAX_TOPIC = 1 << 16
+_MAX_PAYLOAD = 1 << 20
+_EPOCH_MS_MIN = 1_577_836_800_000  # 2020-01-01
+_EPOCH_MS_MAX = 4_102_444_800_000  # 2100-01-01
+
+
+class Trama(NamedTuple):
+    t: float        # segundos (monotónicos) desde el principio de la captura
+    topic: str
+    payload: bytes
+
+
+class _MensajeMQTT:
+    """Lo que _on_message usa de paho.mqtt.client.MQTTMessage."""
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+
+
+class Capturador:
+    """
+    Graba el tráfico MQTT crudo (ServiceEnvelope tal cual llega) en un fichero
+    binario compacto: por trama, el tiempo monotónico desde la anterior en µs,
+    el topic (una vez por sesión; después, su número) y los bytes del payload.
+
+    Abrir de nuevo un fichero existente añade una sesión al final, tras
+    recortar una trama truncada por un corte (si no, su longitud se comería
+    la sesión nueva). `escribir()` sólo copia en el búfer del fichero, así
+    que se puede llamar desde el hilo de red; close() (o flush()) lo lleva a disco.
+    """
+
+    def __init__(self, path: str, bufsize: int = 1 << 16):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        _recortar_cola(path)
+        self._f: Optional[BinaryIO] = open(path, "ab", buffering=bufsize)
+        self._lock = threading.Lock()
+        self._topics: Dict[str, int] = {}
+        self.tramas = 0
+        self.bytes = 0
+        out = bytearray(MAGIA_CAPTURA if self._f.tell() == 0 else b"")
+        out.append(_SESION)
+        _varint(int(time.time() * 1000), out)
+        self._f.write(out)
+        self._ultimo: Optional[int] = None
+
+    def escribir(self, topic: str, payload: bytes, t_ns: Optional[int] = None):
+        """Añade una trama; `t_ns` (time.monotonic_ns) por defecto es ahora."""
+        out = bytearray((_TRAMA,))
+        with self._lock:
+            if self._f is None:
+                return
+            t = time.monotonic_ns() if t_ns is None else t_ns
+            # la primera trama de la sesión va en t=0: la reproducción empieza sin esperas
+            _varint(max(0, t - self._ultimo) // 1000 if self._ultimo is not None else 0, out)
+            self._ultimo = t
+            ref = self._topics.get(topic)
+            if ref is None:
+                # referencia nueva = tamaño actual de la tabla, seguida del texto
+                ref = self._topics[topic] = len(self._topics)
+                _varint(ref, out)
+                b = topic.encode("utf-8")
+                _varint(len(b), out)
+                out += b
+            else:
+                _varint(ref, out)
+            _varint(len(payload), out)
+            out += payload
+            self._f.write(out)
+            self.tramas += 1
+            self.bytes += len(out)
+
+    def flush(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.flush()
+
+    def close(self):
+        with self._lock:
+            f, self._f = self._f, None
+        if f is not None:
+            f.close()
+
+    def stats(self) -> Dict:
+        return {"path": self.path, "tramas": self.tramas, "bytes": self.bytes}
+
+
+# --------------- lectura ---------------
+def _registro(buf: bytes, i: int, n_topics: int):
+    """
+    Registro que empieza en `i`: (None, fin) para una sesión y
+    ((Δµs, ref, topic nuevo o None, payload), fin) para una trama.
+    IndexError si aún está incompleto; ValueError si ahí no puede empezar uno.
+    """
+    tipo = buf[i]
+    i += 1
+    if tipo == _SESION:
+        ms, i = _leer_varint(buf, i)
+        if not _EPOCH_MS_MIN <= ms < _EPOCH_MS_MAX:
+            raise ValueError(f"Inicio de sesión inválido: {ms}")
+        return None, i
+    if tipo != _TRAMA:
+        raise ValueError(f"Registro desconocido 0x{tipo:02x}")
+    d, i = _leer_varint(buf, i)
+    ref, i = _leer_varint(buf, i)
+    nuevo = None
+    if ref == n_topics:
+        m, i = _leer_varint(buf, i)
+        if m > _MAX_TOPIC:
+            raise ValueError(f"Topic demasiado largo: {m}")
+        if i + m > len(buf):
+            raise IndexError
+        nuevo = buf[i:i + m].decode("utf-8")
+        i += m
+    elif ref > n_topics:
+        raise ValueError(f"Referencia a un topic desconocido: {ref}")
+    m, i = _leer_varint(buf, i)
+    if m > _MAX_PAYLOAD:
+        raise ValueError(f"Payload demasiado largo: {m}")
+    if i + m > len(buf):
+        raise IndexError
+    return (d, ref, nuevo, buf[i:i + m]), i + m
+
+
+def _sesion_siguiente(buf: bytes, i: int) -> int:
+    """Siguiente posición desde `i` donde puede empezar una sesión (o len(buf))."""
+    while True:
+        i = buf.find(bytes((_SESION,)), i)
+        if i < 0:
+            return len(buf)
+        try:
+            _registro(buf, i, 0)
+        except ValueError:
+            i += 1
+            continue
+        except IndexError:
+            pass  # quizá lo sea: se decide con más datos
+        return i
+
+
+def _recorrer(f: BinaryIO, bloque: int = 1 << 16) -> Iterator[Tuple[int, Optional[Trama]]]:
+    """
+    (desplazamiento del fin del registro, trama o None si es una sesión) de
+    cada registro válido, leyendo por bloques. Un registro dañado hace saltar
+    a la siguiente sesión (la tabla de topics se reinicia con ella); lo que
+    quede a medias al final es una trama truncada y se ignora.
+    """
+    cabeza = f.read(len(MAGIA_CAPTURA))
+    if cabeza != MAGIA_CAPTURA:
+        raise ValueError(f"{getattr(f, 'name', 'el flujo')} no es una captura "
+                         f"(falta la cabecera {MAGIA_CAPTURA!r})")
+    base = len(MAGIA_CAPTURA)  # desplazamiento de buf[0] en el fichero
+    buf = b""
+    topics: List[str] = []
+    sincronizado = True
+    t_us = 0
+    while True:
+        trozo = f.read(bloque)
+        if not trozo:
+            return
+        buf += trozo
+        i, n = 0, len(buf)
+        while i < n:
+            if not sincronizado:
+                i = _sesion_siguiente(buf, i)
+                if i >= n:
+                    break
+                sincronizado = True
+            try:
+                reg, fin = _registro(buf, i, len(topics))
+            except IndexError:
+                break
+            except ValueError:
+                sincronizado = False
+                i += 1
+                continue
+            if reg is None:
+                topics = []
+                yield base + fin, None
+            else:
+                d, ref, nuevo, payload = reg
+                if nuevo is not None:
+                    topics.append(nuevo)
+                t_us += d
+                yield base + fin, Trama(t_us / 1e6, topics[ref], payload)
+            i = fin
+        base += i
+        buf = buf[i:]
+
+
+def leer_captura(path: str, bloque: int = 1 << 16) -> Iterator[Trama]:
+    """
+    Recorre las tramas de una captura en streaming. Entre sesiones no se
+    conserva el hueco real: la primera trama de cada sesión llega justo tras
+    la última de la anterior. Una trama truncada al final (corte durante la
+    grabación) se ignora, y una dañada hace saltar a la sesión siguiente.
+    """
+    with open(path, "rb") as f:
+        for _, tr in _recorrer(f, bloque):
+            if tr is not None:
+                yield tr
+
+
+def _recortar_cola(path: str):
+    """Deja una captura existente acabada en el último registro completo."""
+    try:
+        tam = os.path.getsize(path)
+    except OSError:
+        return
+    if tam == 0:
+        return
+    with open(path, "r+b") as f:
+        if tam < len(MAGIA_CAPTURA) and MAGIA_CAPTURA.startswith(f.read()):
+            f.truncate(0)  # corte mientras se escribía la cabecera
+            return
+        f.seek(0)
+        fin = len(MAGIA_CAPTURA)
+        for fin, _ in _recorrer(f):
+            pass
+        if fin < tam:
+            f.truncate(fin)
+
+
+# --------------- reproducción ---------------
+def reproducir(path: str, destino: Union[Callable, object], velocidad: Optional[float] = 1.0,
+               limite: Optional[int] = None) -> Dict:
+    """
+    Reinyecta una captura en `destino`: un MeshtasticGateway (se llama a su
+    _on_message como haría paho, sin broker) o cualquier función (topic, payload).
+
+    `velocidad` 1 respeta los tiempos grabados, N los divide entre N y
+    0/None va tan rápido como se pueda. Devuelve tramas, duración y tasa.
+    """
+    if velocidad is not None and velocidad < 0:
+        raise ValueError(f"La velocidad debe ser >= 0: {velocidad}")
+    on_message = getattr(destino, "_on_message", None)
+    if on_message is not None:
+        entregar = lambda topic, payload: on_message(None, None, _MensajeMQTT(topic, payload))
+    else:
+        entregar = destino
+    n = 0
+    nbytes = 0
+    ultimo = 0.0
+    retraso_max = 0.0
+    t0 = time.perf_counter()
+    # en streaming: la lectura (por bloques, con el búfer del SO) entra en la medida
+    for t, topic, payload in leer_captura(path):
+        if limite is not None and n >= limite:
+            break
+        if velocidad:
+            espera = t / velocidad - (time.perf_counter() - t0)
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                retraso_max = max(retraso_max, -espera)
+        entregar(topic, payload)
+        n += 1
+        nbytes += len(payload)
+        ultimo = t
+    dt = time.perf_counter() - t0
+    return {
+        "tramas": n,
+        "bytes": nbytes,
+        "segundos": dt,
+        "tramas_s": n / dt if dt > 0 else 0.0,
+        "duracion_captura_s": ultimo,
+        "retraso_max_s": retraso_max,  # cuánto se ha ido por detrás del ritmo pedido
+    }
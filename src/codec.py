@@ -0,0 +1,428 @@
+from __future__ import annotations
+import calendar
+import json
+import struct
+import time
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+# Cabecera de los ficheros binarios (formato versión 1)
+MAGIA = b"MSHB\x01"
+
+# Tamaño máximo de un registro binario: un prefijo mayor es basura
+MAX_REGISTRO = 1 << 20
+_MAX_PREFIJO = 3  # bytes del varint de MAX_REGISTRO
+
+# Claves frecuentes de los registros: en binario ocupan un byte
+CLAVES = (
+    "ts", "proto", "dir", "type", "channel", "tag", "gateway_id", "topic", "from", "id",
+    "portnum", "text", "lat", "lon", "alt", "json", "destination", "meshtastic_from",
+    "fecha", "mensaje", "origen", "destino", "t", "nombre", "protocolo", "conectado",
+    "contenido", "msg", "long",
+)
+_CLAVE_NUM = {k: i for i, k in enumerate(CLAVES)}
+_CLAVE_LIBRE = 0xFF
+
+# Etiquetas de tipo (un byte); 0x80-0xFF son enteros 0..127 en el propio byte
+_NULO, _FALSO, _CIERTO = 0x00, 0x01, 0x02
+_ENTERO, _REAL, _TEXTO, _BYTES, _LISTA, _DICT = 0x03, 0x04, 0x05, 0x06, 0x07, 0x08
+_TS_Z, _TS_LOCAL = 0x09, 0x0A  # ts de texto guardado como epoch (se reconstruye idéntico)
+_FIXINT = 0x80
+
+_F64 = struct.Struct("<d")
+_FMT_Z = "%Y-%m-%dT%H:%M:%SZ"
+_FMT_LOCAL = "%Y-%m-%d %H:%M:%S"  # _now_iso() antiguo de MeshtasticGateway (hora local)
+
+
+# --------------- varints ---------------
+def _varint(n: int, out: bytearray):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _leer_varint(b: bytes, i: int):
+    n = desp = 0
+    while True:
+        c = b[i]
+        i += 1
+        n |= (c & 0x7F) << desp
+        if c < 0x80:
+            return n, i
+        desp += 7
+
+
+def _ts_epoch(s: str) -> Optional[int]:
+    """'2025-10-22T15:44:24Z' o '2025-10-22 15:44:24' → epoch, sólo si se puede rehacer igual."""
+    if len(s) == 20 and s[10] == "T" and s[19] == "Z":
+        fmt, etiqueta = _FMT_Z, _TS_Z
+    elif len(s) == 19 and s[10] == " ":
+        fmt, etiqueta = _FMT_LOCAL, _TS_LOCAL
+    else:
+        return None
+    try:
+        t = calendar.timegm((int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                             int(s[11:13]), int(s[14:16]), int(s[17:19]), 0, 0, 0))
+    except ValueError:
+        return None
+    if t < 0 or time.strftime(fmt, time.gmtime(t)) != s:
+        return None
+    return t << 1 | (etiqueta == _TS_LOCAL)
+
+
+# --------------- valores ---------------
+def _codificar(v, out: bytearray):
+    if v is None:
+        out.append(_NULO)
+    elif v is True:
+        out.append(_CIERTO)
+    elif v is False:
+        out.append(_FALSO)
+    elif type(v) is int:
+        if 0 <= v < 0x80:
+            out.append(_FIXINT | v)
+        else:
+            out.append(_ENTERO)
+            _varint(v << 1 if v >= 0 else (-v << 1) - 1, out)  # zigzag
+    elif type(v) is float:
+        out.append(_REAL)
+        out += _F64.pack(v)
+    elif isinstance(v, str):
+        b = v.encode("utf-8")
+        out.append(_TEXTO)
+        _varint(len(b), out)
+        out += b
+    elif isinstance(v, dict):
+        out.append(_DICT)
+        _varint(len(v), out)
+        for k, x in v.items():
+            _codificar_clave(k, out)
+            if k == "ts" and isinstance(x, str):
+                t = _ts_epoch(x)
+                if t is not None:
+                    out.append(_TS_LOCAL if t & 1 else _TS_Z)
+                    _varint(t >> 1, out)
+                    continue
+            _codificar(x, out)
+    elif isinstance(v, (list, tuple)):
+        out.append(_LISTA)
+        _varint(len(v), out)
+        for x in v:
+            _codificar(x, out)
+    elif isinstance(v, (bytes, bytearray, memoryview)):
+        out.append(_BYTES)
+        _varint(len(v), out)
+        out += v
+    elif isinstance(v, int):
+        _codificar(int(v), out)  # bool ya tratado; IntEnum de protobuf, etc.
+    elif isinstance(v, float):
+        _codificar(float(v), out)
+    else:
+        raise TypeError(f"Tipo no serializable: {type(v).__name__}")
+
+
+def _codificar_clave(k: str, out: bytearray):
+    i = _CLAVE_NUM.get(k)
+    if i is not None:
+        out.append(i)
+        return
+    b = str(k).encode("utf-8")
+    out.append(_CLAVE_LIBRE)
+    _varint(len(b), out)
+    out += b
+
+
+def _decodificar(b: bytes, i: int):
+    t = b[i]
+    i += 1
+    if t >= _FIXINT:
+        return t & 0x7F, i
+    if t == _TEXTO:
+        n, i = _leer_varint(b, i)
+        return b[i:i + n].decode("utf-8"), i + n
+    if t == _DICT:
+        n, i = _leer_varint(b, i)
+        d = {}
+        for _ in range(n):
+            k = b[i]
+            i += 1
+            if k == _CLAVE_LIBRE:
+                m, i = _leer_varint(b, i)
+                clave = b[i:i + m].decode("utf-8")
+                i += m
+            else:
+                clave = CLAVES[k]
+            d[clave], i = _decodificar(b, i)
+        return d, i
+    if t == _ENTERO:
+        z, i = _leer_varint(b, i)
+        return (z >> 1) ^ -(z & 1), i
+    if t == _REAL:
+        return _F64.unpack_from(b, i)[0], i + 8
+    if t == _NULO:
+        return None, i
+    if t == _CIERTO:
+        return True, i
+    if t == _FALSO:
+        return False, i
+    if t == _TS_Z or t == _TS_LOCAL:
+        e, i = _leer_varint(b, i)
+        return time.strftime(_FMT_Z if t == _TS_Z else _FMT_LOCAL, time.gmtime(e)), i
+    if t == _LISTA:
+        n, i = _leer_varint(b, i)
+        out = []
+        for _ in range(n):
+            x, i = _decodificar(b, i)
+            out.append(x)
+        return out, i
+    if t == _BYTES:
+        n, i = _leer_varint(b, i)
+        return bytes(b[i:i + n]), i + n
+    raise ValueError(f"Etiqueta desconocida 0x{t:02x} en la posición {i - 1}")
+
+
+# --------------- codecs ---------------
+class Codec(ABC):
+    """
+    Serialización de registros (dicts) a bytes, uno tras otro en un flujo.
+
+    `codificar(r)` devuelve el registro ya enmarcado (listo para append) y
+    `leer(f)` recorre un fichero binario abierto en modo 'rb' sin cargarlo
+    entero. `cabecera` se escribe una vez al principio de un fichero nuevo.
+    """
+    nombre = ""
+    extension = ""
+    cabecera = b""
+
+    @abstractmethod
+    def codificar(self, r: Dict) -> bytes:
+        ...
+
+    def codificar_lote(self, registros: Iterable[Dict]) -> bytes:
+        return b"".join(self.codificar(r) for r in registros)
+
+    @abstractmethod
+    def decodificador(self) -> "Decodificador":
+        ...
+
+    def escribir(self, f: BinaryIO, registros: Iterable[Dict]) -> int:
+        """Añade los registros a `f` (con la cabecera si está al principio) en un único write()."""
+        datos = self.codificar_lote(registros)
+        if self.cabecera and f.tell() == 0:
+            datos = self.cabecera + datos
+        f.write(datos)
+        return len(datos)
+
+    def leer(self, f: BinaryIO, bloque: int = 1 << 16) -> Iterator[Dict]:
+        dec = self.decodificador()
+        while True:
+            trozo = f.read(bloque)
+            if not trozo:
+                yield from dec.terminar()
+                return
+            yield from dec.alimentar(trozo)
+
+    def decodificar(self, datos: bytes) -> List[Dict]:
+        dec = self.decodificador()
+        return dec.alimentar(datos) + dec.terminar()
+
+
+class Decodificador(ABC):
+    """
+    Decodificación incremental: se alimenta con trozos arbitrarios y devuelve
+    los registros completos. Lo dañado (un registro truncado por un corte,
+    aunque después se haya seguido añadiendo) se salta y se cuenta en
+    `corruptos`; nunca se lanza una excepción por ello.
+    """
+    corruptos = 0
+
+    @abstractmethod
+    def alimentar(self, datos: bytes) -> List[Dict]:
+        ...
+
+    def terminar(self) -> List[Dict]:
+        """Fin del flujo: lo que quede a medias es un registro truncado."""
+        return []
+
+
+class CodecJSON(Codec):
+    """JSON Lines, exactamente lo que escribían JsonlSink y SegmentStore."""
+    nombre = "json"
+    extension = ".jsonl"
+
+    def codificar(self, r: Dict) -> bytes:
+        return (json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def codificar_lote(self, registros: Iterable[Dict]) -> bytes:
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros).encode("utf-8")
+
+    def decodificador(self) -> "_DecodificadorJSON":
+        return _DecodificadorJSON()
+
+
+class _DecodificadorJSON(Decodificador):
+    def __init__(self):
+        self._resto = b""
+
+    def alimentar(self, datos: bytes) -> List[Dict]:
+        lineas = (self._resto + datos).split(b"\n")
+        self._resto = lineas.pop()
+        out = []
+        for l in lineas:
+            l = l.strip()
+            if l:
+                try:
+                    out.append(json.loads(l))
+                except ValueError:
+                    self.corruptos += 1  # línea truncada por un corte
+        return out
+
+    def terminar(self) -> List[Dict]:
+        if self._resto.strip():
+            self.corruptos += 1
+        self._resto = b""
+        return []
+
+
+class CodecBinario(Codec):
+    """
+    Registros binarios con prefijo de longitud: varint(len) + valor etiquetado
+    al estilo msgpack. Las claves frecuentes (CLAVES) ocupan un byte, los
+    enteros pequeños también, los reales van en 8 bytes y el "ts" de texto se
+    guarda como epoch. Cada registro se decodifica por separado, así que un
+    fichero se puede seguir ampliando con append.
+
+    Un registro sólo es válido si es un dict que ocupa exactamente su
+    longitud; si no, el lector busca el siguiente que lo sea (un corte a
+    mitad de registro seguido de más appends no pierde el resto).
+    """
+    nombre = "bin"
+    extension = ".bin"
+    cabecera = MAGIA
+
+    def codificar(self, r: Dict) -> bytes:
+        cuerpo = bytearray()
+        _codificar(r, cuerpo)
+        out = bytearray()
+        _varint(len(cuerpo), out)
+        out += cuerpo
+        return bytes(out)
+
+    def codificar_lote(self, registros: Iterable[Dict]) -> bytes:
+        out = bytearray()
+        cuerpo = bytearray()
+        for r in registros:
+            del cuerpo[:]
+            _codificar(r, cuerpo)
+            _varint(len(cuerpo), out)
+            out += cuerpo
+        return bytes(out)
+
+    def decodificador(self) -> "_DecodificadorBinario":
+        return _DecodificadorBinario()
+
+
+def _trama(buf: bytes, i: int, n_buf: int):
+    """
+    (registro, fin) de la trama que empieza en `i`; (None, i) si aún está
+    incompleta. ValueError si ahí no puede empezar un registro.
+    """
+    try:
+        n, j = _leer_varint(buf, i)
+    except IndexError:
+        if n_buf - i > _MAX_PREFIJO:
+            raise ValueError("Prefijo de longitud inválido") from None
+        return None, i
+    if j - i > _MAX_PREFIJO or not 0 < n <= MAX_REGISTRO:
+        raise ValueError(f"Longitud de registro inválida: {n}")
+    if j < n_buf and buf[j] != _DICT:
+        raise ValueError("El registro no es un dict")
+    if j + n > n_buf:
+        return None, i
+    try:
+        r, fin = _decodificar(buf, j)
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise ValueError(f"Registro corrupto: {e}") from None
+    if fin != j + n:
+        raise ValueError("El registro no ocupa su longitud")
+    return r, fin
+
+
+def _resincronizar(buf: bytes, i: int, n_buf: int) -> int:
+    """Primera posición desde `i` donde puede empezar un registro (o n_buf)."""
+    for k in range(i, n_buf):
+        try:
+            _trama(buf, k, n_buf)
+        except ValueError:
+            continue
+        return k
+    return n_buf
+
+
+class _DecodificadorBinario(Decodificador):
+    def __init__(self):
+        self._buf = b""
+        self._cabecera = True  # la cabecera, si la hay, va al principio del flujo
+        self.corruptos = 0
+
+    def alimentar(self, datos: bytes) -> List[Dict]:
+        buf = self._buf + datos if self._buf else datos
+        i = 0
+        if self._cabecera:
+            if len(buf) < len(MAGIA) and MAGIA.startswith(buf):
+                self._buf = buf
+                return []
+            if buf.startswith(MAGIA):
+                i = len(MAGIA)
+            self._cabecera = False
+        out: List[Dict] = []
+        i = self._decodificar_desde(buf, i, out)
+        self._buf = buf[i:]
+        return out
+
+    def terminar(self) -> List[Dict]:
+        buf, self._buf = self._buf, b""
+        out: List[Dict] = []
+        if self._cabecera:
+            return out
+        i, n_buf = 0, len(buf)
+        if buf:
+            self.corruptos += 1
+        while i < n_buf:
+            # la trama en i ya no se completará: truncada por un corte
+            i = self._decodificar_desde(buf, _resincronizar(buf, i + 1, n_buf), out)
+        return out
+
+    def _decodificar_desde(self, buf: bytes, i: int, out: List[Dict]) -> int:
+        """Añade a `out` las tramas completas desde `i` y devuelve dónde empieza la pendiente."""
+        n_buf = len(buf)
+        while i < n_buf:
+            try:
+                r, fin = _trama(buf, i, n_buf)
+            except ValueError:
+                self.corruptos += 1
+                i = _resincronizar(buf, i + 1, n_buf)
+                continue
+            if r is None:
+                break
+            out.append(r)
+            i = fin
+        return i
+
+
+CODEC_JSON = "json"
+CODEC_BINARIO = "bin"
+CODECS: Dict[str, Codec] = {CODEC_JSON: CodecJSON(), CODEC_BINARIO: CodecBinario()}
+
+
+def codec_de(nombre: str) -> Codec:
+    try:
+        return CODECS[nombre]
+    except KeyError:
+        raise ValueError(f"Codec desconocido: {nombre!r} (hay {', '.join(CODECS)})") from None
+
+
+def es_binario(cabeza: bytes) -> bool:
+    """¿Empieza como un fichero de CodecBinario?"""
+    return cabeza.startswith(MAGIA)
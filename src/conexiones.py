@@ -0,0 +1,100 @@
+from __future__ import annotations
+import atexit
+import threading
+from typing import Any, Dict, Tuple
+
+from exceptions import ConfigError
+from meshtastic_client import MeshtasticGateway
+
+# Campos de la sección "meshtastic" de config.json que identifican una sesión
+_CAMPOS_SESION = ("broker", "port", "username", "password", "root_topic", "channel", "key")
+
+
+class GatewayPool:
+    """
+    Gateways de larga duración compartidos por configuración.
+
+    Una misma sesión MQTT sirve para enviar y recibir: en vez de crear,
+    conectar y desconectar un MeshtasticGateway por mensaje, se reutiliza
+    el que ya existe y sólo se reconecta si se ha caído.
+    """
+
+    def __init__(self):
+        self._gateways: Dict[Tuple, MeshtasticGateway] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _clave(t: Dict[str, Any]) -> Tuple:
+        return tuple(t.get(k) for k in _CAMPOS_SESION)
+
+    def get(self, t: Dict[str, Any], **kwargs) -> MeshtasticGateway:
+        """Gateway (quizá aún sin conectar) para la sección meshtastic `t`."""
+        with self._lock:
+            return self._obtener(t, kwargs)
+
+    def connected(self, t: Dict[str, Any], **kwargs) -> MeshtasticGateway:
+        """Gateway conectado; conecta o reconecta sólo si hace falta."""
+        # bajo el lock: dos hilos con la misma sesión no conectan a la vez
+        with self._lock:
+            gw = self._obtener(t, kwargs)
+            gw.ensure_connected()
+            return gw
+
+    def _obtener(self, t: Dict[str, Any], kwargs: Dict[str, Any]) -> MeshtasticGateway:
+        clave = self._clave(t)
+        gw = self._gateways.get(clave)
+        if gw is None:
+            gw = MeshtasticGateway(
+                broker=t["broker"],
+                port=t["port"],
+                username=t["username"],
+                password=t["password"],
+                root_topic=t["root_topic"],
+                channel=t["channel"],
+                key_b64=t["key"],
+                **kwargs
+            )
+            self._gateways[clave] = gw
+        else:
+            self._fusionar(gw, kwargs)
+        return gw
+
+    @staticmethod
+    def _fusionar(gw: MeshtasticGateway, kwargs: Dict[str, Any]):
+        """
+        Aplica a un gateway ya creado las opciones de una nueva petición: los
+        callbacks (on_*) que aún no tiene se enganchan; cualquier otra opción
+        que no coincida con la del gateway existente es un error.
+        """
+        for k, v in kwargs.items():
+            actual = getattr(gw, k)
+            if actual == v:
+                continue
+            if k.startswith("on_") and actual is None:
+                setattr(gw, k, v)
+                continue
+            raise ConfigError(
+                f"El gateway de {gw.root_topic}{gw.channel} ya existe con {k}={actual!r}; "
+                f"no se puede reutilizar con {k}={v!r}")
+
+    def close_all(self):
+        with self._lock:
+            gateways, self._gateways = list(self._gateways.values()), {}
+        for gw in gateways:
+            try:
+                gw.disconnect()
+            except Exception:
+                pass
+
+
+_POOL = GatewayPool()
+atexit.register(_POOL.close_all)
+
+
+def obtener_gateway(t: Dict[str, Any], **kwargs) -> MeshtasticGateway:
+    """Gateway compartido y conectado para la configuración meshtastic `t`."""
+    return _POOL.connected(t, **kwargs)
+
+
+def cerrar_gateways():
+    _POOL.close_all()
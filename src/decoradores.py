@@ -1,12 +1,199 @@
+from __future__ import annotations
+import itertools
+import json
+import os
+import sys
+import threading
+import time
 from functools import wraps
-from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from metricas import Metricas
+
+CUANTILES_PERFIL = (0.5, 0.95, 0.99)
+
+
+class Perfil:
+    """
+    Agregados de una función instrumentada: llamadas, muestras, errores y
+    tiempos de pared y de CPU (del hilo) en histogramas de metricas.py.
+    """
+
+    def __init__(self, nombre: str, registro: "RegistroPerfiles", tasa: Optional[float] = None):
+        self.nombre = nombre
+        self.registro = registro
+        self.activo = registro.activo
+        self._turno = itertools.count()  # next() es atómico: decide el muestreo sin locks
+        m = registro.metricas
+        self._llamadas = m.contador("perfil_calls_total", funcion=nombre)
+        self._errores = m.contador("perfil_errors_total", funcion=nombre)
+        self.pared = m.histograma("perfil_wall_seconds", funcion=nombre)
+        self.cpu = m.histograma("perfil_cpu_seconds", funcion=nombre)
+        self.cada = 1
+        self.tasa = registro.tasa if tasa is None else tasa
+
+    @property
+    def tasa(self) -> float:
+        return 1.0 / self.cada
+
+    @tasa.setter
+    def tasa(self, tasa: float):
+        """Fracción de llamadas medidas: 1 = todas, 0.01 = una de cada 100."""
+        if not 0 < tasa <= 1:
+            raise ValueError(f"La tasa de muestreo debe estar en (0, 1]: {tasa}")
+        self.cada = max(1, round(1 / tasa))
+
+    @property
+    def llamadas(self) -> int:
+        """Llamadas vistas con el perfil activo (medidas o no)."""
+        return self._llamadas.valor
+
+    @property
+    def errores(self) -> int:
+        return self._errores.valor
+
+    def resumen(self) -> Dict:
+        pared = self.pared.resumen(CUANTILES_PERFIL)
+        cpu = self.cpu.resumen(CUANTILES_PERFIL)
+        muestras = pared["n"]
+        # el total se extrapola a todas las llamadas según el muestreo
+        escala = self.llamadas / muestras if muestras else 0.0
+        return {
+            "funcion": self.nombre,
+            "llamadas": self.llamadas,
+            "muestras": muestras,
+            "errores": self.errores,
+            "tasa": self.tasa,
+            "total_s": pared["sum"] * escala,
+            "cpu_total_s": cpu["sum"] * escala,
+            "media_s": pared["avg"],
+            "cpu_media_s": cpu["avg"],
+            "max_s": pared["max"],
+            **{k: v for k, v in pared.items() if k.startswith("p")},
+        }
+
+    def reset(self):
+        for inst in (self._llamadas, self._errores, self.pared, self.cpu):
+            inst.reset()
+
+
+class RegistroPerfiles:
+    """
+    Registro global de funciones instrumentadas con @registrar_evento.
+
+    Se activa y desactiva en caliente (todas o por nombre) y da un informe
+    ordenado por tiempo total. Desactivado, cada llamada sólo paga una
+    comprobación de atributo. Con `traza` se imprime además cada llamada medida.
+    """
+
+    def __init__(self, activo: bool = False, tasa: float = 1.0):
+        self.activo = activo
+        self.tasa = tasa
+        self.traza = False
+        self.metricas = Metricas()  # sus histogramas se pueden exportar con ServidorMetricas
+        self._perfiles: Dict[str, Perfil] = {}
+        self._lock = threading.Lock()
+
+    def perfil(self, nombre: str, tasa: Optional[float] = None) -> Perfil:
+        with self._lock:
+            p = self._perfiles.get(nombre)
+            if p is None:
+                p = self._perfiles[nombre] = Perfil(nombre, self, tasa)
+            return p
+
+    def perfiles(self) -> List[Perfil]:
+        return list(self._perfiles.values())
+
+    def _elegidos(self, nombres) -> List[Perfil]:
+        if not nombres:
+            return self.perfiles()
+        return [self._perfiles[n] for n in nombres if n in self._perfiles]
+
+    # -------- control en caliente --------
+    def activar(self, *nombres: str, tasa: Optional[float] = None):
+        """Sin nombres activa todo (también lo que se decore después)."""
+        if not nombres:
+            self.activo = True
+            if tasa is not None:
+                self.tasa = tasa
+        for p in self._elegidos(nombres):
+            if tasa is not None:
+                p.tasa = tasa
+            p.activo = True
+
+    def desactivar(self, *nombres: str):
+        if not nombres:
+            self.activo = False
+        for p in self._elegidos(nombres):
+            p.activo = False
+
+    def reset(self):
+        for p in self.perfiles():
+            p.reset()
+
+    # -------- informe --------
+    def snapshot(self) -> List[Dict]:
+        filas = [p.resumen() for p in self.perfiles() if p.llamadas]
+        return sorted(filas, key=lambda r: r["total_s"], reverse=True)
+
+    def informe(self) -> str:
+        cab = (f"{'función':40} {'llamadas':>9} {'muestras':>9} {'total ms':>10} {'media µs':>9} "
+               f"{'p50 µs':>8} {'p95 µs':>8} {'p99 µs':>8} {'cpu %':>6}")
+        lineas = [cab, "-" * len(cab)]
+        for r in self.snapshot():
+            cpu = 100 * r["cpu_media_s"] / r["media_s"] if r["media_s"] else 0.0
+            lineas.append(
+                f"{r['funcion'][:40]:40} {r['llamadas']:9d} {r['muestras']:9d} {r['total_s'] * 1e3:10.1f} "
+                f"{r['media_s'] * 1e6:9.1f} {r['p50'] * 1e6:8.1f} {r['p95'] * 1e6:8.1f} {r['p99'] * 1e6:8.1f} "
+                f"{cpu:6.0f}")
+        return "\n".join(lineas)
+
+    def volcar(self, destino: Optional[str] = None):
+        """Informe por stdout, o JSON en `destino` (temporal + rename)."""
+        if destino is None:
+            print(self.informe())
+            return
+        tmp = destino + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ts": time.time(), "perfiles": self.snapshot()}, f, indent=1)
+        os.replace(tmp, destino)
+
+
+# Activable sin tocar código: MESH_PERFILES=1 (y MESH_PERFILES_TASA=0.1, por ejemplo)
+PERFILES = RegistroPerfiles(activo=os.environ.get("MESH_PERFILES") == "1",
+                            tasa=float(os.environ.get("MESH_PERFILES_TASA", "1")))
+
+
+def registrar_evento(nombre: Optional[str] = None, tasa: Optional[float] = None,
+                     registro: RegistroPerfiles = PERFILES):
+    """
+    Decorador de perfilado: mide tiempo de pared y de CPU de cada llamada
+    (o de una de cada 1/tasa) en el perfil `nombre` del registro global.
+    """
+    def deco(func: Callable):
+        perfil = registro.perfil(nombre or func.__qualname__, tasa)
 
-def registrar_evento(nombre: str):
-    def deco(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            ts = datetime.utcnow().isoformat(timespec="seconds")
-            print(f"[EVENTO {nombre}] {ts} → {func.__name__}")
-            return func(*args, **kwargs)
+            if not perfil.activo:
+                return func(*args, **kwargs)
+            perfil._llamadas.inc()
+            if perfil.cada > 1 and next(perfil._turno) % perfil.cada:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            c0 = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                perfil._errores.inc()
+                raise
+            finally:
+                pared = time.perf_counter() - t0
+                perfil.cpu.observe(time.thread_time() - c0)
+                perfil.pared.observe(pared)
+                if registro.traza:
+                    print(f"[PERFIL {perfil.nombre}] {pared * 1e6:.1f} µs", file=sys.stderr)
+
+        wrapper.perfil = perfil
         return wrapper
     return deco
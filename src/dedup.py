@@ -0,0 +1,78 @@
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+Clave = Tuple[int, int]  # (from, id) del MeshPacket
+
+
+class DedupCache:
+    """
+    Conjunto acotado de paquetes vistos, con caducidad.
+
+    La clave es (from, id): el mismo MeshPacket reenviado por varios
+    gateways comparte ambos valores. Las entradas caducan a los `window`
+    segundos y nunca hay más de `max_entries`; como se insertan en orden
+    temporal, basta con expulsar por el principio.
+    """
+
+    def __init__(self, window: float = 600.0, max_entries: int = 10000,
+                 track_relays: bool = False):
+        self.window = window
+        self.max_entries = max_entries
+        self.track_relays = track_relays
+
+        self.hits = 0       # duplicados descartados
+        self.misses = 0     # paquetes nuevos
+        self.evictions = 0
+
+        # clave → (caducidad, gateways que lo han retransmitido)
+        self._seen: "OrderedDict[Clave, Tuple[float, Optional[Set[str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, sender: int, packet_id: int, gateway_id: str = "") -> bool:
+        """Registra el paquete y devuelve True si ya se había visto (duplicado)."""
+        ahora = time.monotonic()
+        clave = (sender, packet_id)
+        with self._lock:
+            self._expire(ahora)
+            entrada = self._seen.get(clave)
+            if entrada is not None:
+                self.hits += 1
+                if entrada[1] is not None and gateway_id:
+                    entrada[1].add(gateway_id)
+                return True
+            relays = ({gateway_id} if gateway_id else set()) if self.track_relays else None
+            self._seen[clave] = (ahora + self.window, relays)
+            self.misses += 1
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+                self.evictions += 1
+            return False
+
+    def relays(self, sender: int, packet_id: int) -> Set[str]:
+        """Gateways que han entregado este paquete (requiere track_relays)."""
+        with self._lock:
+            entrada = self._seen.get((sender, packet_id))
+            return set(entrada[1]) if entrada is not None and entrada[1] is not None else set()
+
+    def clear(self):
+        with self._lock:
+            self._seen.clear()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._seen), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+    def _expire(self, ahora: float):
+        seen = self._seen
+        while seen:
+            clave, (caduca, _) = next(iter(seen.items()))
+            if caduca > ahora:
+                break
+            del seen[clave]
+            self.evictions += 1
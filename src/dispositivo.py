@@ -1,17 +1,94 @@
 from __future__ import annotations
 import json
+import os
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+from codec import CODEC_JSON, CODECS, codec_de
+from simplificacion import FiltroStreaming, simplificar_track
+from track import Track
+
+
+def _journal_path(path: Path, codec: str = CODEC_JSON) -> Path:
+    """../data/dispositivo.json → ../data/dispositivo.journal.jsonl (o .journal.bin)"""
+    return path.with_name(path.stem + ".journal" + codec_de(codec).extension)
+
+
+def _track_path(path: Path) -> Path:
+    """../data/dispositivo.json → ../data/dispositivo.track"""
+    return path.with_name(path.stem + ".track")
+
+
+def _escribir_atomico(path: Path, data: Dict[str, Any]):
+    """Escribe en un temporal del mismo directorio y lo renombra: nunca queda un JSON a medias."""
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _leer_journals(path: Path, generacion: int = 0, obsoletos: Optional[List[Path]] = None):
+    """
+    Registros del journal (JSONL y/o binario) de la generación `generacion`;
+    un último registro truncado se ignora. Cada journal empieza con {"t": "g"}:
+    si es de una generación anterior, la instantánea ya lo incluye (corte
+    entre escribirla y vaciar el journal) y no se vuelve a aplicar; se anota
+    en `obsoletos`.
+    """
+    for codec in CODECS:
+        journal = _journal_path(path, codec)
+        if not journal.exists():
+            continue
+        with journal.open("rb") as f:
+            registros = codec_de(codec).leer(f)
+            primero = next(registros, None)
+            if primero is None:
+                continue
+            # sin cabecera: journal anterior a las generaciones (generación 0)
+            gen = primero.get("g", 0) if primero.get("t") == "g" else 0
+            if gen != generacion:
+                if obsoletos is not None:
+                    obsoletos.append(journal)
+                continue
+            if primero.get("t") != "g":
+                yield primero
+            yield from registros
+
+
+def _cabecera_journal(f, codec: str, generacion: int):
+    """Escribe la cabecera de generación si el journal (abierto en 'ab') está vacío."""
+    if f.tell() == 0:
+        codec_de(codec).escribir(f, [{"t": "g", "g": generacion}])
 
 
 class Dispositivo:
-    def __init__(self, nombre: str = "Nodo Local", protocolo: str = "mqtt"):
+    # Registros en el journal antes de compactar en una instantánea nueva
+    COMPACTAR_CADA = 1000
+    # Tolerancia RDP (metros) al compactar el track; None = guardar todos los fixes
+    TOLERANCIA_COMPACTAR: Optional[float] = None
+    # Formato del journal: "json" (JSONL) o "bin" (ver codec.py)
+    CODEC_JOURNAL = CODEC_JSON
+
+    def __init__(self, nombre: str = "Nodo Local", protocolo: str = "mqtt",
+                 filtro: Optional[FiltroStreaming] = None):
         self.nombre = nombre
         self.protocolo = protocolo
         self.conectado = False
         self.historial: List[Dict[str, Any]] = []
-        self.posiciones: List[Dict[str, Any]] = []
+        self.posiciones = Track()  # columnas array('d'): t, lat, lon, alt
+        self.filtro = filtro       # descarta fixes casi repetidos al registrarlos
+
+        # Estado de persistencia incremental
+        self._ruta: Optional[Path] = None   # instantánea a la que apunta el journal
+        self._hist_guardados = 0
+        self._pos_guardadas = 0
+        self._estado_guardado: Optional[Dict[str, Any]] = None
+        self._journal_registros = 0
+        self._generacion = 0  # de la instantánea; el journal sólo vale con la misma
 
     def conectar(self):
         self.conectado = True
@@ -28,25 +105,129 @@ class Dispositivo:
         }
         self.historial.append(registro)
 
-    def registrar_posicion(self, lat: float, lon: float, alt: float):
-        registro = {
-            "fecha": datetime.utcnow().isoformat(),
-            "lat": lat,
-            "lon": lon,
-            "alt": alt
-        }
-        self.posiciones.append(registro)
+    def registrar_posicion(self, lat: float, lon: float, alt: float) -> bool:
+        t = time.time()
+        if self.filtro is not None and not self.filtro.acepta(t, lat, lon):
+            return False
+        self.posiciones.append(t, lat, lon, alt)
+        return True
+
+    # -------- persistencia --------
+    def _estado(self) -> Dict[str, Any]:
+        return {"nombre": self.nombre, "protocolo": self.protocolo, "conectado": self.conectado}
 
     def guardar_datos(self, ruta: str = "../data/dispositivo.json"):
+        """
+        Persistencia incremental: añade al journal (mensajes) y al .track
+        (posiciones) sólo lo registrado desde el último guardado. La instantánea
+        se reescribe (de forma atómica) la primera vez y cada COMPACTAR_CADA
+        registros del journal.
+        """
         path = Path(ruta)
         path.parent.mkdir(parents=True, exist_ok=True)
-        data = {
-            "nombre": self.nombre,
-            "protocolo": self.protocolo,
-            "conectado": self.conectado,
-            "historial": self.historial,
-            "posiciones": self.posiciones
-        }
-        with path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        if self._ruta != path:
+            self.compactar(ruta)
+            return str(path)
+
+        lineas = []
+        estado = self._estado()
+        if estado != self._estado_guardado:
+            lineas.append(dict(estado, t="e"))
+        lineas.extend(dict(r, t="m") for r in self.historial[self._hist_guardados:])
+
+        if self._journal_registros + len(lineas) > self.COMPACTAR_CADA:
+            self.compactar(ruta)
+            return str(path)
+
+        # las posiciones van en binario al .track, también sólo las nuevas
+        if len(self.posiciones) > self._pos_guardadas:
+            self.posiciones.append_to(str(_track_path(path)), self._pos_guardadas)
+        if lineas:
+            with _journal_path(path, self.CODEC_JOURNAL).open("ab") as f:
+                _cabecera_journal(f, self.CODEC_JOURNAL, self._generacion)
+                codec_de(self.CODEC_JOURNAL).escribir(f, lineas)
+            self._journal_registros += len(lineas)
+        self._marcar_guardado()
         return str(path)
+
+    def compactar(self, ruta: str = "../data/dispositivo.json", tolerancia_m: Optional[float] = None):
+        """
+        Escribe la instantánea completa y vacía el journal. Con tolerancia
+        (o TOLERANCIA_COMPACTAR) el track se simplifica con RDP y se reescribe.
+        """
+        path = Path(ruta)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        track = _track_path(path)
+        tolerancia = self.TOLERANCIA_COMPACTAR if tolerancia_m is None else tolerancia_m
+        if tolerancia:
+            self.posiciones = simplificar_track(self.posiciones, tolerancia)
+        if self._ruta != path or tolerancia:
+            self.posiciones.save(str(track))
+        elif len(self.posiciones) > self._pos_guardadas:
+            self.posiciones.append_to(str(track), self._pos_guardadas)
+        generacion = self._generacion + 1
+        data = dict(self._estado(), historial=self.historial, posiciones_archivo=track.name,
+                    generacion=generacion)
+        _escribir_atomico(path, data)
+        # el journal sólo se trunca cuando la instantánea ya está en disco; si se
+        # corta antes, su cabecera es de la generación anterior y cargar() lo salta
+        self._generacion = generacion
+        for codec in CODECS:
+            journal = _journal_path(path, codec)
+            if codec == self.CODEC_JOURNAL:
+                with journal.open("wb") as f:
+                    _cabecera_journal(f, codec, generacion)
+            elif journal.exists():
+                journal.unlink()  # journal de otro formato, ya incluido en la instantánea
+        self._ruta = path
+        self._journal_registros = 0
+        self._marcar_guardado()
+        return str(path)
+
+    def _marcar_guardado(self):
+        self._hist_guardados = len(self.historial)
+        self._pos_guardadas = len(self.posiciones)
+        self._estado_guardado = self._estado()
+
+    @classmethod
+    def cargar(cls, ruta: str = "../data/dispositivo.json") -> "Dispositivo":
+        """Reconstruye el dispositivo a partir de instantánea + journal."""
+        path = Path(ruta)
+        disp = cls()
+        legado = False
+        if path.exists():
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            disp.nombre = data.get("nombre", disp.nombre)
+            disp.protocolo = data.get("protocolo", disp.protocolo)
+            disp.conectado = data.get("conectado", False)
+            disp.historial = list(data.get("historial", []))
+            disp._generacion = data.get("generacion", 0)
+            if "posiciones_archivo" in data:
+                disp.posiciones = Track.load(str(path.with_name(data["posiciones_archivo"])))
+            else:
+                # formato antiguo: lista de dicts dentro del JSON
+                disp.posiciones = Track.from_dicts(data.get("posiciones", []))
+                legado = True
+
+        registros = 0
+        obsoletos: List[Path] = []
+        for r in _leer_journals(path, disp._generacion, obsoletos):
+            tipo = r.pop("t", None)
+            if tipo == "m":
+                disp.historial.append(r)
+            elif tipo == "p":
+                disp.posiciones.append_dict(r)
+            elif tipo == "e":
+                disp.nombre = r.get("nombre", disp.nombre)
+                disp.protocolo = r.get("protocolo", disp.protocolo)
+                disp.conectado = r.get("conectado", disp.conectado)
+            registros += 1
+
+        if path.exists() and not legado and not obsoletos:
+            # seguir añadiendo al mismo journal sin reescribir la instantánea;
+            # con un journal obsoleto el próximo guardado compacta y lo reemplaza
+            disp._ruta = path
+            disp._journal_registros = registros
+            disp._marcar_guardado()
+        return disp
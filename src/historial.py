@@ -0,0 +1,317 @@
+from __future__ import annotations
+import codecs
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from codec import CODEC_BINARIO, CODECS, MAGIA, es_binario
+from paquete import NODEINFO_APP, POSITION_APP, TEXT_MESSAGE_APP, node_id
+from parseo import tiempo_texto
+from segment_store import listar_segmentos
+
+# Formatos de data_store.json
+FORMATO_ARRAY = "array"    # MqttClient antiguo: un array JSON reescrito entero
+FORMATO_JSONL = "jsonl"    # MeshtasticGateway / segmentos: una línea por registro
+FORMATO_BINARIO = "bin"    # codec.CodecBinario (persist_codec/codec = "bin")
+FORMATO_VACIO = "vacio"
+
+TIPOS = ("position", "text", "nodeinfo", "json", "encrypted", "other")
+
+_CHUNK = 1 << 20  # 1 MiB por lectura: memoria constante sea cual sea el fichero
+_ESPACIOS = b" \t\r\n"
+_BLANCOS = " \t\r\n"
+
+
+def detectar_formato(path: str) -> str:
+    """Mira el primer byte significativo: '[' → array, '{' → JSON Lines, MAGIA → binario."""
+    with open(path, "rb") as f:
+        if es_binario(f.read(len(MAGIA))):
+            return FORMATO_BINARIO
+        f.seek(0)
+        while True:
+            bloque = f.read(4096)
+            if not bloque:
+                return FORMATO_VACIO
+            bloque = bloque.lstrip(_ESPACIOS)
+            if bloque:
+                return FORMATO_ARRAY if bloque[:1] == b"[" else FORMATO_JSONL
+
+
+def fuentes(path: str) -> List[Tuple[str, str]]:
+    """
+    Ficheros a recorrer para `path`, en orden cronológico: primero el propio
+    fichero (o su .migrated), su versión binaria del gateway y luego los
+    segmentos de SegmentStore (JSONL o binarios).
+    """
+    out = []
+    base, _ = os.path.splitext(path)
+    binario = base + CODECS[CODEC_BINARIO].extension
+    for p in (path + ".migrated", path) + ((binario,) if binario != path else ()):
+        if os.path.isfile(p):
+            out.append((p, detectar_formato(p)))
+    seg_dir = base + ".segments"
+    if os.path.isdir(seg_dir):
+        for ruta in listar_segmentos(seg_dir):
+            out.append((ruta, FORMATO_BINARIO if ruta.endswith(".bin") else FORMATO_JSONL))
+    return out
+
+
+# --------------- clasificación ---------------
+def nodo_de(r: dict) -> Optional[str]:
+    return r.get("from") or r.get("meshtastic_from")
+
+
+def tipo_de(r: dict) -> str:
+    """Tipo lógico de un registro, sea del gateway, del MqttClient o antiguo."""
+    port = r.get("portnum")
+    tipo = r.get("type")
+    if port == POSITION_APP or tipo == "position" or "lat" in r:
+        return "position"
+    if port == NODEINFO_APP or tipo == "nodeinfo":
+        return "nodeinfo"
+    if "json" in r:
+        return "json"
+    if tipo == "encrypted":
+        return "encrypted"
+    texto = r.get("text")
+    if texto and "latitude_i" in texto:
+        return "position"
+    if texto and "long_name:" in texto:
+        return "nodeinfo"  # User renderizado como texto en el formato antiguo
+    if port == TEXT_MESSAGE_APP or tipo == "text" or (texto is not None and port is None):
+        return "text"
+    return "other"
+
+
+def ts_de(r: dict) -> Optional[str]:
+    """Marca de tiempo ISO UTC ('%Y-%m-%dT%H:%M:%SZ'); los registros antiguos usan el `time` del Position."""
+    ts = r.get("ts")
+    if ts:
+        return ts_utc(ts)
+    texto = r.get("text")
+    t = tiempo_texto(texto) if texto and "time:" in texto else None
+    return _iso(t) if t is not None else None
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def ts_utc(ts: str) -> str:
+    """
+    "ts" guardado → ISO UTC. El gateway escribía antes '%Y-%m-%d %H:%M:%S'
+    en hora local (time.strftime): se convierte con la zona de esta máquina.
+    """
+    if ts[10:11] == " ":
+        return _local_a_utc(ts[:19])
+    return ts
+
+
+@lru_cache(maxsize=4096)  # en un histórico los segundos se repiten mucho
+def _local_a_utc(ts: str) -> str:
+    try:
+        t = time.mktime((int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+                         int(ts[11:13]), int(ts[14:16]), int(ts[17:19]), 0, 0, -1))
+    except (ValueError, OverflowError):
+        return ts
+    return _iso(t)
+
+
+def normalizar_fecha(valor: str) -> str:
+    """'2025-10-22', '2025-10-22 15:44', ISO con Z u offset, o epoch → ISO UTC comparable."""
+    valor = valor.strip()
+    if valor.replace(".", "", 1).isdigit():
+        return _iso(float(valor))
+    dt = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def normalizar_nodo(valor: str) -> str:
+    """'!2ae93dc9', '2ae93dc9' o el número decimal → '!2ae93dc9'."""
+    valor = valor.strip().lower()
+    if valor.startswith("!"):
+        return valor
+    if valor.isdigit():
+        return node_id(int(valor))
+    return "!" + valor
+
+
+# --------------- filtros ---------------
+@dataclass
+class FiltroHistorial:
+    node: Optional[str] = None
+    since: Optional[str] = None   # ISO UTC, incluido
+    until: Optional[str] = None   # ISO UTC, excluido
+    tipo: Optional[str] = None
+
+    def prefiltro(self) -> Optional[Callable[[bytes], bool]]:
+        """Test barato sobre los bytes de la línea, antes de json.loads."""
+        pruebas = []
+        if self.node:
+            aguja = json.dumps(self.node).encode("utf-8")
+            pruebas.append(lambda l: aguja in l)
+        if self.tipo == "position":
+            pruebas.append(lambda l: b'"lat"' in l or b"latitude_i" in l)
+        elif self.tipo == "json":
+            pruebas.append(lambda l: b'"json"' in l)
+        elif self.tipo == "encrypted":
+            pruebas.append(lambda l: b'"encrypted"' in l)
+        if self.since or self.until:
+            desde = self.since.encode("ascii") if self.since else None
+            hasta = self.until.encode("ascii") if self.until else None
+            pruebas.append(lambda l: _ts_en_rango(l, desde, hasta))
+        if not pruebas:
+            return None
+        if len(pruebas) == 1:
+            return pruebas[0]
+        return lambda l: all(p(l) for p in pruebas)
+
+    def acepta(self, r: dict) -> bool:
+        if self.node and nodo_de(r) != self.node:
+            return False
+        if self.tipo and tipo_de(r) != self.tipo:
+            return False
+        if self.since or self.until:
+            ts = ts_de(r)
+            if ts is None:
+                return False
+            if self.since and ts < self.since:
+                return False
+            if self.until and ts >= self.until:
+                return False
+        return True
+
+
+_CLAVE_TS = b'"ts": "'
+
+
+def _ts_en_rango(linea: bytes, desde: Optional[bytes], hasta: Optional[bytes]) -> bool:
+    """Compara el "ts" de la línea sin parsearla; sin "ts" decide acepta() tras parsear."""
+    i = linea.find(_CLAVE_TS)
+    if i < 0:
+        return True
+    i += len(_CLAVE_TS)
+    ts = linea[i:i + 20]
+    if ts[10:11] == b" ":
+        ts = _local_a_utc(ts[:19].decode("ascii", "replace")).encode("ascii", "replace")
+    return (desde is None or ts >= desde) and (hasta is None or ts < hasta)
+
+
+# --------------- lectores ---------------
+def _leer_jsonl(f, prefiltro: Optional[Callable[[bytes], bool]]) -> Iterator[dict]:
+    for linea in f:
+        if prefiltro is not None and not prefiltro(linea):
+            continue
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield json.loads(linea)
+        except ValueError:
+            continue  # línea truncada por un corte
+
+
+class _Bufer:
+    """Texto leído por bloques; lo ya consumido se descarta en cada lectura."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self._dec = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def leer_mas(self) -> bool:
+        trozo = self.f.read(_CHUNK)
+        texto = self._dec.decode(trozo, final=not trozo)
+        self.buf = self.buf[self.pos:] + texto
+        self.pos = 0
+        return bool(trozo)
+
+    def saltar(self, blancos: str) -> Optional[str]:
+        """Avanza sobre `blancos` y devuelve el siguiente carácter (None al final)."""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in blancos:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self.leer_mas():
+                return None
+
+
+def _leer_array(f, prefiltro: Optional[Callable[[bytes], bool]]) -> Iterator[dict]:
+    """
+    Recorre un array JSON elemento a elemento con raw_decode sobre un búfer
+    acotado (un bloque + un registro). Si tras el ']' hay líneas JSONL (el
+    gateway añadió al array antiguo), se siguen leyendo como JSONL.
+    """
+    dec = json.JSONDecoder()
+    b = _Bufer(f)
+    if b.saltar(_BLANCOS) != "[":
+        return
+    b.pos += 1
+    while True:
+        c = b.saltar(_BLANCOS + ",")
+        if c is None:
+            return
+        if c == "]":
+            b.pos += 1
+            break
+        try:
+            obj, fin = dec.raw_decode(b.buf, b.pos)
+        except ValueError:
+            if not b.leer_mas():
+                return  # array truncado
+            continue
+        b.pos = fin
+        if isinstance(obj, dict):
+            yield obj
+
+    # cola JSONL tras el array
+    yield from _leer_jsonl(_ConCabeza(b.buf[b.pos:].encode("utf-8"), f), prefiltro)
+
+
+class _ConCabeza:
+    """Iterador de líneas sobre `cabeza` (bytes ya leídos) seguida del resto del fichero."""
+
+    def __init__(self, cabeza: bytes, f):
+        self.cabeza = cabeza
+        self.f = f
+
+    def __iter__(self):
+        lineas = self.cabeza.split(b"\n")
+        ultima = lineas.pop()
+        yield from (l + b"\n" for l in lineas)
+        primera = self.f.readline()
+        yield ultima + primera
+        yield from self.f
+
+
+def iterar_registros(path: str, filtro: Optional[FiltroHistorial] = None) -> Iterator[dict]:
+    """
+    Recorre perezosamente todos los registros guardados en `path` (array o
+    JSONL, más sus segmentos) aplicando el filtro durante la lectura.
+    """
+    filtro = filtro or FiltroHistorial()
+    prefiltro = filtro.prefiltro()
+    for ruta, formato in fuentes(path):
+        with open(ruta, "rb") as f:
+            if formato == FORMATO_ARRAY:
+                # en el array el prefiltro sólo se aplica a la cola JSONL
+                registros = _leer_array(f, prefiltro)
+            elif formato == FORMATO_JSONL:
+                registros = _leer_jsonl(f, prefiltro)
+            elif formato == FORMATO_BINARIO:
+                registros = CODECS[CODEC_BINARIO].leer(f)
+            else:
+                continue
+            for r in registros:
+                if filtro.acepta(r):
+                    yield r
@@ -0,0 +1,275 @@
+from __future__ import annotations
+import heapq
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from historial import FiltroHistorial, iterar_registros, ts_utc
+from parseo import posicion_registro, tiempo_texto
+from track import haversine
+
+_M_POR_GRADO = 111_320.0  # metros por grado de latitud (aprox.)
+
+
+class Fix:
+    """Una posición indexada."""
+    __slots__ = ("node", "t", "lat", "lon")
+
+    def __init__(self, node: str, t: float, lat: float, lon: float):
+        self.node = node
+        self.t = t
+        self.lat = lat
+        self.lon = lon
+
+    def __repr__(self):
+        return f"<Fix {self.node} t={self.t:.0f} lat={self.lat:.6f} lon={self.lon:.6f}>"
+
+
+class IndicePosiciones:
+    """
+    Índice espacial (rejilla de celdas de `cell_deg` grados) y temporal
+    (columna de tiempos ordenada) sobre las posiciones recibidas.
+
+    Cada celda guarda los números de fila de sus fixes, así que una consulta
+    por rectángulo o radio sólo recorre las celdas que lo cubren. Además se
+    mantiene la última posición de cada nodo en una rejilla aparte para las
+    consultas de k nodos más cercanos.
+    """
+
+    def __init__(self, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self._lock = threading.RLock()
+
+        # columnas
+        self._node = array("l")     # índice en _nodes
+        self._t = array("d")
+        self._lat = array("d")
+        self._lon = array("d")
+        self._nodes: List[str] = []
+        self._node_ix: Dict[str, int] = {}
+
+        self._grid: Dict[Tuple[int, int], array] = {}
+        # índice temporal: si los fixes llegan desordenados se reordena bajo demanda
+        self._t_sorted = True
+        self._orden: Optional[array] = None
+        self._orden_t: Optional[array] = None
+
+        # última posición por nodo
+        self._ultimo: Dict[str, int] = {}
+        self._grid_nodos: Dict[Tuple[int, int], Set[str]] = {}
+        self._extension: Optional[List[int]] = None  # celdas [y0, y1, x0, x1] ocupadas alguna vez
+
+    # -------- alta --------
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def add(self, node: str, lat: float, lon: float, t: Optional[float] = None) -> int:
+        """Añade un fix y devuelve su número de fila."""
+        t = time.time() if t is None else float(t)
+        with self._lock:
+            ix = self._node_ix.get(node)
+            if ix is None:
+                ix = self._node_ix[node] = len(self._nodes)
+                self._nodes.append(node)
+            fila = len(self._t)
+            if fila and t < self._t[-1]:
+                self._t_sorted = False
+            self._node.append(ix)
+            self._t.append(t)
+            self._lat.append(lat)
+            self._lon.append(lon)
+            self._orden = None
+
+            celda = self._cell(lat, lon)
+            filas = self._grid.get(celda)
+            if filas is None:
+                filas = self._grid[celda] = array("l")
+            filas.append(fila)
+
+            prev = self._ultimo.get(node)
+            if prev is None or t >= self._t[prev]:
+                if prev is not None:
+                    vieja = self._cell(self._lat[prev], self._lon[prev])
+                    if vieja != celda:
+                        nodos = self._grid_nodos[vieja]
+                        nodos.discard(node)
+                        if not nodos:
+                            del self._grid_nodos[vieja]
+                self._grid_nodos.setdefault(celda, set()).add(node)
+                self._ultimo[node] = fila
+                ext = self._extension
+                if ext is None:
+                    self._extension = [celda[0], celda[0], celda[1], celda[1]]
+                else:
+                    ext[0], ext[1] = min(ext[0], celda[0]), max(ext[1], celda[0])
+                    ext[2], ext[3] = min(ext[2], celda[1]), max(ext[3], celda[1])
+            return fila
+
+    def on_packet(self, p):
+        """Callback para MeshtasticGateway.on_packet: indexa los paquetes de posición."""
+        if p.is_position:
+            self.add(p.sender, p.lat, p.lon, (p.pb.time if p.pb is not None and p.pb.time else None))
+
+    def __len__(self) -> int:
+        return len(self._t)
+
+    def fix(self, fila: int) -> Fix:
+        return Fix(self._nodes[self._node[fila]], self._t[fila], self._lat[fila], self._lon[fila])
+
+    def nodes(self) -> List[str]:
+        return list(self._ultimo)
+
+    def last_fix(self, node: str) -> Optional[Fix]:
+        fila = self._ultimo.get(node)
+        return self.fix(fila) if fila is not None else None
+
+    # -------- consultas --------
+    def time_range(self, t0: float, t1: float) -> List[Fix]:
+        with self._lock:
+            return [self.fix(i) for i in self._rows_in_time(t0, t1)]
+
+    def bbox(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+             t0: Optional[float] = None, t1: Optional[float] = None) -> List[Fix]:
+        """Fixes dentro del rectángulo (y opcionalmente del intervalo [t0, t1])."""
+        with self._lock:
+            return [self.fix(i) for i in self._rows_in_bbox(lat_min, lat_max, lon_min, lon_max, t0, t1)]
+
+    def radius(self, lat: float, lon: float, metros: float,
+               t0: Optional[float] = None, t1: Optional[float] = None) -> List[Fix]:
+        """Fixes a menos de `metros` de (lat, lon)."""
+        dlat = metros / _M_POR_GRADO
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        with self._lock:
+            filas = self._rows_in_bbox(lat - dlat, lat + dlat, lon - dlon, lon + dlon, t0, t1)
+            la, lo = self._lat, self._lon
+            return [self.fix(i) for i in filas if haversine(lat, lon, la[i], lo[i]) <= metros]
+
+    def nodes_within(self, lat: float, lon: float, metros: float) -> List[Fix]:
+        """Última posición de los nodos que están a menos de `metros`."""
+        with self._lock:
+            return [f for d, f in self._nearest(lat, lon, None, metros)]
+
+    def nearest_nodes(self, lat: float, lon: float, k: int = 5) -> List[Tuple[float, Fix]]:
+        """Los k nodos (por su última posición) más cercanos: [(metros, Fix)]."""
+        with self._lock:
+            return self._nearest(lat, lon, k, None)
+
+    # -------- internos --------
+    def _rows_in_time(self, t0: float, t1: float) -> Iterable[int]:
+        if self._t_sorted:
+            return range(bisect_left(self._t, t0), bisect_right(self._t, t1))
+        if self._orden is None:
+            orden = sorted(range(len(self._t)), key=self._t.__getitem__)
+            self._orden = array("l", orden)
+            self._orden_t = array("d", (self._t[i] for i in orden))
+        return self._orden[bisect_left(self._orden_t, t0):bisect_right(self._orden_t, t1)]
+
+    def _rows_in_bbox(self, lat_min, lat_max, lon_min, lon_max, t0, t1) -> List[int]:
+        c0 = self._cell(lat_min, lon_min)
+        c1 = self._cell(lat_max, lon_max)
+        n_celdas = (c1[0] - c0[0] + 1) * (c1[1] - c0[1] + 1)
+        if t0 is not None or t1 is not None:
+            t0 = -math.inf if t0 is None else t0
+            t1 = math.inf if t1 is None else t1
+        la, lo, ts = self._lat, self._lon, self._t
+
+        if n_celdas > len(self._grid):
+            # rectángulo enorme: más barato recorrer sólo las celdas ocupadas
+            celdas = [f for (cy, cx), f in self._grid.items()
+                      if c0[0] <= cy <= c1[0] and c0[1] <= cx <= c1[1]]
+        else:
+            celdas = [self._grid[(cy, cx)]
+                      for cy in range(c0[0], c1[0] + 1)
+                      for cx in range(c0[1], c1[1] + 1)
+                      if (cy, cx) in self._grid]
+
+        out = []
+        for filas in celdas:
+            for i in filas:
+                if lat_min <= la[i] <= lat_max and lon_min <= lo[i] <= lon_max:
+                    if t0 is None or t0 <= ts[i] <= t1:
+                        out.append(i)
+        return out
+
+    def _nearest(self, lat: float, lon: float, k: Optional[int], max_m: Optional[float]):
+        """Búsqueda por anillos de celdas crecientes sobre la rejilla de últimas posiciones."""
+        if not self._ultimo:
+            return []
+        cy, cx = self._cell(lat, lon)
+        celda_m = self.cell_deg * _M_POR_GRADO * max(math.cos(math.radians(lat)), 1e-6)
+        ocupadas = self._grid_nodos
+        y0, y1, x0, x1 = self._extension
+        max_r = max(abs(cy - y0), abs(cy - y1), abs(cx - x0), abs(cx - x1))
+        heap: List[Tuple[float, str]] = []
+        r = 0
+        while r <= max_r:
+            for celda in self._ring(cy, cx, r):
+                for node in ocupadas.get(celda, ()):
+                    f = self._ultimo[node]
+                    d = haversine(lat, lon, self._lat[f], self._lon[f])
+                    if max_m is None or d <= max_m:
+                        heap.append((d, node))
+            # cualquier nodo fuera del anillo r está a más de r * celda_m
+            if k is not None and len(heap) >= k and heapq.nsmallest(k, heap)[-1][0] <= r * celda_m:
+                break
+            if max_m is not None and r * celda_m > max_m:
+                break
+            r += 1
+        mejores = heapq.nsmallest(k, heap) if k is not None else sorted(heap)
+        return [(d, self.fix(self._ultimo[n])) for d, n in mejores]
+
+    @staticmethod
+    def _ring(cy: int, cx: int, r: int):
+        if r == 0:
+            yield (cy, cx)
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield (cy - r, x)
+            yield (cy + r, x)
+        for y in range(cy - r + 1, cy + r):
+            yield (y, cx - r)
+            yield (y, cx + r)
+
+    # -------- carga desde el histórico --------
+    def add_records(self, registros: Iterable[Dict]) -> int:
+        """Indexa registros de data_store.json (campos lat/lon o texto latitude_i/longitude_i)."""
+        n = 0
+        for r in registros:
+            pos = _posicion_de_registro(r)
+            if pos is not None:
+                self.add(*pos)
+                n += 1
+        return n
+
+    def load_history(self, path: str) -> int:
+        """
+        Indexa las posiciones de data_store.json y sus segmentos (array antiguo,
+        JSONL o binario), leyéndolos en streaming con historial.iterar_registros.
+        """
+        return self.add_records(iterar_registros(path, FiltroHistorial(tipo="position")))
+
+
+def _posicion_de_registro(r: Dict) -> Optional[Tuple[str, float, float, float]]:
+    pos = posicion_registro(r)
+    if pos is None:
+        return None
+    node = r.get("from") or r.get("meshtastic_from") or r.get("gateway_id") or "?"
+    return node, pos[0], pos[1], _ts_de_registro(r)
+
+
+def _ts_de_registro(r: Dict) -> float:
+    texto = r.get("text")
+    t = tiempo_texto(texto) if texto and r.get("lat") is None else None
+    if t is not None:
+        return float(t)
+    ts = r.get("ts")
+    if ts:
+        try:
+            return datetime.strptime(ts_utc(ts), "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            pass
+    return 0.0
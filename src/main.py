@@ -2,8 +2,16 @@ from __future__ import annotations
 import argparse
 import json
 import os
-from typing import Any, Dict, Optional
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
 from meshtastic_client import MeshtasticGateway
+from conexiones import obtener_gateway
+from sqlite_store import BACKEND_SQLITE, SqliteStore
+from metricas import ExportadorJSON, Metricas, ServidorMetricas
+from decoradores import PERFILES
+from captura import reproducir
+from historial import TIPOS, FiltroHistorial, iterar_registros, normalizar_fecha, normalizar_nodo, nodo_de, tipo_de, ts_de
 
 
 # ========= CARGA CONFIG =========
@@ -23,7 +31,15 @@ def load_config(path: Optional[str] = None) -> Dict[str, Any]:
             "key": "ymACgCy9Tdb8jHbLxUxZ/4ADX+BWLOGVihmKHcHTVyo="
         },
         "almacen": {
-            "archivo": "../data/data_store.json"
+            "archivo": "../data/data_store.json",
+            "backend": "jsonl",              # "jsonl" | "sqlite"
+            "sqlite": "../data/data_store.db"
+        },
+        "metricas": {
+            "activas": False,
+            "json": "../data/metricas.json",  # instantánea periódica (null = no)
+            "intervalo": 10,
+            "puerto": None                    # endpoint http://127.0.0.1:<puerto>/metrics (null = no)
         }
     }
     if path is None:
@@ -32,7 +48,7 @@ def load_config(path: Optional[str] = None) -> Dict[str, Any]:
         try:
             with open(path, "r", encoding="utf-8") as f:
                 user = json.load(f)
-            for k in ("mqtt", "meshtastic", "almacen"):
+            for k in ("mqtt", "meshtastic", "almacen", "metricas"):
                 if k in user and isinstance(user[k], dict):
                     cfg[k].update(user[k])
         except Exception:
@@ -40,32 +56,55 @@ def load_config(path: Optional[str] = None) -> Dict[str, Any]:
     return cfg
 
 
+def _ruta_datos(ruta: str) -> str:
+    # las rutas de la config son relativas a src/
+    return os.path.normpath(os.path.join(os.path.dirname(__file__), ruta))
+
+
+def opciones_almacen(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Argumentos de persistencia de MeshtasticGateway según la sección "almacen"."""
+    a = cfg["almacen"]
+    return {
+        "persist_path": a["archivo"],
+        "persist_backend": a.get("backend", "jsonl"),
+        "persist_sqlite_path": a.get("sqlite", "../data/data_store.db"),
+    }
+
+
+def iniciar_metricas(cfg: Dict[str, Any]) -> Tuple[Optional[Metricas], List[Any]]:
+    """Registro de métricas y exportadores según la sección "metricas" (None si están desactivadas)."""
+    c = cfg["metricas"]
+    if not c.get("activas"):
+        return None, []
+    metricas = Metricas()
+    exportadores: List[Any] = []
+    if c.get("json"):
+        exportadores.append(ExportadorJSON(metricas, _ruta_datos(c["json"]), float(c.get("intervalo", 10))).start())
+    if c.get("puerto"):
+        exportadores.append(ServidorMetricas(metricas, int(c["puerto"])).start())
+    return metricas, exportadores
+
+
 # ========= ENVÍO / ESCUCHA =========
 def send_meshtastic(cfg: Dict[str, Any], canal: str, mensaje: str):
     m = cfg["mqtt"]
     t = cfg["meshtastic"]
 
     prtin=("t")
-    gw = MeshtasticGateway(
-        broker="mqtt.meshtastic.org", #t["broker"],
-        port=t["port"],
-        username=t["username"],
-        password=t["password"],
-        root_topic=t["root_topic"],
-        channel=t["channel"],
-        key_b64=t["key"],
-        debug=True
-    )
-    gw.connect()
+    # Sesión compartida: se conecta la primera vez y se reutiliza en los siguientes envíos
+    gw = obtener_gateway(dict(t, broker="mqtt.meshtastic.org"), **opciones_almacen(cfg))  # t["broker"]
     gw.send_text(mensaje)
-    gw.disconnect()
     print(f"Enviado en canal '{canal}': {mensaje}")
 
 
-def listen_meshtastic(cfg: Dict[str, Any], canal: str):
+def listen_meshtastic(cfg: Dict[str, Any], canal: str, perfil: bool = False,
+                      captura: Optional[str] = None):
     m = cfg["mqtt"]; t = cfg["meshtastic"]
+    if perfil:
+        PERFILES.activar()
 
     print(t)
+    metricas, exportadores = iniciar_metricas(cfg)
     gw = MeshtasticGateway(
         broker=m["broker"],
         port=m["port"],
@@ -74,11 +113,18 @@ def listen_meshtastic(cfg: Dict[str, Any], canal: str):
         root_topic=t["root_topic"],
         channel=canal,
         key_b64=t["key"],
-        debug=True
+        debug=True,
+        metrics=metricas,
+        capture_path=captura or t.get("captura"),
+        **opciones_almacen(cfg)
     )
     def _on_text(src: str, text: str):
         print(f"[{src}] {text}")
     gw.on_text = _on_text
+    # Canales adicionales: "canales": [{"channel": "...", "key": "...", "tag": "..."}]
+    for extra in t.get("canales", []):
+        gw.add_channel(extra["channel"], extra.get("key", t["key"]), tag=extra.get("tag"))
+    gw.listen_root = bool(t.get("listen_root", False))
     gw.connect()
     print(f"Escuchando canal '{canal}'… (q + Enter para salir)")
     try:
@@ -87,6 +133,99 @@ def listen_meshtastic(cfg: Dict[str, Any], canal: str):
                 break
     finally:
         gw.disconnect()
+        for e in exportadores:
+            e.stop()
+        if PERFILES.activo:
+            PERFILES.volcar()
+
+
+def replay_meshtastic(cfg: Dict[str, Any], archivo: str, velocidad: float, perfil: bool = False,
+                      persistir: Optional[str] = None):
+    """
+    Reinyecta una captura en un gateway sin broker (mismo descifrado y
+    persistencia que listen). Lo persistido va a un almacén temporal que se
+    borra al acabar, salvo que se indique `persistir` (ruta del almacén).
+    """
+    t = cfg["meshtastic"]
+    if perfil:
+        PERFILES.activar()
+    metricas, exportadores = iniciar_metricas(cfg)
+    almacen = opciones_almacen(cfg)
+    with tempfile.TemporaryDirectory(prefix="replay-") as tmp:
+        if almacen["persist_backend"] == BACKEND_SQLITE:
+            almacen["persist_sqlite_path"] = os.path.abspath(persistir or os.path.join(tmp, "data_store.db"))
+        else:
+            almacen["persist_path"] = os.path.abspath(persistir or os.path.join(tmp, "data_store.json"))
+        gw = MeshtasticGateway(root_topic=t["root_topic"], channel=t["channel"], key_b64=t["key"],
+                               metrics=metricas, **almacen)
+        for extra in t.get("canales", []):
+            gw.add_channel(extra["channel"], extra.get("key", t["key"]), tag=extra.get("tag"))
+        gw.listen_root = bool(t.get("listen_root", False))
+        gw.on_text = lambda src, text: print(f"[{src}] {text}")
+        try:
+            res = reproducir(archivo, gw, velocidad)
+        finally:
+            gw.close_store()
+            for e in exportadores:
+                e.stop()
+    print(json.dumps(res, indent=1))
+    if PERFILES.activo:
+        PERFILES.volcar()
+
+
+# ========= HISTÓRICO =========
+def show_history(cfg: Dict[str, Any], archivo: Optional[str] = None, node: Optional[str] = None,
+                 since: Optional[str] = None, until: Optional[str] = None,
+                 tipo: Optional[str] = None, limit: Optional[int] = None, as_json: bool = False) -> int:
+    """Vuelca por stdout los registros guardados que pasan los filtros (en streaming)."""
+    filtro = FiltroHistorial(
+        node=normalizar_nodo(node) if node else None,
+        since=normalizar_fecha(since) if since else None,
+        until=normalizar_fecha(until) if until else None,
+        tipo=tipo,
+    )
+    db = None
+    if archivo is None and cfg["almacen"].get("backend") == BACKEND_SQLITE:
+        db = SqliteStore(_ruta_datos(cfg["almacen"]["sqlite"]))
+        registros = db.registros(filtro, limit)
+    else:
+        registros = iterar_registros(archivo or _ruta_datos(cfg["almacen"]["archivo"]), filtro)
+    n = 0
+    out = sys.stdout
+    try:
+        for r in registros:
+            if as_json:
+                out.write(json.dumps(r, ensure_ascii=False) + "\n")
+            else:
+                if "lat" in r:
+                    detalle = f"{r['lat']:.6f}, {r['lon']:.6f}"
+                else:
+                    detalle = r.get("text") if r.get("text") is not None else json.dumps(r.get("json"), ensure_ascii=False)
+                out.write(f"{ts_de(r) or '-':20} {nodo_de(r) or r.get('topic') or '-':12} {tipo_de(r):9} {detalle}\n")
+            n += 1
+            if limit is not None and n >= limit:
+                break
+    finally:
+        if db is not None:
+            registros.close()
+            db.close()
+    return n
+
+
+def import_sqlite(cfg: Dict[str, Any], db: Optional[str] = None, data_store: Optional[str] = None,
+                  dispositivo: Optional[str] = None) -> int:
+    """Vuelca data_store.json y/o dispositivo.json a la base SQLite."""
+    store = SqliteStore(db or _ruta_datos(cfg["almacen"]["sqlite"]))
+    n = 0
+    try:
+        if data_store:
+            n += store.importar_data_store(data_store)
+        if dispositivo:
+            n += store.importar_dispositivo(dispositivo)
+    finally:
+        store.close()
+    print(f"Importados {n} registros en {store.path}")
+    return n
 
 
 # ========= MENÚ INTERACTIVO =========
@@ -143,6 +282,29 @@ def build_parser(cfg: Dict[str, Any]) -> argparse.ArgumentParser:
 
     plist = sub.add_parser("listen", help="Escuchar canal")
     plist.add_argument("--canal", default=cfg["meshtastic"]["channel"])
+    plist.add_argument("--perfil", action="store_true", help="perfilar (@registrar_evento) e informar al salir")
+    plist.add_argument("--captura", help="grabar el tráfico crudo en este fichero (ver replay)")
+
+    prep = sub.add_parser("replay", help="Reproducir una captura sin broker")
+    prep.add_argument("archivo")
+    prep.add_argument("--velocidad", type=float, default=1.0, help="1 = tiempo real, N = N veces más rápido, 0 = sin esperas")
+    prep.add_argument("--perfil", action="store_true")
+    prep.add_argument("--persistir", metavar="RUTA",
+                      help="guardar lo reproducido en este almacén (por defecto uno temporal que se borra)")
+
+    phist = sub.add_parser("history", help="Consultar lo guardado en data_store.json")
+    phist.add_argument("--node", help="!hex o número de nodo")
+    phist.add_argument("--since", help="fecha/hora ISO (UTC) o epoch, incluida")
+    phist.add_argument("--until", help="fecha/hora ISO (UTC) o epoch, excluida")
+    phist.add_argument("--type", dest="tipo", choices=TIPOS)
+    phist.add_argument("--limit", type=int)
+    phist.add_argument("--json", action="store_true", help="una línea JSON por registro")
+    phist.add_argument("--archivo", help="por defecto almacen.archivo (o almacen.sqlite si backend=sqlite)")
+
+    pimp = sub.add_parser("import-sqlite", help="Importar data_store.json / dispositivo.json a SQLite")
+    pimp.add_argument("--db", help="por defecto almacen.sqlite de la config")
+    pimp.add_argument("--data-store", default=_ruta_datos(cfg["almacen"]["archivo"]))
+    pimp.add_argument("--dispositivo", help="ruta a dispositivo.json (opcional)")
     return p
 
 
@@ -150,7 +312,14 @@ def run_non_interactive(cfg: Dict[str, Any], args: argparse.Namespace):
     if args.mode == "send":
         send_meshtastic(cfg, args.canal, args.mensaje)
     elif args.mode == "listen":
-        listen_meshtastic(cfg, args.canal)
+        listen_meshtastic(cfg, args.canal, args.perfil, args.captura)
+    elif args.mode == "replay":
+        replay_meshtastic(cfg, args.archivo, args.velocidad, args.perfil, args.persistir)
+    elif args.mode == "history":
+        show_history(cfg, args.archivo, args.node, args.since, args.until,
+                     args.tipo, args.limit, args.json)
+    elif args.mode == "import-sqlite":
+        import_sqlite(cfg, args.db, args.data_store, args.dispositivo)
     else:
         interactive_menu(cfg)
 
@@ -2,64 +2,65 @@ import tkinter as tk
 from tkinter import messagebox
 import json
 import os
+import threading
+import time
+from collections import deque
 from tkintermapview import TkinterMapView
 
-from main import load_config
+from main import load_config, opciones_almacen
 from dispositivo import Dispositivo
-from meshtastic_client import MeshtasticGateway
+from conexiones import obtener_gateway, cerrar_gateways
+from paquete import NODEINFO_APP, TEXT_MESSAGE_APP
+from indice_espacial import IndicePosiciones
+from simplificacion import FiltroStreaming, simplificar_puntos
+from decoradores import registrar_evento
+from parseo import FORMATO_JSON, detectar_formato, posicion_json, posicion_texto
 cfg = load_config()
 disp = Dispositivo(nombre="Nodo GUI Mapa", protocolo="meshtastic")
 
+# Índice espacial/temporal de todas las posiciones vistas (histórico + en vivo)
+indice = IndicePosiciones()
+
+
+def cargar_historial():
+    """Indexa el histórico en segundo plano para no bloquear el arranque de Tk."""
+    try:
+        indice.load_history(os.path.normpath(os.path.join(os.path.dirname(__file__), cfg["almacen"]["archivo"])))
+    except (OSError, ValueError) as e:
+        print("No se pudo indexar el histórico:", e)
+
+
+threading.Thread(target=cargar_historial, name="indice-historial", daemon=True).start()
+
 gw_rx = None
 ultimo_enviado = None
 
+# Redibujado agrupado: los callbacks de red sólo dejan la última posición de
+# cada nodo en _pendientes y el hilo de Tk la vuelca como mucho FLUSH_MS.
+FLUSH_MS = 100          # 10 Hz
+RUTA_MAX_FIXES = 500    # fixes recientes por nodo para dibujar su ruta
+RUTA_MIN_METROS = 15.0  # diezmado: se omite un fix a menos de esto del anterior
+RUTA_TOLERANCIA_M = 10.0  # RDP al dibujar la ruta
+
+_lock_pendientes = threading.Lock()
+_pendientes = {}        # nodo -> (lat, lon, alt, origen) más reciente
+_fixes_pendientes = []  # fixes que pasan el filtro, en orden: (nodo, lat, lon, alt)
+_filtros = {}           # nodo -> FiltroStreaming
+_marcadores = {}        # nodo -> CanvasPositionMarker
+_rutas = {}             # nodo -> CanvasPath
+_historial_rutas = {}   # nodo -> deque[(lat, lon)] ya diezmado
+_renombrar = set()      # nodos con NODEINFO nuevo: actualizar la etiqueta
+
+@registrar_evento("mapa.parsear_posicion_meshtastic")
 def parsear_posicion_meshtastic(linea: str):
     """
     Parsea mensajes Meshtastic con formato:
       latitude_i: XXXXX longitude_i: XXXXX altitude: XXX ...
     Funciona aunque vengan en varias líneas y con distintos nombres de altitud.
     """
-    linea = linea.replace("\n", " ").replace("\r", " ")
-    partes = linea.split()
-    datos = {}
-    clave_pendiente = None
-
-    for p in partes:
-        # caso: "latitude_i:"
-        if p.endswith(":"):
-            clave_pendiente = p[:-1]
-
-        # caso: "latitude_i:426814500"
-        elif ":" in p:
-            k, v = p.split(":", 1)
-            datos[k] = v
-            clave_pendiente = None
-
-        else:
-            if clave_pendiente:
-                datos[clave_pendiente] = p
-                clave_pendiente = None
-
-    if "latitude_i" in datos and "longitude_i" in datos:
-        try:
-            lat_i = int(datos["latitude_i"])
-            lon_i = int(datos["longitude_i"])
-
-            lat = lat_i / 1e7
-            lon = lon_i / 1e7
-            alt_raw = (
-                datos.get("altitude_hae")
-                or datos.get("altitude")
-                or datos.get("alt")
-                or "0"
-            )
-            alt = float(alt_raw)
-
-            return lat, lon, alt
-        except Exception:
-            return None
-
-    return None
+    return posicion_texto(linea)
+
+
 def poner_coordenadas(lat, lon, alt=0.0):
     lat_entry.delete(0, tk.END)
     lat_entry.insert(0, f"{lat:.6f}")
@@ -69,57 +70,122 @@ def poner_coordenadas(lat, lon, alt=0.0):
     alt_entry.insert(0, str(alt))
 
 
-def mostrar_en_mapa(lat, lon):
-    map_widget.set_position(lat, lon)
-    map_widget.set_marker(lat, lon, text="Nodo")
+def encolar_posicion(nodo, lat, lon, alt=0.0, origen="Meshtastic"):
+    """Apunta una posición para el próximo volcado (seguro desde cualquier hilo)."""
+    with _lock_pendientes:
+        _pendientes[nodo] = (lat, lon, alt, origen)
+        filtro = _filtros.get(nodo)
+        if filtro is None:
+            filtro = _filtros[nodo] = FiltroStreaming(min_metros=RUTA_MIN_METROS)
+        if filtro.acepta(time.time(), lat, lon):
+            _fixes_pendientes.append((nodo, lat, lon, alt))
 
-def al_llegar_texto(topic, texto):
-    global ultimo_enviado
 
-    print("Mensaje bruto recibido:", texto)
+def nombre_nodo(nodo):
+    """Nombre real (NODEINFO) si el gateway lo conoce; si no, el identificador."""
+    return gw_rx.nodes.nombre(nodo) if gw_rx is not None else nodo
 
-    if ultimo_enviado and texto == ultimo_enviado:
-        return
-    try:
-        payload = json.loads(texto)
-        print(type(payload))
 
-        lat = payload.get("lat")
-        lon = payload.get("long") or payload.get("lon") or payload.get("longitude")
-        alt = payload.get("alt", 0.0)
+def mostrar_en_mapa(nodo, lat, lon):
+    """Mueve el marcador del nodo (lo crea la primera vez) y actualiza su ruta."""
+    marcador = _marcadores.get(nodo)
+    if marcador is None:
+        _marcadores[nodo] = map_widget.set_marker(lat, lon, text=nombre_nodo(nodo))
+    else:
+        marcador.set_position(lat, lon)
+    if ver_rutas.get():
+        dibujar_ruta(nodo)
 
-        if lat is not None and lon is not None:
 
-            def _update_json():
-                poner_coordenadas(lat, lon, alt)
-                mostrar_en_mapa(lat, lon)
-                estado_label.config(text=f"Posición (JSON) recibida", fg="blue")
-                disp.registrar_posicion(lat, lon, alt)
-                disp.guardar_datos()
+def dibujar_ruta(nodo):
+    puntos = simplificar_puntos(list(_historial_rutas.get(nodo, ())), RUTA_TOLERANCIA_M)
+    ruta = _rutas.get(nodo)
+    if len(puntos) < 2:
+        return
+    if ruta is None:
+        _rutas[nodo] = map_widget.set_path(puntos)
+    else:
+        ruta.set_position_list(puntos)
 
-            root.after(0, _update_json)
 
-        return
+def alternar_rutas():
+    if ver_rutas.get():
+        for nodo in _historial_rutas:
+            dibujar_ruta(nodo)
+    else:
+        for ruta in _rutas.values():
+            ruta.delete()
+        _rutas.clear()
+
+
+def volcar_pendientes():
+    """Un único redibujado por fotograma con lo acumulado desde el anterior."""
+    global _pendientes, _fixes_pendientes, _renombrar
+    with _lock_pendientes:
+        pendientes, _pendientes = _pendientes, {}
+        fixes, _fixes_pendientes = _fixes_pendientes, []
+        renombrar, _renombrar = _renombrar, set()
+    try:
+        for nodo in renombrar:
+            if nodo in _marcadores:
+                _marcadores[nodo].set_text(nombre_nodo(nodo))
+        # los fixes filtrados alimentan la ruta de cada nodo y el Dispositivo
+        for nodo, lat, lon, alt in fixes:
+            puntos = _historial_rutas.get(nodo)
+            if puntos is None:
+                puntos = _historial_rutas[nodo] = deque(maxlen=RUTA_MAX_FIXES)
+            puntos.append((lat, lon))
+            disp.registrar_posicion(lat, lon, alt)
+        if fixes:
+            disp.guardar_datos()
+        if pendientes:
+            for nodo, (lat, lon, alt, origen) in pendientes.items():
+                mostrar_en_mapa(nodo, lat, lon)
+            # centrar y rellenar el formulario sólo con la última
+            map_widget.set_position(lat, lon)
+            poner_coordenadas(lat, lon, alt)
+            if origen != "propia":  # no pisar el "Enviado correctamente"
+                estado_label.config(text=f"Posición ({origen}) recibida", fg="blue")
+    finally:
+        root.after(FLUSH_MS, volcar_pendientes)
+
+def al_llegar_texto(nodo, texto):
+    global ultimo_enviado
 
-    except:
-        print("No es JSON válido. Intentando formato Meshtastic...")
+    print("Mensaje bruto recibido:", texto)
 
-    # ----- 2) Intentar formato Meshtastic -----
-    pos = parsear_posicion_meshtastic(texto)
+    if ultimo_enviado and texto == ultimo_enviado:
+        return
+    # el primer carácter decide el formato: sin json.loads fallidos por mensaje
+    if detectar_formato(texto) == FORMATO_JSON:
+        pos, origen = posicion_json(texto), "JSON"
+    else:
+        pos, origen = parsear_posicion_meshtastic(texto), "Meshtastic"
     if pos is None:
-        print("No es JSON ni formato Meshtastic reconocible.")
+        print("No es JSON con posición ni formato Meshtastic reconocible.")
         return
 
     lat, lon, alt = pos
+    indice.add(nodo, lat, lon)
+    encolar_posicion(nodo, lat, lon, alt, origen)
 
-    def _update_mesh():
-        poner_coordenadas(lat, lon, alt)
-        mostrar_en_mapa(lat, lon)
-        estado_label.config(text=f"Posición (Meshtastic) recibida", fg="blue")
-        disp.registrar_posicion(lat, lon, alt)
-        disp.guardar_datos()
 
-    root.after(0, _update_mesh)
+def al_llegar_paquete(paquete):
+    """Callback estructurado: las posiciones llegan ya como números, sin reparsear texto."""
+    if paquete.is_position:
+        indice.on_packet(paquete)
+        encolar_posicion(paquete.sender, paquete.lat, paquete.lon, paquete.alt)
+        return
+
+    if paquete.portnum == NODEINFO_APP:
+        with _lock_pendientes:
+            _renombrar.add(paquete.sender)
+        return
+
+    # Texto (p. ej. el JSON con msg/lat/long de otro alumno): sólo aquí se renderiza.
+    # La posición es del nodo emisor, no del gateway que la ha retransmitido
+    if paquete.portnum == TEXT_MESSAGE_APP and paquete.texto:
+        al_llegar_texto(paquete.origen, paquete.texto)
 
 
 # ===================== ENVÍO =====================
@@ -152,35 +218,35 @@ def enviar_mensaje_y_pos():
 
     try:
         t = cfg["meshtastic"]
-        gw_tx = MeshtasticGateway(
-            broker=t["broker"],
-            port=t["port"],
-            username=t["username"],
-            password=t["password"],
-            root_topic=t["root_topic"],
-            channel=t["channel"],
-            key_b64=t["key"],
-            debug=True
-        )
-        gw_tx.connect()
+        # misma sesión que la recepción (gw_rx); sólo reconecta si se ha caído
+        gw_tx = obtener_gateway(t, debug=True, **opciones_almacen(cfg))
         gw_tx.send_text(texto)
-        gw_tx.disconnect()
 
         estado_label.config(text=f"Enviado correctamente", fg="green")
 
-        mostrar_en_mapa(lat, lon)
-        poner_coordenadas(lat, lon, alt)
-
         disp.registrar_mensaje(mensaje or "[sin texto]",
                                origen="GUI mapa",
                                destino=t["channel"])
-        disp.registrar_posicion(lat, lon, alt)
-        disp.guardar_datos()
+        # la posición propia pasa por el mismo volcado que las recibidas
+        encolar_posicion(disp.nombre, lat, lon, alt, "propia")
 
     except Exception as e:
         estado_label.config(text=f"Error al enviar: {e}", fg="red")
 
 
+def mostrar_cercanos(radio_m: float = 2000.0, k: int = 5):
+    """Nodos (última posición conocida) cercanos al centro del mapa."""
+    lat, lon = map_widget.get_position()
+    dentro = indice.nodes_within(lat, lon, radio_m)
+    if dentro:
+        lineas = [f"{nombre_nodo(f.node)}: {f.lat:.5f}, {f.lon:.5f}" for f in dentro]
+        titulo = f"{len(dentro)} nodo(s) a menos de {radio_m / 1000:.0f} km"
+    else:
+        lineas = [f"{nombre_nodo(f.node)}: {d / 1000:.1f} km" for d, f in indice.nearest_nodes(lat, lon, k)]
+        titulo = f"Ninguno a menos de {radio_m / 1000:.0f} km; más cercanos"
+    messagebox.showinfo("Nodos cercanos", titulo + ":\n" + ("\n".join(lineas) or "(sin posiciones)"))
+
+
 # ===================== GUI =====================
 root = tk.Tk()
 root.title("Interfaz con mapa  Práctica 2 POO")
@@ -220,6 +286,11 @@ tk.Button(
     command=enviar_mensaje_y_pos
 ).pack(anchor="w", pady=5)
 
+tk.Button(left, text="Nodos cercanos", command=mostrar_cercanos).pack(anchor="w", pady=5)
+
+ver_rutas = tk.BooleanVar(value=False)
+tk.Checkbutton(left, text="Mostrar rutas", variable=ver_rutas, command=alternar_rutas).pack(anchor="w")
+
 estado_label = tk.Label(left, text="Estado: esperando acción...", fg="gray")
 estado_label.pack(anchor="w", pady=10)
 
@@ -238,18 +309,7 @@ def iniciar_gateway_rx():
     global gw_rx
     try:
         t = cfg["meshtastic"]
-        gw_rx = MeshtasticGateway(
-            broker=t["broker"],
-            port=t["port"],
-            username=t["username"],
-            password=t["password"],
-            root_topic=t["root_topic"],
-            channel=t["channel"],
-            key_b64=t["key"],
-            debug=True
-        )
-        gw_rx.on_text = al_llegar_texto
-        gw_rx.connect()
+        gw_rx = obtener_gateway(t, debug=True, on_packet=al_llegar_paquete, **opciones_almacen(cfg))
         estado_label.config(text="Conectado y escuchando…", fg="green")
     except Exception as e:
         estado_label.config(text=f"Error al conectar: {e}", fg="orange")
@@ -257,12 +317,12 @@ def iniciar_gateway_rx():
 
 def cerrar():
     try:
-        if gw_rx:
-            gw_rx.disconnect()
+        cerrar_gateways()
     except:
         pass
     root.destroy()
     
 iniciar_gateway_rx()
+root.after(FLUSH_MS, volcar_pendientes)
 root.protocol("WM_DELETE_WINDOW", cerrar)
 root.mainloop()
@@ -1,13 +1,38 @@
-from typing import Generic, TypeVar
-from datetime import datetime
+from __future__ import annotations
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Generic, Optional, TypeVar
 
 T = TypeVar("T")
 
 class Mensaje(Generic[T]):
     """Clase genérica para representar un mensaje de cualquier tipo"""
-    def __init__(self, contenido: T):
+    __slots__ = ("contenido", "ts")
+
+    def __init__(self, contenido: T, ts: Optional[int] = None):
         self.contenido = contenido
-        self.fecha = datetime.utcnow().isoformat()
+        self.ts = int(time.time()) if ts is None else int(ts)  # epoch UTC en segundos
+
+    @property
+    def fecha(self) -> str:
+        """ISO UTC sin zona, como el antiguo atributo (se calcula sólo al pedirlo)."""
+        return datetime.fromtimestamp(self.ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"ts": self.ts, "contenido": self.contenido}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Mensaje":
+        return cls(d["contenido"], d["ts"])
+
+    def __eq__(self, otro) -> bool:
+        return isinstance(otro, Mensaje) and (self.ts, self.contenido) == (otro.ts, otro.contenido)
+
+    def __hash__(self) -> int:
+        return hash((self.ts, self.contenido))
+
+    def __repr__(self):
+        return f"Mensaje({self.contenido!r}, ts={self.ts})"
 
     def __str__(self):
         return f"[{self.fecha}] {self.contenido}"
@@ -3,17 +3,32 @@ import base64
 import json
 import os
 import random
+import threading
 import time
 from dataclasses import dataclass, field
-from typing import Callable, Optional
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional
 
 import paho.mqtt.client as mqtt
-from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
 from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2
 from meshtastic import BROADCAST_NUM, protocols
 
+from batch_writer import BatchWriter, CodecSink, JsonlSink
+from captura import Capturador
+from codec import CODEC_JSON, codec_de
+from sqlite_store import BACKEND_SQLITE, BACKENDS, SqliteStore
+from exceptions import ConexionError, ConfigError
+from pipeline import DecodePipeline, MODO_HILOS, MODO_PROCESOS
+from paquete import Paquete
+from dedup import DedupCache
+from almacen import Almacen
+from metricas import Metricas
+from decoradores import registrar_evento
+from nodos import NodeDB
+from publicacion import PublishTracker
+
 
 # ---------------- utilidades internas ----------------
 
@@ -31,7 +46,8 @@ def _topic_hash(name: str, key_b64: str) -> int:
 
 
 def _now_iso() -> str:
-    return time.strftime("%Y-%m-%d %H:%M:%S")
+    # UTC, como MqttClient (antes era hora local sin zona; ver historial.ts_utc)
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
 
 
 def _ensure_parent(path: str):
@@ -40,6 +56,122 @@ def _ensure_parent(path: str):
         os.makedirs(parent, exist_ok=True)
 
 
+@dataclass
+class _Canal:
+    """Entrada del anillo de claves: un canal y su material AES precalculado."""
+    name: str
+    key_b64: str
+    aes: algorithms.AES
+    hash: int
+    on_text: Optional[Callable[[str, str], None]] = None
+    tag: Optional[str] = None
+
+
+def _build_canal(name: str, key_b64: str, on_text=None, tag=None) -> _Canal:
+    key_bytes = base64.b64decode(key_b64.encode('ascii'))
+    h = _xor_hash(name.encode('utf-8')) ^ _xor_hash(key_bytes)
+    return _Canal(name, key_b64, algorithms.AES(key_bytes), h, on_text, tag)
+
+
+@registrar_evento("gw._decrypt_packet")
+def _decrypt_packet(mp: mesh_pb2.MeshPacket, aes: algorithms.AES):
+    nonce = mp.id.to_bytes(8, "little") + getattr(mp, "from").to_bytes(8, "little")
+    dec = Cipher(aes, modes.CTR(nonce)).decryptor()
+    decrypted = dec.update(getattr(mp, "encrypted")) + dec.finalize()
+    data = mesh_pb2.Data()
+    data.ParseFromString(decrypted)
+    mp.decoded.CopyFrom(data)
+
+
+def _decode_envelope(topic: str, payload: bytes, keyring: Dict[int, _Canal],
+                     fallback: Optional[int], debug: bool = False,
+                     render_text: bool = False,
+                     dedup: Optional[DedupCache] = None) -> Optional[Paquete]:
+    """
+    Etapa de decodificación, sin estado del gateway (apta para hilos o procesos):
+    ServiceEnvelope → duplicados → clave por hash de canal → descifrado → Paquete.
+    """
+    se = mqtt_pb2.ServiceEnvelope()
+    try:
+        se.ParseFromString(payload)
+        mp = se.packet
+    except Exception:
+        if debug:
+            print(f"[GW] No es ServiceEnvelope en {topic}")
+        return None
+
+    # Duplicados (mismo paquete vía otro gateway): se descartan antes de descifrar
+    if dedup is not None and mp.id and dedup.check(getattr(mp, "from"), mp.id, se.gateway_id):
+        return None
+
+    # Buscar la clave del canal en O(1) por su hash
+    canal = keyring.get(mp.channel)
+    if canal is None and fallback is not None:
+        canal = keyring.get(fallback)
+
+    # Descifrar si viene cifrado
+    if canal is not None and mp.HasField("encrypted") and not mp.HasField("decoded"):
+        try:
+            _decrypt_packet(mp, canal.aes)
+        except Exception as e:
+            if debug:
+                print(f"[GW] Error de descifrado: {e}")
+
+    decoded = mp.HasField("decoded")
+    port_num = mp.decoded.portnum if decoded else None
+    handler = protocols.get(port_num) if port_num is not None else None
+
+    pb = None
+    if handler and handler.protobufFactory and decoded:
+        try:
+            pb = handler.protobufFactory()
+            pb.ParseFromString(mp.decoded.payload)
+        except Exception:
+            pb = None
+
+    p = Paquete(
+        sender_num=getattr(mp, "from"),
+        to=mp.to,
+        packet_id=mp.id,
+        gateway_id=se.gateway_id or "",
+        channel=se.channel_id or (canal.name if canal is not None else ""),
+        hash=canal.hash if canal is not None else None,
+        tag=canal.tag if canal is not None else None,
+        topic=topic,
+        portnum=int(port_num) if port_num is not None else None,
+        decoded=decoded,
+        pb=pb,
+        payload=mp.decoded.payload if decoded else b"",
+        rx_time=mp.rx_time,
+    )
+    if render_text:
+        p.texto  # se genera aquí (p. ej. en el proceso de trabajo) y viaja cacheado
+    return p
+
+
+# Estado por proceso para el modo MODO_PROCESOS de la tubería
+_PROC_KEYRING: Dict[int, _Canal] = {}
+_PROC_FALLBACK: Optional[int] = None
+
+
+_PROC_RENDER_TEXT = False
+
+
+def _init_decode_worker(canales, fallback, render_text=False):
+    global _PROC_FALLBACK, _PROC_RENDER_TEXT
+    _PROC_KEYRING.clear()
+    for name, key_b64, tag in canales:
+        canal = _build_canal(name, key_b64, tag=tag)
+        _PROC_KEYRING[canal.hash] = canal
+    _PROC_FALLBACK = fallback
+    _PROC_RENDER_TEXT = render_text
+
+
+def _decode_worker(topic: str, payload: bytes) -> Optional[Paquete]:
+    return _decode_envelope(topic, payload, _PROC_KEYRING, _PROC_FALLBACK,
+                            render_text=_PROC_RENDER_TEXT)
+
+
 # ---------------- clase principal ----------------
 
 @dataclass
@@ -54,6 +186,7 @@ class MeshtasticGateway:
     root_topic: str = "msh/EU_868/ES/2/e/"
     channel: str = "TestMQTT"
     key_b64: str = "ymACgCy9Tdb8jHbLxUxZ/4ADX+BWLOGVihmKHcHTVyo="
+    listen_root: bool = False  # suscribirse a root_topic/# y descifrar con el anillo de claves
 
     # Identidad local
     node_name: str = "!abcdeff1"   # ← رقمك؛ غيّره إن لزم
@@ -63,17 +196,90 @@ class MeshtasticGateway:
 
     # Varios
     debug: bool = False
+    connect_timeout: float = 10.0  # segundos máximos esperando CONNACK + SUBACK
+
+    # Publicación
+    publish_qos: int = 0
+    max_inflight: int = 20         # publicaciones sin confirmar antes de bloquear
+    publish_timeout: float = 10.0  # espera máxima por un hueco en la ventana
     persist_path: str = "../data/data_store.json"  # JSONL (una línea por registro)
+    persist_backend: str = "jsonl"      # "jsonl" | "sqlite"
+    persist_sqlite_path: str = "../data/data_store.db"
+    persist_codec: str = CODEC_JSON     # "json" (JSONL) | "bin" (data_store.bin, ver codec.py)
+    persist_batch_size: int = 256       # registros por write()
+    persist_flush_interval: float = 0.5  # segundos máximos antes de escribir un lote
+    persist_max_queue: int = 10000      # registros en cola antes de descartar
+
+    # Tubería de decodificación (0 workers = todo en el hilo de red, como antes)
+    pipeline_workers: int = 0
+    pipeline_mode: str = MODO_HILOS     # "thread" | "process"
+    pipeline_ordered: bool = True       # entregar en orden de llegada
+    pipeline_max_queue: int = 10000
+
+    # Supresión de duplicados por (from, id); dedup_window=0 la desactiva
+    dedup_window: float = 600.0
+    dedup_max: int = 10000
+    dedup_track_relays: bool = False    # anotar qué gateways retransmiten cada paquete
+
+    # Tabla de nodos (NODEINFO/POSITION); node_db_path=None → sólo en memoria
+    node_db_path: Optional[str] = None  # p. ej. "../data/nodos.json"
+    node_ttl: Optional[float] = 7 * 24 * 3600
+    node_max: int = 10000
+    nodes: NodeDB = field(init=False, repr=False)
+
+    # Últimos paquetes recibidos en memoria (anillo con índices "node" y "portnum"); 0 = no
+    recent_max: int = 0
+    recent: Optional[Almacen[Paquete]] = field(default=None, init=False, repr=False)
+
+    # Métricas (contadores, medidores, histogramas); None → desactivadas, coste casi nulo.
+    # Se puede compartir un mismo registro con otros clientes (ver metricas.py)
+    metrics: Optional[Metricas] = field(default=None, repr=False)
+
+    # Captura del tráfico crudo (topic + ServiceEnvelope) para reproducirlo después
+    # con captura.reproducir(); p. ej. "../data/captura.mshc". None = no se graba
+    capture_path: Optional[str] = None
+    _capture: Optional[Capturador] = field(default=None, init=False, repr=False)
 
     # Internos
     _client: mqtt.Client = field(init=False, repr=False)
-    _subscribe_topic: str = field(default="", init=False, repr=False)
+    _sub_topics: List[str] = field(default_factory=list, init=False, repr=False)
     _publish_topic: str = field(default="", init=False, repr=False)
     _node_number: int = field(default=0, init=False, repr=False)
     _msg_id: int = field(default_factory=lambda: random.getrandbits(32), init=False, repr=False)
+    _writer: Optional[BatchWriter] = field(default=None, init=False, repr=False)
+    _pipeline: Optional[DecodePipeline] = field(default=None, init=False, repr=False)
+    _dedup: Optional[DedupCache] = field(default=None, init=False, repr=False)
+    _dedup_on_deliver: bool = field(default=False, init=False, repr=False)
+    # Estado de la sesión: CONNACK recibido, SUBACK recibido y sesión lista (ambos OK)
+    _connack: threading.Event = field(default_factory=threading.Event, init=False, repr=False)
+    _suback: threading.Event = field(default_factory=threading.Event, init=False, repr=False)
+    _connected: threading.Event = field(default_factory=threading.Event, init=False, repr=False)
+    _connack_rc: object = field(default=None, init=False, repr=False)
+    _sub_mid: Optional[int] = field(default=None, init=False, repr=False)
+    _sub_error: Optional[str] = field(default=None, init=False, repr=False)
+    _loop_running: bool = field(default=False, init=False, repr=False)
+    _tracker: PublishTracker = field(init=False, repr=False)
+    _m_on: bool = field(default=False, init=False, repr=False)
+    _m_ports: Dict[int, object] = field(default_factory=dict, init=False, repr=False)
+    _m_decrypt_errors: Dict[str, object] = field(default_factory=dict, init=False, repr=False)
+    _m_decode_errors: Dict[int, object] = field(default_factory=dict, init=False, repr=False)
+
+    # Material criptográfico precalculado (ver _refresh_crypto)
+    _crypto_src: tuple = field(default=(), init=False, repr=False)
+    _key_bytes: bytes = field(default=b"", init=False, repr=False)
+    _aes: Optional[algorithms.AES] = field(default=None, init=False, repr=False)
+    _channel_hash: int = field(default=0, init=False, repr=False)
+
+    # Anillo de claves: hash de canal (8 bits) → _Canal
+    _keyring: Dict[int, _Canal] = field(default_factory=dict, init=False, repr=False)
 
     # Callback de texto descodificado (opcional, settable desde fuera)
     on_text: Optional[Callable[[str, str], None]] = field(default=None, repr=False)
+    # Callback estructurado: recibe un Paquete (sin renderizar texto)
+    on_packet: Optional[Callable[[Paquete], None]] = field(default=None, repr=False)
+    # Guardar también el protobuf renderizado (str(pb)) en "text". Por defecto se
+    # persisten sólo campos estructurados: el texto de los mensajes, lat/lon/alt y nombres
+    persist_text: bool = False
 
     # --------------- ciclo de vida ---------------
 
@@ -82,63 +288,312 @@ class MeshtasticGateway:
         self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="")
         self._client.username_pw_set(self.username, self.password)
         self._client.on_connect = self._on_connect
+        self._client.on_subscribe = self._on_subscribe
         self._client.on_disconnect = self._on_disconnect
         self._client.on_message = self._on_message
 
-        # Normalizar clave
+        # Ventana de publicaciones en vuelo (también la usa paho para QoS > 0)
+        self._tracker = PublishTracker(self.max_inflight, self.publish_timeout)
+        self._client.on_publish = self._tracker.on_publish
+        self._client.max_inflight_messages_set(self.max_inflight)
+
+        # Normalizar clave y precalcular AES + hash de canal
         self.key_b64 = self._normalize_key(self.key_b64)
+        self._refresh_crypto()
+
+        # Caché de paquetes vistos
+        if self.dedup_window > 0:
+            self._dedup = DedupCache(self.dedup_window, self.dedup_max, self.dedup_track_relays)
+
+        self.nodes = NodeDB(self.node_max, self.node_ttl,
+                            self._abs_persist_path(self.node_db_path) if self.node_db_path else None)
+
+        if self.recent_max > 0:
+            self.recent = Almacen(self.recent_max, indices={
+                "node": lambda p: p.sender,
+                "portnum": lambda p: p.portnum,
+            })
+
+        self._init_metrics()
+
+        if self.capture_path:
+            self.start_capture(self.capture_path)
 
         # Número de nodo derivado del nombre fijo
         self._node_number = int(self.node_name[1:], 16)
 
-        # Preparar carpeta de persistencia
+        # Preparar carpeta de persistencia y escritor en segundo plano
+        if self.persist_backend not in BACKENDS:
+            raise ConfigError(f"Backend de almacenamiento desconocido: {self.persist_backend!r}")
+        try:
+            codec_de(self.persist_codec)
+        except ValueError as e:
+            raise ConfigError(str(e)) from e
         try:
             _ensure_parent(self._abs_persist_path())
+            self._open_writer()
         except Exception:
             pass
 
     def connect(self):
+        """Conecta y bloquea hasta tener CONNACK y SUBACK (o ConexionError tras connect_timeout)."""
         if self.debug:
             print(f"[GW] Conectando {self.broker}:{self.port}…")
-        self._client.connect(self.broker, int(self.port), 60)
+        self._start_pipeline()
+        self._resume_capture()
+        self._reset_session()
+        try:
+            self._client.connect(self.broker, int(self.port), 60)
+        except Exception as e:
+            raise ConexionError(f"Fallo conectando a {self.broker}:{self.port} → {e}") from e
         self._client.loop_start()
-        time.sleep(0.6)
+        self._loop_running = True
+        try:
+            self._wait_ready(time.monotonic() + self.connect_timeout)
+        except ConexionError:
+            self._client.disconnect()
+            self._client.loop_stop()
+            self._loop_running = False
+            raise
+
+    def _reset_session(self):
+        self._connack.clear()
+        self._suback.clear()
+        self._connected.clear()
+        self._connack_rc = None
+        self._sub_mid = None
+        self._sub_error = None
+
+    def _wait_ready(self, deadline: float):
+        """Espera CONNACK y SUBACK hasta `deadline` (time.monotonic)."""
+        destino = f"{self.broker}:{self.port}"
+        if not self._connack.wait(max(0.0, deadline - time.monotonic())):
+            raise ConexionError(f"Sin CONNACK de {destino} en {self.connect_timeout}s")
+        if self._connack_rc != 0:
+            raise ConexionError(f"Conexión rechazada por {destino}: {self._connack_rc}")
+        if not self._suback.wait(max(0.0, deadline - time.monotonic())):
+            raise ConexionError(f"Sin SUBACK de {destino} en {self.connect_timeout}s")
+        if self._sub_error:
+            raise ConexionError(f"Suscripción rechazada por {destino}: {self._sub_error}")
+
+    def ensure_connected(self):
+        """Conecta sólo si hace falta (reconexión perezosa de sesiones reutilizadas)."""
+        if self._connected.is_set():
+            return
+        if self._loop_running:
+            # paho está reintentando por su cuenta: dar margen antes de forzar
+            if self._connected.wait(self.connect_timeout):
+                return
+            self._client.loop_stop()
+            self._loop_running = False
+        self.connect()
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected.is_set()
 
     def disconnect(self):
         try:
             self._client.disconnect()
         finally:
             self._client.loop_stop()
+            self._loop_running = False
+            self._connected.clear()
+            self._stop_pipeline()
+            self.close_store()
+            self.stop_capture()
+            self.nodes.snapshot()
+
+    def flush_store(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que los registros encolados estén en disco."""
+        return self._writer.flush(timeout) if self._writer is not None else True
+
+    def close_store(self):
+        """Escribe lo pendiente y para el hilo escritor (se reabre al persistir de nuevo)."""
+        w, self._writer = self._writer, None
+        if w is not None:
+            w.close()
+            if self.debug:
+                print(f"[STORE] Escritor cerrado: {w.stats()}")
 
-    # --------------- API pública ---------------
+    def store_stats(self) -> dict:
+        return self._writer.stats() if self._writer is not None else {}
 
-    def send_text(self, text: str, destination: Optional[str] = None):
-        """Enviar texto (broadcast si destination es None)."""
-        d = mesh_pb2.Data()
-        d.portnum = portnums_pb2.TEXT_MESSAGE_APP
-        d.payload = text.encode('utf-8')
+    # --------------- captura ---------------
 
-        dest_id = BROADCAST_NUM if not destination else int(destination[1:], 16)
-        se = self._make_envelope(dest_id, d)
+    def start_capture(self, path: Optional[str] = None) -> Capturador:
+        """Empieza (o sigue, añadiendo una sesión) a grabar lo que llega a _on_message."""
+        self.stop_capture()
+        self.capture_path = path or self.capture_path
+        if not self.capture_path:
+            raise ConfigError("Falta la ruta de la captura")
+        self._capture = Capturador(self._abs_persist_path(self.capture_path))
+        if self.debug:
+            print(f"[CAPTURA] Grabando en {self._capture.path}")
+        return self._capture
+
+    def _resume_capture(self):
+        """Tras disconnect(), vuelve a grabar (otra sesión) si hay capture_path."""
+        if self.capture_path and self._capture is None:
+            self.start_capture()
+
+    def stop_capture(self) -> dict:
+        cap, self._capture = self._capture, None
+        if cap is None:
+            return {}
+        cap.close()
+        if self.debug:
+            print(f"[CAPTURA] Cerrada: {cap.stats()}")
+        return cap.stats()
+
+    # --------------- métricas ---------------
+
+    def _init_metrics(self):
+        """Crea los instrumentos una vez; el camino caliente sólo hace inc()/observe()."""
+        if self.metrics is None:
+            self.metrics = Metricas(enabled=False)
+        m = self.metrics
+        self._m_on = m.enabled
+        self._m_rx = m.contador("gw_rx_messages_total")
+        self._m_rx_bytes = m.contador("gw_rx_bytes_total")
+        self._m_dropped = m.contador("gw_rx_dropped_total")    # duplicados o no ServiceEnvelope
+        self._m_no_key = m.contador("gw_no_key_total")          # cifrado con un canal desconocido
+        self._m_tx = m.contador("gw_tx_messages_total")
+        self._m_tx_bytes = m.contador("gw_tx_bytes_total")
+        self._m_decode = m.histograma("gw_decode_seconds")
+        self._m_callback = m.histograma("gw_callback_seconds")
+        self._m_persist = m.histograma("gw_persist_seconds")    # un sink(lote) del escritor
+        # los medidores se leen al exportar: no cuestan nada por paquete
+        m.medidor("gw_persist_queue", lambda: self._writer.depth if self._writer is not None else 0)
+        m.medidor("gw_persist_dropped", lambda: self._writer.dropped if self._writer is not None else 0)
+        m.medidor("gw_pipeline_queue", lambda: self.pipeline_stats().get("queue_depth", 0))
+        m.medidor("gw_dedup_hits", lambda: self._dedup.hits if self._dedup is not None else 0)
+        m.medidor("gw_tx_inflight", lambda: self._tracker.inflight)
+        m.medidor("gw_nodes", lambda: len(self.nodes))
+        m.medidor("gw_recent", lambda: len(self.recent) if self.recent is not None else 0)
+
+    def _count_packet(self, p: Paquete):
+        """Paquetes por portnum y fallos de descifrado/decodificación (sólo con métricas activas)."""
+        if not p.decoded:
+            if p.hash is None:
+                self._m_no_key.inc()
+            else:
+                c = self._m_decrypt_errors.get(p.channel)
+                if c is None:
+                    c = self._m_decrypt_errors[p.channel] = self.metrics.contador(
+                        "gw_decrypt_errors_total", channel=p.channel)
+                c.inc()
+            return
+        c = self._m_ports.get(p.portnum)
+        if c is None:
+            c = self._m_ports[p.portnum] = self.metrics.contador("gw_rx_packets_total", portnum=p.portnum)
+        c.inc()
+        handler = protocols.get(p.portnum)
+        if p.pb is None and handler is not None and handler.protobufFactory:
+            c = self._m_decode_errors.get(p.portnum)
+            if c is None:
+                c = self._m_decode_errors[p.portnum] = self.metrics.contador(
+                    "gw_decode_errors_total", portnum=p.portnum)
+            c.inc()
 
-        self._client.publish(self._publish_topic, se.SerializeToString())
+    # --------------- API pública ---------------
 
-        # Persistencia (saliente)
-        self._persist({
-            "ts": _now_iso(),
-            "proto": "meshtastic",
-            "dir": "out",
+    def send_text(self, text: str, destination: Optional[str] = None,
+                  qos: Optional[int] = None) -> Future:
+        """Enviar texto (broadcast si destination es None). Devuelve el futuro de entrega."""
+        dest_id = BROADCAST_NUM if not destination else int(destination[1:], 16)
+        fut = self._send(dest_id, self._text_data(text), qos, {
             "type": "text",
-            "channel": self.channel,
             "destination": destination or "broadcast",
             "text": text
         })
 
         if self.debug:
             print(f"[GW] Enviado texto → {destination or 'broadcast'}: {text}")
+        return fut
 
-    def send_nodeinfo(self, want_response: bool = False):
+    def send_nodeinfo(self, want_response: bool = False, qos: Optional[int] = None) -> Future:
         """Enviar NodeInfo (identidad del nodo)."""
+        fut = self._send(BROADCAST_NUM, self._nodeinfo_data(want_response), qos, {
+            "type": "nodeinfo",
+            "gateway_id": self.node_name
+        })
+
+        if self.debug:
+            print(f"[GW] NodeInfo enviado")
+        return fut
+
+    def send_position(self, lat: float, lon: float, alt: float,
+                      qos: Optional[int] = None) -> Future:
+        """Enviar posición (lat/lon en grados, alt en metros)."""
+        fut = self._send(BROADCAST_NUM, self._position_data(lat, lon, alt), qos, {
+            "type": "position",
+            "lat": lat,
+            "lon": lon,
+            "alt": alt
+        })
+
+        if self.debug:
+            print(f"[GW] Posición enviada lat={lat}, lon={lon}, alt={alt}")
+        return fut
+
+    # --------------- envío en lote ---------------
+
+    def send_many(self, texts: Iterable[str], destination: Optional[str] = None,
+                  qos: Optional[int] = None) -> List[Future]:
+        """Envía muchos textos en tubería, con a lo sumo max_inflight sin confirmar."""
+        return [self.send_text(t, destination, qos) for t in texts]
+
+    def send_positions(self, positions: Iterable[tuple], qos: Optional[int] = None) -> List[Future]:
+        """Envía un track: iterable de (lat, lon, alt) o (lat, lon, alt, epoch)."""
+        futs = []
+        for pos in positions:
+            lat, lon, alt = pos[0], pos[1], pos[2]
+            ts = pos[3] if len(pos) > 3 else None
+            futs.append(self._send(BROADCAST_NUM, self._position_data(lat, lon, alt, ts), qos, {
+                "type": "position",
+                "lat": lat,
+                "lon": lon,
+                "alt": alt
+            }))
+        if self.debug:
+            print(f"[GW] {len(futs)} posiciones encoladas")
+        return futs
+
+    def wait_published(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que todas las publicaciones en vuelo estén confirmadas."""
+        return self._tracker.wait_all(timeout)
+
+    def publish_stats(self) -> dict:
+        return self._tracker.stats()
+
+    def _send(self, dest_id: int, data: mesh_pb2.Data, qos: Optional[int], record: dict) -> Future:
+        """Cifra, publica con control de ventana y persiste el registro saliente."""
+        se = self._make_envelope(dest_id, data)
+        q = self.publish_qos if qos is None else qos
+        if not self._publish_topic:
+            self._set_topics()
+        payload = se.SerializeToString()
+        fut = self._tracker.publish(lambda: self._client.publish(self._publish_topic, payload, qos=q), q)
+        self._m_tx.inc()
+        self._m_tx_bytes.inc(len(payload))
+
+        # Persistencia (saliente)
+        self._persist(dict({
+            "ts": _now_iso(),
+            "proto": "meshtastic",
+            "dir": "out",
+            "channel": self.channel,
+        }, **record))
+        return fut
+
+    def _text_data(self, text: str) -> mesh_pb2.Data:
+        d = mesh_pb2.Data()
+        d.portnum = portnums_pb2.TEXT_MESSAGE_APP
+        d.payload = text.encode('utf-8')
+        return d
+
+    def _nodeinfo_data(self, want_response: bool) -> mesh_pb2.Data:
         u = mesh_pb2.User()
         setattr(u, "id", self.node_name)
         setattr(u, "long_name", self.client_long)
@@ -149,146 +604,205 @@ class MeshtasticGateway:
         d.portnum = portnums_pb2.NODEINFO_APP
         d.payload = u.SerializeToString()
         d.want_response = want_response
+        return d
 
-        se = self._make_envelope(BROADCAST_NUM, d)
-        self._client.publish(self._publish_topic, se.SerializeToString())
-
-        self._persist({
-            "ts": _now_iso(),
-            "proto": "meshtastic",
-            "dir": "out",
-            "type": "nodeinfo",
-            "channel": self.channel,
-            "gateway_id": self.node_name
-        })
-
-        if self.debug:
-            print(f"[GW] NodeInfo enviado")
-
-    def send_position(self, lat: float, lon: float, alt: float):
-        """Enviar posición (lat/lon en grados, alt en metros)."""
+    def _position_data(self, lat: float, lon: float, alt: float,
+                       ts: Optional[float] = None) -> mesh_pb2.Data:
         p = mesh_pb2.Position()
         p.latitude_i = int(lat * 1e7)
         p.longitude_i = int(lon * 1e7)
         p.altitude = int(alt)
-        p.time = int(time.time())
+        p.time = int(time.time() if ts is None else ts)
 
         d = mesh_pb2.Data()
         d.portnum = portnums_pb2.POSITION_APP
         d.payload = p.SerializeToString()
         d.want_response = True
-
-        se = self._make_envelope(BROADCAST_NUM, d)
-        self._client.publish(self._publish_topic, se.SerializeToString())
-
-        self._persist({
-            "ts": _now_iso(),
-            "proto": "meshtastic",
-            "dir": "out",
-            "type": "position",
-            "channel": self.channel,
-            "lat": lat,
-            "lon": lon,
-            "alt": alt
-        })
-
-        if self.debug:
-            print(f"[GW] Posición enviada lat={lat}, lon={lon}, alt={alt}")
+        return d
 
     # --------------- callbacks MQTT ---------------
 
     def _on_connect(self, client, userdata, flags, reason_code, properties):
         self._set_topics()
+        self._connack_rc = reason_code
         if reason_code == 0:
             if self.debug:
                 print("[GW] Conectado. Suscribiendo…")
-            client.subscribe(self._subscribe_topic)
+            self._suback.clear()
+            _, self._sub_mid = client.subscribe([(t, 0) for t in self._sub_topics])
         else:
             print(f"[GW] Error de conexión: {reason_code}")
+        self._connack.set()
+
+    def _on_subscribe(self, client, userdata, mid, reason_code_list, properties):
+        if mid != self._sub_mid:
+            return  # p. ej. add_channel() con la sesión ya abierta
+        fallos = [str(rc) for rc in reason_code_list if rc.is_failure]
+        if fallos:
+            self._sub_error = ", ".join(fallos)
+            print(f"[GW] Suscripción rechazada: {self._sub_error}")
+        else:
+            self._sub_error = None
+            self._connected.set()
+            if self.debug:
+                print("[GW] Suscrito")
+        self._suback.set()
 
     def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._connected.clear()
         if self.debug:
             print(f"[GW] Desconectado (code={reason_code})")
 
+    @registrar_evento("gw._on_message")
     def _on_message(self, client, userdata, msg):
         """Procesa ServiceEnvelope → MeshPacket; descifra si es necesario; intenta decodificar el payload."""
-        se = mqtt_pb2.ServiceEnvelope()
-        try:
-            se.ParseFromString(msg.payload)
-            mp = se.packet
-        except Exception:
-            if self.debug:
-                print(f"[GW] No es ServiceEnvelope en {msg.topic}")
+        cap = self._capture
+        if cap is not None:
+            cap.escribir(msg.topic, msg.payload)
+        if self._m_on:
+            self._m_rx.inc()
+            self._m_rx_bytes.inc(len(msg.payload))
+        if self._pipeline is not None:
+            # modo tubería: el hilo de red sólo encola los bytes crudos
+            self._pipeline.submit(msg.topic, msg.payload)
+            return
+        if not self._m_on:
+            res = self._decode(msg.topic, msg.payload)
+        else:
+            t0 = time.perf_counter()
+            res = self._decode(msg.topic, msg.payload)
+            self._m_decode.observe(time.perf_counter() - t0)
+            if res is None:
+                self._m_dropped.inc()
+        if res is not None:
+            self._deliver(res)
+
+    def _decode(self, topic: str, payload: bytes) -> Optional[Paquete]:
+        fallback = None if self.listen_root else self._channel_hash
+        return _decode_envelope(topic, payload, self._keyring, fallback, self.debug,
+                                dedup=self._dedup)
+
+    def _wants_text(self) -> bool:
+        """¿Hay algún consumidor del texto renderizado?"""
+        if self.on_text or self.persist_text or self.debug:
+            return True
+        return any(c.on_text for c in self._keyring.values())
+
+    def _deliver(self, p: Paquete):
+        """Etapa de entrega: log, callbacks de usuario y persistencia."""
+        # En modo procesos la caché de duplicados vive aquí (no se comparte con los workers)
+        if self._dedup_on_deliver and p.packet_id and \
+                self._dedup.check(p.sender_num, p.packet_id, p.gateway_id):
+            if self._m_on:
+                self._m_dropped.inc()
             return
 
-        # Descifrar si viene cifrado
-        if mp.HasField("encrypted") and not mp.HasField("decoded"):
-            self._decrypt(mp)
-
-        port_num = mp.decoded.portnum if mp.HasField("decoded") else None
-        handler = protocols.get(port_num) if port_num is not None else None
+        self.nodes.observe(p)
+        if self.recent is not None:
+            self.recent.agregar(p)
+        if self._m_on:
+            self._count_packet(p)
 
-        texto: Optional[str] = None
-        if handler and handler.protobufFactory and mp.HasField("decoded"):
-            try:
-                pb = handler.protobufFactory()
-                pb.ParseFromString(mp.decoded.payload)
-                texto = str(pb).replace('\n', ' ').replace('\r', ' ').strip()
-            except Exception:
-                texto = None
+        canal = self._keyring.get(p.hash) if p.hash is not None else None
+        text_cb = (canal.on_text if canal is not None else None) or self.on_text
 
-        if texto is None and mp.HasField("decoded"):
-            # Intento de texto plano
-            try:
-                texto = mp.decoded.payload.decode('utf-8', errors='ignore')
-            except Exception:
-                texto = None
+        # str(pb) sólo se genera si alguien lo consume; el texto de un mensaje
+        # (sin protobuf) es el propio payload y sale barato
+        texto = p.texto if (text_cb or self.persist_text or self.debug or p.pb is None) else None
 
         # Log amigable
         if self.debug:
-            print(f"[GW][{port_num}] {texto if texto is not None else '<payload binario>'}")
+            print(f"[GW][{p.portnum}] {texto if texto is not None else '<payload binario>'}")
 
-        # Callback del usuario
-        if self.on_text and texto is not None:
+        # Callbacks del usuario: paquete estructurado y texto (el del canal tiene prioridad)
+        t0 = time.perf_counter() if self._m_on else 0.0
+        if self.on_packet:
+            try:
+                self.on_packet(p)
+            except Exception:
+                pass
+        if text_cb and texto is not None:
             try:
-                self.on_text(se.gateway_id or "unknown", texto)
+                text_cb(p.gateway_id or "unknown", texto)
             except Exception:
                 pass
+        if self._m_on and (self.on_packet or text_cb):
+            self._m_callback.observe(time.perf_counter() - t0)
 
         # Persistencia (entrante)
-        self._persist({
+        record = {
             "ts": _now_iso(),
             "proto": "meshtastic",
             "dir": "in",
-            "type": "decoded" if mp.HasField("decoded") else "encrypted",
-            "channel": se.channel_id or self.channel,
-            "gateway_id": se.gateway_id or "",
-            "topic": msg.topic,
-            "portnum": int(port_num) if port_num is not None else None,
+            "type": "decoded" if p.decoded else "encrypted",
+            "channel": p.channel or (canal.name if canal is not None else self.channel),
+            "tag": p.tag,
+            "gateway_id": p.gateway_id,
+            "topic": p.topic,
+            "from": p.sender,
+            "id": p.packet_id,
+            "portnum": p.portnum,
             "text": texto
-        })
+        }
+        if p.is_position:
+            record["lat"], record["lon"], record["alt"] = p.lat, p.lon, p.alt
+        elif p.portnum == portnums_pb2.NODEINFO_APP and p.pb is not None:
+            record["long_name"], record["short_name"] = p.pb.long_name, p.pb.short_name
+        self._persist(record)
 
-    # --------------- cifrado/descifrado ---------------
+    # --------------- tubería de decodificación ---------------
 
-    def _decrypt(self, mp: mesh_pb2.MeshPacket):
-        try:
-            key_bytes = base64.b64decode(self.key_b64.encode('ascii'))
-            nonce = mp.id.to_bytes(8, "little") + getattr(mp, "from").to_bytes(8, "little")
-            cipher = Cipher(algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend())
-            dec = cipher.decryptor()
-            decrypted = dec.update(getattr(mp, "encrypted")) + dec.finalize()
-            data = mesh_pb2.Data()
-            data.ParseFromString(decrypted)
-            mp.decoded.CopyFrom(data)
-        except Exception as e:
+    def _start_pipeline(self):
+        if self.pipeline_workers <= 0 or self._pipeline is not None:
+            return
+        self._refresh_crypto()
+        if self.pipeline_mode == MODO_PROCESOS:
+            # los procesos reciben una copia del anillo de claves al arrancar
+            canales = [(c.name, c.key_b64, c.tag) for c in self._keyring.values()]
+            fallback = None if self.listen_root else self._channel_hash
+            decode, init = _decode_worker, _init_decode_worker
+            initargs = (canales, fallback, self._wants_text())
+            self._dedup_on_deliver = self._dedup is not None
+        else:
+            decode, init, initargs = self._decode, None, ()
+        self._pipeline = DecodePipeline(
+            decode, self._deliver,
+            workers=self.pipeline_workers,
+            mode=self.pipeline_mode,
+            ordered=self.pipeline_ordered,
+            max_queue=self.pipeline_max_queue,
+            initializer=init, initargs=initargs,
+            debug=self.debug,
+            latencia=self._m_decode if self._m_on else None,
+            descartes=self._m_dropped if self._m_on else None,
+        )
+
+    def _stop_pipeline(self):
+        p, self._pipeline = self._pipeline, None
+        if p is not None:
+            p.close()
+            self._dedup_on_deliver = False
             if self.debug:
-                print(f"[GW] Error de descifrado: {e}")
+                print(f"[GW] Tubería cerrada: {p.stats()}")
+
+    def dedup_stats(self) -> dict:
+        return self._dedup.stats() if self._dedup is not None else {}
+
+    def relays_of(self, sender: str, packet_id: int) -> set:
+        """Gateways que han retransmitido el paquete (con dedup_track_relays)."""
+        if self._dedup is None:
+            return set()
+        return self._dedup.relays(int(sender.lstrip('!'), 16), packet_id)
+
+    def pipeline_stats(self) -> dict:
+        return self._pipeline.stats() if self._pipeline is not None else {}
+
+    # --------------- cifrado/descifrado ---------------
 
     def _encrypt(self, data: mesh_pb2.Data, mp: mesh_pb2.MeshPacket) -> bytes:
-        key_bytes = base64.b64decode(self.key_b64.encode('ascii'))
+        self._refresh_crypto()
         nonce = mp.id.to_bytes(8, "little") + self._node_number.to_bytes(8, "little")
-        cipher = Cipher(algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend())
-        enc = cipher.encryptor()
+        enc = Cipher(self._aes, modes.CTR(nonce)).encryptor()
         return enc.update(data.SerializeToString()) + enc.finalize()
 
     def _make_envelope(self, destination_id: int, data: mesh_pb2.Data) -> mqtt_pb2.ServiceEnvelope:
@@ -299,7 +813,8 @@ class MeshtasticGateway:
         setattr(mp, "from", self._node_number)
         mp.to = destination_id
         mp.want_ack = False
-        mp.channel = _topic_hash(self.channel, self.key_b64)
+        self._refresh_crypto()
+        mp.channel = self._channel_hash
         mp.hop_limit = 3
 
         # cifrado (siempre que haya key)
@@ -320,26 +835,107 @@ class MeshtasticGateway:
         padded = key_b64.ljust(len(key_b64) + ((4 - (len(key_b64) % 4)) % 4), '=')
         return padded.replace('-', '+').replace('_', '/')
 
+    def _refresh_crypto(self):
+        """Decodifica la clave y calcula el hash de canal sólo si channel/key_b64 han cambiado."""
+        src = (self.channel, self.key_b64)
+        if src == self._crypto_src:
+            return
+        key_b64 = self._normalize_key(self.key_b64)
+        self._key_bytes = base64.b64decode(key_b64.encode('ascii'))
+        self._aes = algorithms.AES(self._key_bytes)
+        old_hash = self._channel_hash if self._crypto_src else None
+        self._channel_hash = _xor_hash(self.channel.encode('utf-8')) ^ _xor_hash(self._key_bytes)
+        self._crypto_src = src
+
+        # El canal principal también vive en el anillo de claves
+        if old_hash is not None and old_hash in self._keyring and old_hash != self._channel_hash:
+            del self._keyring[old_hash]
+        entrada = self._keyring.get(self._channel_hash)
+        self._keyring[self._channel_hash] = _Canal(
+            self.channel, key_b64, self._aes, self._channel_hash,
+            entrada.on_text if entrada is not None else None,
+            entrada.tag if entrada is not None else None,
+        )
+
+    # --------------- anillo de claves ---------------
+
+    def add_channel(self, name: str, key_b64: str,
+                    on_text: Optional[Callable[[str, str], None]] = None,
+                    tag: Optional[str] = None) -> int:
+        """Añade un canal al anillo de claves y devuelve su hash de 8 bits."""
+        self._refresh_crypto()
+        canal = _build_canal(name, self._normalize_key(key_b64), on_text, tag)
+        prev = self._keyring.get(canal.hash)
+        if prev is not None and (prev.name, prev.key_b64) != (canal.name, canal.key_b64):
+            raise ConfigError(
+                f"El canal '{name}' colisiona con '{prev.name}' (hash {canal.hash}); "
+                "use otro gateway para uno de los dos")
+        self._keyring[canal.hash] = canal
+        self._sub_topics = self._subscribe_topics()
+        if self._client.is_connected() and not self.listen_root:
+            self._client.subscribe(self._channel_topic(name))
+        return canal.hash
+
+    def remove_channel(self, name: str):
+        if name == self.channel:
+            raise ConfigError("No se puede quitar el canal principal")
+        for h, canal in list(self._keyring.items()):
+            if canal.name == name:
+                del self._keyring[h]
+                self._sub_topics = self._subscribe_topics()
+                if self._client.is_connected() and not self.listen_root:
+                    self._client.unsubscribe(self._channel_topic(name))
+
+    def channels(self) -> List[str]:
+        return [c.name for c in self._keyring.values()]
+
+    def _channel_topic(self, name: str) -> str:
+        return f"{self.root_topic.rstrip('/')}/{name}/#"
+
+    def _subscribe_topics(self) -> List[str]:
+        if self.listen_root:
+            return [self.root_topic.rstrip('/') + '/#']
+        return [self._channel_topic(c.name) for c in self._keyring.values()]
+
     def _set_topics(self):
+        self._refresh_crypto()
         root = self.root_topic.rstrip('/') + '/'
-        self._subscribe_topic = f"{root}{self.channel}/#"
+        self._sub_topics = self._subscribe_topics()
         self._publish_topic = f"{root}{self.channel}/{self.node_name}"
         if self.debug:
-            print(f"[GW] sub={self._subscribe_topic} | pub={self._publish_topic}")
+            print(f"[GW] sub={', '.join(self._sub_topics)} | pub={self._publish_topic}")
 
-    def _abs_persist_path(self) -> str:
+    def _abs_persist_path(self, path: Optional[str] = None) -> str:
         # almacenar en ../data/data_store.json relativo a este archivo
-        base = os.path.join(os.path.dirname(__file__), self.persist_path)
+        base = os.path.join(os.path.dirname(__file__), path or self.persist_path)
         return os.path.normpath(base)
 
+    def _open_writer(self) -> BatchWriter:
+        if self.persist_backend == BACKEND_SQLITE:
+            sink = SqliteStore(self._abs_persist_path(self.persist_sqlite_path))
+        elif self.persist_codec == CODEC_JSON:
+            sink = JsonlSink(self._abs_persist_path())
+        else:
+            codec = codec_de(self.persist_codec)
+            sink = CodecSink(os.path.splitext(self._abs_persist_path())[0] + codec.extension, codec)
+        self._writer = BatchWriter(
+            sink,
+            max_queue=self.persist_max_queue,
+            batch_size=self.persist_batch_size,
+            flush_interval=self.persist_flush_interval,
+            name="gw-persist",
+            debug=self.debug,
+            latencia=self._m_persist if self._m_on else None,
+        )
+        return self._writer
+
+    @registrar_evento("gw._persist")
     def _persist(self, record: dict):
-        """Guarda en JSONL (una línea por registro) para no bloquear por tamaño."""
+        """Encola el registro; el hilo escritor lo guarda por lotes (JSONL o SQLite)."""
         try:
-            path = self._abs_persist_path()
-            _ensure_parent(path)
-            # Guardamos como JSON por línea (más robusto si hay concurrencia ligera)
-            with open(path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            w = self._writer or self._open_writer()
+            if not w.append(record) and self.debug:
+                print(f"[STORE] Cola llena, registro descartado ({w.dropped} en total)")
         except Exception as e:
             if self.debug:
                 print(f"[STORE] Error al persistir: {e}")
@@ -0,0 +1,445 @@
+from __future__ import annotations
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Histogramas: SUB cubetas por potencia de 2 → error relativo < 1/(2*SUB) (~6 %)
+_SUB = 8
+_EXP_MIN = -24   # 2**-24 s ≈ 60 ns
+_EXP_MAX = 12    # 2**12 s ≈ 68 min
+_N_CUBETAS = (_EXP_MAX - _EXP_MIN) * _SUB
+
+CUANTILES = (0.5, 0.9, 0.99)
+
+_frexp = math.frexp
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+def _clave(nombre: str, etiquetas: Dict) -> Tuple[str, Etiquetas]:
+    return nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def _limites(i: int) -> Tuple[float, float]:
+    e, j = divmod(i, _SUB)
+    e += _EXP_MIN
+    return (math.ldexp(0.5 + j / (2 * _SUB), e),
+            math.ldexp(0.5 + (j + 1) / (2 * _SUB), e))
+
+
+# --------------- instrumentos ---------------
+class Contador:
+    """
+    Contador monótono. Cada hilo suma en su propia celda (sin locks en el
+    camino caliente); la lectura agrega todas las celdas.
+    """
+    __slots__ = ("nombre", "etiquetas", "_tls", "_celdas", "_lock")
+
+    def __init__(self, nombre: str, etiquetas: Etiquetas = ()):
+        self.nombre = nombre
+        self.etiquetas = etiquetas
+        self._tls = threading.local()
+        self._celdas: List[list] = []
+        self._lock = threading.Lock()
+
+    def inc(self, n: int = 1):
+        try:
+            self._tls.c[0] += n
+        except AttributeError:
+            self._celda()[0] += n
+
+    def _celda(self) -> list:
+        c = self._tls.c = [0]
+        with self._lock:  # sólo la primera vez en cada hilo
+            self._celdas.append(c)
+        return c
+
+    @property
+    def valor(self) -> int:
+        return sum(c[0] for c in self._celdas)
+
+    def reset(self):
+        # celdas nuevas: poner a cero las vivas competiría con el inc() de otros hilos
+        with self._lock:
+            self._tls = threading.local()
+            self._celdas = []
+
+
+class Medidor:
+    """Valor instantáneo: se fija con set() o se lee de `fn` al exportar (coste cero por paquete)."""
+    __slots__ = ("nombre", "etiquetas", "fn", "_valor")
+
+    def __init__(self, nombre: str, etiquetas: Etiquetas = (), fn: Optional[Callable[[], float]] = None):
+        self.nombre = nombre
+        self.etiquetas = etiquetas
+        self.fn = fn
+        self._valor = 0.0
+
+    def set(self, v: float):
+        self._valor = v
+
+    @property
+    def valor(self) -> float:
+        if self.fn is None:
+            return self._valor
+        try:
+            return self.fn()
+        except Exception:
+            return float("nan")
+
+
+class _CeldaHist:
+    __slots__ = ("cuentas", "n", "suma", "min", "max")
+
+    def __init__(self):
+        self.cuentas = [0] * _N_CUBETAS
+        self.n = 0
+        self.suma = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+
+class Histograma:
+    """
+    Histograma de latencias (segundos) en cubetas logarítmicas fijas: observar
+    es un frexp y un incremento, sin locks (una celda por hilo). Los cuantiles
+    salen de las cubetas con un error relativo acotado (~6 %).
+    """
+    __slots__ = ("nombre", "etiquetas", "_tls", "_celdas", "_lock")
+
+    def __init__(self, nombre: str, etiquetas: Etiquetas = ()):
+        self.nombre = nombre
+        self.etiquetas = etiquetas
+        self._tls = threading.local()
+        self._celdas: List[_CeldaHist] = []
+        self._lock = threading.Lock()
+
+    def observe(self, v: float):
+        try:
+            c = self._tls.c
+        except AttributeError:
+            c = self._tls.c = _CeldaHist()
+            with self._lock:
+                self._celdas.append(c)
+        # índice de cubeta: v = m * 2**e con m en [0.5, 1)
+        if v > 0.0:
+            m, e = _frexp(v)
+            i = (e - _EXP_MIN) * _SUB + int((m - 0.5) * (2 * _SUB))
+            i = 0 if i < 0 else (i if i < _N_CUBETAS else _N_CUBETAS - 1)
+        else:
+            i = 0
+        c.cuentas[i] += 1
+        c.n += 1
+        c.suma += v
+        if v < c.min:
+            c.min = v
+        if v > c.max:
+            c.max = v
+
+    def reset(self):
+        # como en Contador: un observe() en curso acaba en la celda descartada
+        with self._lock:
+            self._tls = threading.local()
+            self._celdas = []
+
+    def tiempo(self) -> "_Cronometro":
+        """`with h.tiempo(): ...` observa la duración del bloque."""
+        return _Cronometro(self)
+
+    def _agregado(self) -> _CeldaHist:
+        total = _CeldaHist()
+        for c in list(self._celdas):
+            cuentas = total.cuentas
+            for i, k in enumerate(c.cuentas):
+                if k:
+                    cuentas[i] += k
+            total.n += c.n
+            total.suma += c.suma
+            total.min = min(total.min, c.min)
+            total.max = max(total.max, c.max)
+        return total
+
+    def cuantiles(self, qs=CUANTILES) -> Dict[float, float]:
+        return _cuantiles(self._agregado(), qs)
+
+    def resumen(self, qs=CUANTILES) -> Dict[str, float]:
+        a = self._agregado()
+        out = {"n": a.n, "sum": a.suma, "avg": a.suma / a.n if a.n else 0.0,
+               "min": a.min if a.n else 0.0, "max": a.max}
+        for q, v in _cuantiles(a, qs).items():
+            out[f"p{q * 100:g}"] = v
+        return out
+
+
+def _cuantiles(a: _CeldaHist, qs) -> Dict[float, float]:
+    out = {}
+    if not a.n:
+        return {q: 0.0 for q in qs}
+    for q in qs:
+        objetivo = q * a.n
+        acumulado = 0
+        for i, k in enumerate(a.cuentas):
+            acumulado += k
+            if k and acumulado >= objetivo:
+                lo, hi = _limites(i)
+                # punto medio de la cubeta, acotado por lo realmente observado
+                out[q] = min(max((lo + hi) / 2, a.min), a.max)
+                break
+        else:
+            out[q] = a.max
+    return out
+
+
+class _Cronometro:
+    __slots__ = ("h", "t0")
+
+    def __init__(self, h):
+        self.h = h
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.h.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class _Nulo:
+    """Instrumento de las métricas desactivadas: todas las operaciones son no-op."""
+    __slots__ = ()
+    nombre = ""
+    etiquetas: Etiquetas = ()
+    valor = 0
+
+    def inc(self, n: int = 1):
+        pass
+
+    def set(self, v: float):
+        pass
+
+    def observe(self, v: float):
+        pass
+
+    def reset(self):
+        pass
+
+    def tiempo(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULO = _Nulo()
+
+
+# --------------- registro ---------------
+class Metricas:
+    """
+    Registro de contadores, medidores e histogramas.
+
+    Los instrumentos se crean (o se recuperan) por nombre y etiquetas una vez
+    y se guardan en el objeto instrumentado; en el camino caliente sólo se
+    llama a inc()/observe(). Con `enabled=False` todos son el mismo objeto
+    nulo: nada se mide ni se formatea. Varios clientes pueden compartir un
+    registro (los nombres llevan prefijo: gw_, mqtt_...).
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._contadores: Dict[Tuple[str, Etiquetas], Contador] = {}
+        self._medidores: Dict[Tuple[str, Etiquetas], Medidor] = {}
+        self._histogramas: Dict[Tuple[str, Etiquetas], Histograma] = {}
+        self._lock = threading.Lock()
+        self.inicio = time.time()
+
+    def _obtener(self, tabla: Dict, cls, nombre: str, etiquetas: Dict, **kw):
+        if not self.enabled:
+            return NULO
+        clave = _clave(nombre, etiquetas)
+        inst = tabla.get(clave)
+        if inst is None:
+            with self._lock:
+                inst = tabla.get(clave)
+                if inst is None:
+                    inst = tabla[clave] = cls(nombre, clave[1], **kw)
+        return inst
+
+    def contador(self, nombre: str, **etiquetas) -> Contador:
+        return self._obtener(self._contadores, Contador, nombre, etiquetas)
+
+    def histograma(self, nombre: str, **etiquetas) -> Histograma:
+        return self._obtener(self._histogramas, Histograma, nombre, etiquetas)
+
+    def medidor(self, nombre: str, fn: Optional[Callable[[], float]] = None, **etiquetas) -> Medidor:
+        m = self._obtener(self._medidores, Medidor, nombre, etiquetas)
+        if fn is not None and m is not NULO:
+            m.fn = fn
+        return m
+
+    # -------- exportación --------
+    def snapshot(self) -> Dict:
+        """Estado actual como dict serializable a JSON."""
+        with self._lock:
+            contadores = list(self._contadores.values())
+            medidores = list(self._medidores.values())
+            histogramas = list(self._histogramas.values())
+        return {
+            "ts": time.time(),
+            "uptime": time.time() - self.inicio,
+            "counters": {_nombre(c): c.valor for c in contadores},
+            "gauges": {_nombre(m): m.valor for m in medidores},
+            "histograms": {_nombre(h): h.resumen() for h in histogramas},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def texto(self) -> str:
+        """Formato de exposición de texto de Prometheus (cuantiles como summary)."""
+        with self._lock:
+            contadores = sorted(self._contadores.values(), key=_nombre)
+            medidores = sorted(self._medidores.values(), key=_nombre)
+            histogramas = sorted(self._histogramas.values(), key=_nombre)
+        lineas = []
+        vistos = set()
+        for tipo, insts in (("counter", contadores), ("gauge", medidores)):
+            for i in insts:
+                if i.nombre not in vistos:
+                    vistos.add(i.nombre)
+                    lineas.append(f"# TYPE {i.nombre} {tipo}")
+                lineas.append(f"{_nombre(i)} {i.valor}")
+        for h in histogramas:
+            if h.nombre not in vistos:
+                vistos.add(h.nombre)
+                lineas.append(f"# TYPE {h.nombre} summary")
+            r = h.resumen()
+            for q in CUANTILES:
+                lineas.append(f"{_nombre(h, quantile=q)} {r[f'p{q * 100:g}']:.9g}")
+            lineas.append(f"{_nombre(h, sufijo='_sum')} {r['sum']:.9g}")
+            lineas.append(f"{_nombre(h, sufijo='_count')} {r['n']}")
+        return "\n".join(lineas) + "\n"
+
+
+def _nombre(inst, sufijo: str = "", **extra) -> str:
+    etiquetas = list(inst.etiquetas) + [(k, str(v)) for k, v in extra.items()]
+    if not etiquetas:
+        return inst.nombre + sufijo
+    return inst.nombre + sufijo + "{" + ",".join(f'{k}="{v}"' for k, v in etiquetas) + "}"
+
+
+def _tasas(actual: Dict, previo: Optional[Dict]) -> Dict[str, float]:
+    """Tasa por segundo de cada contador entre dos instantáneas."""
+    if previo is None:
+        return {}
+    dt = actual["ts"] - previo["ts"]
+    if dt <= 0:
+        return {}
+    anteriores = previo["counters"]
+    return {k: (v - anteriores.get(k, 0)) / dt for k, v in actual["counters"].items()}
+
+
+class ExportadorJSON:
+    """
+    Escribe periódicamente la instantánea (más las tasas por segundo desde la
+    anterior) en `path`, con fichero temporal + rename atómico.
+    """
+
+    def __init__(self, metricas: Metricas, path: str, interval: float = 10.0):
+        self.metricas = metricas
+        self.path = path
+        self.interval = interval
+        self._previo: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ExportadorJSON":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metricas-json", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.escribir()
+
+    def escribir(self):
+        snap = self.metricas.snapshot()
+        snap["rates"] = _tasas(snap, self._previo)
+        self._previo = snap
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.escribir()
+            except OSError:
+                pass
+
+
+class ServidorMetricas:
+    """
+    Endpoint HTTP local: GET /metrics (texto) y GET /metrics.json.
+    Escucha en 127.0.0.1 por defecto; port=0 elige un puerto libre.
+    """
+
+    def __init__(self, metricas: Metricas, port: int = 9108, host: str = "127.0.0.1"):
+        self.metricas = metricas
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                ruta = self.path.split("?", 1)[0]
+                if ruta in ("/", "/metrics"):
+                    cuerpo, tipo = metricas.texto(), "text/plain; version=0.0.4; charset=utf-8"
+                elif ruta == "/metrics.json":
+                    cuerpo, tipo = metricas.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                datos = cuerpo.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._httpd.server_address[:2]
+
+    def start(self) -> "ServidorMetricas":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name="metricas-http", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
@@ -1,19 +1,19 @@
 from __future__ import annotations
-import json, os, time
+import json, threading, time
 from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Callable, Dict, Optional
 import paho.mqtt.client as mqtt
-from exceptions import ConexionError, SuscripcionError  # استثناءات مخصصة
+from exceptions import ConexionError, ConfigError, SuscripcionError  # استثناءات مخصصة
+from segment_store import SegmentStore, FSYNC_LOTES
+from codec import CODEC_JSON, CODECS
+from batch_writer import BatchWriter
+from sqlite_store import BACKEND_JSONL, BACKEND_SQLITE, BACKENDS, SqliteStore
+from metricas import Metricas
 
 def _now_iso() -> str:
     return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
-def _ensure_parent(path: str):
-    parent = os.path.dirname(path)
-    if parent:
-        os.makedirs(parent, exist_ok=True)
-
 @dataclass
 class MqttClient:
     broker: str = "mqtt.meshtastic.org"
@@ -23,34 +23,98 @@ class MqttClient:
     client_id: str = ""
     data_store: str = "../data/data_store.json"
     debug: bool = False
+    timeout: float = 10.0  # segundos máximos esperando CONNACK / SUBACK
+
+    # Almacén segmentado (ver segment_store.py)
+    fsync: str = FSYNC_LOTES
+    segment_max_bytes: int = 8 * 1024 * 1024
+    segment_max_age: Optional[float] = None
+    codec: str = CODEC_JSON  # "json" | "bin" (segmentos binarios, ver codec.py)
+
+    # "jsonl" = segmentos JSONL; "sqlite" = base de datos WAL con inserciones por lotes
+    backend: str = BACKEND_JSONL
+    sqlite_path: str = "../data/data_store.db"
+
+    # Métricas (ver metricas.py); None → desactivadas
+    metrics: Optional[Metricas] = field(default=None, repr=False)
 
     _client: mqtt.Client = field(init=False, repr=False)
     _on_json: Optional[Callable[[str, Dict], None]] = field(default=None, init=False, repr=False)
     _on_text: Optional[Callable[[str, str], None]] = field(default=None, init=False, repr=False)
+    _store: object = field(default=None, init=False, repr=False)  # append/flush/close
+    _connack: threading.Event = field(default_factory=threading.Event, init=False, repr=False)
+    _connack_rc: object = field(default=None, init=False, repr=False)
+    # mid → [evento, error] de las suscripciones pendientes de SUBACK
+    _subacks: Dict[int, list] = field(default_factory=dict, init=False, repr=False)
+    _sub_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _m_on: bool = field(default=False, init=False, repr=False)
+    _m_persist_sync: bool = field(default=False, init=False, repr=False)
 
     def __post_init__(self):
         self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id or "")
         self._client.username_pw_set(self.username, self.password)
         self._client.on_connect = self._on_connect
         self._client.on_message = self._on_message
+        self._client.on_subscribe = self._on_subscribe
         self._client.on_disconnect = self._on_disconnect
+        if self.backend not in BACKENDS:
+            raise ConfigError(f"Backend de almacenamiento desconocido: {self.backend!r}")
+        if self.codec not in CODECS:
+            raise ConfigError(f"Codec desconocido: {self.codec!r}")
+        self._init_metrics()
+        try:
+            self._open_store()
+        except Exception as e:
+            if self.debug:
+                print(f"[STORE] No se pudo abrir el almacén: {e}")
+
+    def _init_metrics(self):
+        if self.metrics is None:
+            self.metrics = Metricas(enabled=False)
+        m = self.metrics
+        self._m_on = m.enabled
+        self._m_rx_json = m.contador("mqtt_rx_messages_total", kind="json")
+        self._m_rx_text = m.contador("mqtt_rx_messages_total", kind="text")
+        self._m_rx_bytes = m.contador("mqtt_rx_bytes_total")
+        self._m_tx = m.contador("mqtt_tx_messages_total")
+        self._m_tx_bytes = m.contador("mqtt_tx_bytes_total")
+        self._m_callback = m.histograma("mqtt_callback_seconds")
+        # SegmentStore escribe en append(); con SQLite se mide cada lote del escritor
+        self._m_persist = m.histograma("mqtt_persist_seconds")
+        self._m_persist_sync = self._m_on and self.backend != BACKEND_SQLITE
+        m.medidor("mqtt_persist_queue", lambda: getattr(self._store, "depth", 0))
 
     # -------- API --------
     def connect(self):
+        """Conecta y bloquea hasta el CONNACK (ConexionError si falla o vence `timeout`)."""
         if self.debug:
             print(f"[MQTT] Conectando {self.broker}:{self.port}…")
+        self._connack.clear()
+        self._connack_rc = None
         try:
             self._client.connect(self.broker, int(self.port), 60)
         except Exception as e:
             raise ConexionError(f"Fallo conectando a {self.broker}:{self.port} → {e}") from e
         self._client.loop_start()
-        time.sleep(0.5)
+        error = None
+        if not self._connack.wait(self.timeout):
+            error = f"Sin CONNACK de {self.broker}:{self.port} en {self.timeout}s"
+        elif self._connack_rc != 0:
+            error = f"Conexión rechazada por {self.broker}:{self.port}: {self._connack_rc}"
+        if error:
+            self._client.disconnect()
+            self._client.loop_stop()
+            raise ConexionError(error)
 
     def disconnect(self):
         try:
             self._client.disconnect()
         finally:
             self._client.loop_stop()
+            # se reabre al persistir de nuevo (ver _persist)
+            store, self._store = self._store, None
+            if store is not None:
+                store.close()
 
     def subscribe(self, topic: str, on_json: Optional[Callable[[str, Dict], None]] = None,
                   on_text: Optional[Callable[[str, str], None]] = None):
@@ -58,22 +122,40 @@ class MqttClient:
         self._on_text = on_text
         if self.debug:
             print(f"[MQTT] Suscribiendo a {topic}")
+        espera = [threading.Event(), None]
         try:
-            self._client.subscribe(topic)
+            # el lock impide que el SUBACK se procese antes de registrar el mid
+            with self._sub_lock:
+                rc, mid = self._client.subscribe(topic)
+                if rc != mqtt.MQTT_ERR_SUCCESS:
+                    raise SuscripcionError(mqtt.error_string(rc))
+                self._subacks[mid] = espera
         except Exception as e:
             raise SuscripcionError(f"No se pudo suscribir al tópico '{topic}': {e}") from e
+        if not espera[0].wait(self.timeout):
+            with self._sub_lock:
+                self._subacks.pop(mid, None)
+            raise SuscripcionError(f"Sin SUBACK para '{topic}' en {self.timeout}s")
+        if espera[1]:
+            raise SuscripcionError(f"Suscripción a '{topic}' rechazada: {espera[1]}")
 
     def publish_json(self, topic: str, payload: Dict):
         body = json.dumps(payload, ensure_ascii=False)
         if self.debug:
             print(f"[MQTT] Publish {topic}: {body}")
-        self._client.publish(topic, body)
+        data = body.encode("utf-8")  # se cuentan bytes, no caracteres
+        self._client.publish(topic, data)
+        self._m_tx.inc()
+        self._m_tx_bytes.inc(len(data))
         self._persist({"topic": topic, "json": payload, "ts": _now_iso()})
 
     def publish_text(self, topic: str, text: str):
         if self.debug:
             print(f"[MQTT] Publish {topic}: {text}")
-        self._client.publish(topic, text)
+        data = text.encode("utf-8")
+        self._client.publish(topic, data)
+        self._m_tx.inc()
+        self._m_tx_bytes.inc(len(data))
         self._persist({"topic": topic, "text": text, "ts": _now_iso()})
 
     # -------- callbacks --------
@@ -82,6 +164,17 @@ class MqttClient:
             print("[MQTT] Conectado")
         elif reason_code != 0:
             print(f"[MQTT] Error de conexión: {reason_code}")
+        self._connack_rc = reason_code
+        self._connack.set()
+
+    def _on_subscribe(self, client, userdata, mid, reason_code_list, properties):
+        with self._sub_lock:
+            espera = self._subacks.pop(mid, None)
+        if espera is None:
+            return
+        fallos = [str(rc) for rc in reason_code_list if rc.is_failure]
+        espera[1] = ", ".join(fallos) or None
+        espera[0].set()
 
     def _on_disconnect(self, client, userdata, flags, reason_code, properties):
         if self.debug:
@@ -89,11 +182,13 @@ class MqttClient:
 
     def _on_message(self, client, userdata, msg):
         payload = msg.payload.decode('utf-8', errors='ignore')
+        self._m_rx_bytes.inc(len(msg.payload))
         # intentar JSON
         try:
             data = json.loads(payload)
             if self._on_json:
-                self._on_json(msg.topic, data)
+                self._callback(self._on_json, msg.topic, data)
+            self._m_rx_json.inc()
             self._persist({"topic": msg.topic, "json": data, "ts": _now_iso()})
             if self.debug:
                 print(f"[MQTT] JSON {msg.topic}: {data}")
@@ -102,25 +197,43 @@ class MqttClient:
             pass
         # texto
         if self._on_text:
-            self._on_text(msg.topic, payload)
+            self._callback(self._on_text, msg.topic, payload)
+        self._m_rx_text.inc()
         self._persist({"topic": msg.topic, "text": payload, "ts": _now_iso()})
         if self.debug:
             print(f"[MQTT] TEXT {msg.topic}: {payload}")
 
+    def _callback(self, fn, topic: str, dato):
+        if not self._m_on:
+            fn(topic, dato)
+            return
+        t0 = time.perf_counter()
+        try:
+            fn(topic, dato)
+        finally:
+            self._m_callback.observe(time.perf_counter() - t0)
+
     # -------- almacenamiento --------
+    def _open_store(self):
+        if self.backend == BACKEND_SQLITE:
+            self._store = BatchWriter(SqliteStore(self.sqlite_path), name="mqtt-persist", debug=self.debug,
+                                      latencia=self._m_persist if self._m_on else None)
+        else:
+            self._store = SegmentStore(self.data_store, max_bytes=self.segment_max_bytes,
+                                       max_age=self.segment_max_age, fsync=self.fsync,
+                                       codec=self.codec)
+        return self._store
+
     def _persist(self, record: Dict):
+        """Añade el registro al segmento activo o a la cola de SQLite (O(1), sin reescribir el histórico)."""
         try:
-            _ensure_parent(self.data_store)
-            items = []
-            if os.path.exists(self.data_store):
-                with open(self.data_store, 'r', encoding='utf-8') as f:
-                    try:
-                        items = json.load(f)
-                    except Exception:
-                        items = []
-            items.append(record)
-            with open(self.data_store, 'w', encoding='utf-8') as f:
-                json.dump(items, f, indent=2, ensure_ascii=False)
+            store = self._store or self._open_store()
+            if self._m_persist_sync:
+                t0 = time.perf_counter()
+                store.append(record)
+                self._m_persist.observe(time.perf_counter() - t0)
+            else:
+                store.append(record)
         except Exception as e:
             if self.debug:
                 print(f"[STORE] Error: {e}")
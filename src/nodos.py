@@ -0,0 +1,216 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union
+
+from meshtastic.protobuf import mesh_pb2
+
+from paquete import NODEINFO_APP, Paquete, node_id
+
+Clave = Union[int, str]
+
+
+def num_de(clave: Clave) -> int:
+    """Número de nodo desde 123456, '!0001e240' o '0001e240'."""
+    if isinstance(clave, int):
+        return clave
+    clave = clave.strip()
+    return int(clave[1:] if clave.startswith("!") else clave, 16)
+
+
+def _hw_nombre(hw: int) -> str:
+    try:
+        return mesh_pb2.HardwareModel.Name(hw)
+    except ValueError:
+        return str(hw)
+
+
+class Nodo:
+    """Estado conocido de un nodo de la malla."""
+    __slots__ = ("num", "long_name", "short_name", "hw_model", "lat", "lon", "alt",
+                 "last_heard", "last_position", "gateway_id", "paquetes")
+
+    def __init__(self, num: int):
+        self.num = num
+        self.long_name: Optional[str] = None
+        self.short_name: Optional[str] = None
+        self.hw_model: Optional[str] = None
+        self.lat: Optional[float] = None
+        self.lon: Optional[float] = None
+        self.alt: Optional[float] = None
+        self.last_heard = 0.0      # epoch del último paquete
+        self.last_position = 0.0   # epoch de la última posición
+        self.gateway_id: Optional[str] = None
+        self.paquetes = 0
+
+    @property
+    def id(self) -> str:
+        return node_id(self.num)
+
+    @property
+    def nombre(self) -> str:
+        """Nombre para mostrar: largo, corto o el !hex."""
+        return self.long_name or self.short_name or self.id
+
+    def to_dict(self) -> Dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "Nodo":
+        n = cls(int(d["num"]))
+        for k in cls.__slots__[1:]:
+            if k in d:
+                setattr(n, k, d[k])
+        return n
+
+    def __repr__(self):
+        return f"<Nodo {self.id} {self.nombre!r} heard={self.last_heard:.0f}>"
+
+
+class NodeDB:
+    """
+    Tabla de nodos de la malla, mantenida por el gateway con cada paquete.
+
+    Un OrderedDict por número de nodo en orden de última escucha: la consulta
+    es O(1) y los nodos caducados (más de `ttl` segundos sin oírse) o los que
+    sobran por encima de `max_nodes` salen por el principio. Si hay
+    `snapshot_path`, la tabla se guarda cada `snapshot_interval` segundos y
+    se recupera al crearla (arranque en caliente).
+    """
+
+    def __init__(self, max_nodes: int = 10000, ttl: Optional[float] = 7 * 24 * 3600,
+                 snapshot_path: Optional[str] = None, snapshot_interval: float = 60.0):
+        self.max_nodes = max_nodes
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.evictions = 0
+
+        self._nodos: "OrderedDict[int, Nodo]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._ultimo_snapshot = time.monotonic()
+        self._sucio = False
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load(snapshot_path)
+
+    # -------- consultas --------
+    def get(self, clave: Clave) -> Optional[Nodo]:
+        try:
+            return self._nodos.get(num_de(clave))
+        except ValueError:
+            return None
+
+    def __contains__(self, clave: Clave) -> bool:
+        return self.get(clave) is not None
+
+    def __len__(self) -> int:
+        return len(self._nodos)
+
+    def nombre(self, clave: Clave) -> str:
+        """Nombre del nodo si se conoce; si no, el propio identificador."""
+        n = self.get(clave)
+        if n is not None:
+            return n.nombre
+        return clave if isinstance(clave, str) else node_id(clave)
+
+    def nodos(self) -> List[Nodo]:
+        """Del más reciente al más antiguo."""
+        with self._lock:
+            return list(reversed(self._nodos.values()))
+
+    def online(self, segundos: float = 900.0) -> List[Nodo]:
+        """Nodos oídos en los últimos `segundos`."""
+        limite = time.time() - segundos
+        out = []
+        with self._lock:
+            for n in reversed(self._nodos.values()):
+                if n.last_heard < limite:
+                    break
+                out.append(n)
+        return out
+
+    # -------- actualización --------
+    def observe(self, p: Paquete, ahora: Optional[float] = None):
+        """Actualiza la tabla con un paquete recibido (cualquier portnum)."""
+        if not p.sender_num:
+            return
+        ahora = time.time() if ahora is None else ahora
+        with self._lock:
+            n = self._nodos.get(p.sender_num)
+            if n is None:
+                n = self._nodos[p.sender_num] = Nodo(p.sender_num)
+            else:
+                self._nodos.move_to_end(p.sender_num)
+            n.last_heard = ahora
+            n.paquetes += 1
+            if p.gateway_id:
+                n.gateway_id = p.gateway_id
+            if p.portnum == NODEINFO_APP and p.pb is not None:
+                u = p.pb
+                n.long_name = u.long_name or n.long_name
+                n.short_name = u.short_name or n.short_name
+                n.hw_model = _hw_nombre(u.hw_model)
+            elif p.is_position:
+                n.lat, n.lon, n.alt = p.lat, p.lon, p.alt
+                n.last_position = ahora
+            self._sucio = True
+            self._expire(ahora)
+        self.maybe_snapshot()
+
+    def _expire(self, ahora: float):
+        nodos = self._nodos
+        while len(nodos) > self.max_nodes:
+            nodos.popitem(last=False)
+            self.evictions += 1
+        if self.ttl is not None:
+            limite = ahora - self.ttl
+            while nodos:
+                primero = next(iter(nodos.values()))
+                if primero.last_heard >= limite:
+                    break
+                nodos.popitem(last=False)
+                self.evictions += 1
+
+    # -------- persistencia --------
+    def maybe_snapshot(self):
+        if not (self.snapshot_path and self._sucio):
+            return
+        if time.monotonic() - self._ultimo_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self, path: Optional[str] = None):
+        """Guarda la tabla (temporal + rename atómico)."""
+        path = path or self.snapshot_path
+        if not path:
+            return
+        with self._lock:
+            datos = [n.to_dict() for n in self._nodos.values()]
+            self._sucio = False
+            self._ultimo_snapshot = time.monotonic()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"nodos": datos}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def load(self, path: str):
+        """Recupera una instantánea (en orden de última escucha) y purga lo caducado."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                datos = json.load(f).get("nodos", [])
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for d in sorted(datos, key=lambda d: d.get("last_heard", 0.0)):
+                n = Nodo.from_dict(d)
+                self._nodos[n.num] = n
+                self._nodos.move_to_end(n.num)
+            self._expire(time.time())
+
+    def stats(self) -> Dict[str, int]:
+        return {"nodes": len(self._nodos), "evictions": self.evictions}
@@ -0,0 +1,95 @@
+from __future__ import annotations
+from typing import Any, Optional
+
+from meshtastic.protobuf import portnums_pb2
+
+POSITION_APP = portnums_pb2.POSITION_APP
+NODEINFO_APP = portnums_pb2.NODEINFO_APP
+TEXT_MESSAGE_APP = portnums_pb2.TEXT_MESSAGE_APP
+
+
+def node_id(num: int) -> str:
+    """Número de nodo → identificador '!hex' de Meshtastic."""
+    return f"!{num:08x}"
+
+
+class Paquete:
+    """
+    Paquete Meshtastic ya decodificado.
+
+    `pb` es el protobuf del payload (Position, User…) si el portnum lo tiene;
+    para posiciones se extraen lat/lon/alt como números. El texto sólo se
+    genera (y se cachea) al pedir `texto`.
+    """
+    __slots__ = ("sender_num", "to", "packet_id", "gateway_id", "channel", "hash", "tag",
+                 "topic", "portnum", "decoded", "pb", "payload", "lat", "lon", "alt",
+                 "rx_time", "_texto")
+
+    def __init__(self, sender_num: int = 0, to: int = 0, packet_id: int = 0,
+                 gateway_id: str = "", channel: str = "", hash: Optional[int] = None,
+                 tag: Optional[str] = None, topic: str = "", portnum: Optional[int] = None,
+                 decoded: bool = False, pb: Any = None, payload: bytes = b"",
+                 rx_time: int = 0):
+        self.sender_num = sender_num
+        self.to = to
+        self.packet_id = packet_id
+        self.gateway_id = gateway_id
+        self.channel = channel
+        self.hash = hash
+        self.tag = tag
+        self.topic = topic
+        self.portnum = portnum
+        self.decoded = decoded
+        self.pb = pb
+        self.payload = payload
+        self.rx_time = rx_time
+        self.lat: Optional[float] = None
+        self.lon: Optional[float] = None
+        self.alt: Optional[float] = None
+        self._texto: Any = None
+        if portnum == POSITION_APP and pb is not None:
+            self._extract_position(pb)
+
+    @property
+    def sender(self) -> str:
+        return node_id(self.sender_num)
+
+    @property
+    def origen(self) -> str:
+        """Nodo que lo envió; sólo si no consta (from = 0), el gateway que lo retransmitió."""
+        if self.sender_num:
+            return self.sender
+        return self.gateway_id or "unknown"
+
+    @property
+    def is_position(self) -> bool:
+        return self.lat is not None and self.lon is not None
+
+    @property
+    def texto(self) -> Optional[str]:
+        """Representación de texto compatible con el antiguo on_text (perezosa)."""
+        if self._texto is None:
+            self._texto = self._render()
+        return self._texto or None
+
+    def _render(self) -> str:
+        if not self.decoded:
+            return ""
+        if self.pb is not None:
+            return str(self.pb).replace('\n', ' ').replace('\r', ' ').strip()
+        return self.payload.decode('utf-8', errors='ignore')
+
+    def _extract_position(self, pb):
+        # latitude_i/longitude_i son opcionales: 0 también es una coordenada válida
+        try:
+            tiene = pb.HasField("latitude_i") and pb.HasField("longitude_i")
+        except ValueError:
+            tiene = bool(pb.latitude_i or pb.longitude_i)
+        if tiene:
+            self.lat = pb.latitude_i / 1e7
+            self.lon = pb.longitude_i / 1e7
+            self.alt = float(pb.altitude_hae or pb.altitude or 0)
+
+    def __repr__(self):
+        pos = f" lat={self.lat} lon={self.lon} alt={self.alt}" if self.is_position else ""
+        return f"<Paquete {self.sender} port={self.portnum} id={self.packet_id}{pos}>"
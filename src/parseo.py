@@ -0,0 +1,159 @@
+from __future__ import annotations
+import json
+import re
+from typing import Iterable, List, Optional, Tuple, Union
+
+from google.protobuf.message import DecodeError
+from meshtastic.protobuf import mesh_pb2
+
+# (lat, lon, alt)
+Posicion = Tuple[float, float, float]
+
+FORMATO_VACIO = "vacio"
+FORMATO_JSON = "json"
+FORMATO_PROTO_TEXTO = "proto_texto"  # str(mesh_pb2.Position): "latitude_i: ... longitude_i: ..."
+FORMATO_BINARIO = "binario"          # Position serializado
+
+# Un único recorrido: todos los "clave: número" que interesan, en cualquier orden
+_RE_CAMPOS = re.compile(r"\b(latitude_i|longitude_i|altitude_hae|altitude|alt|time):\s*(-?\d+(?:\.\d+)?)")
+_ALTITUDES = ("altitude_hae", "altitude", "alt")
+_ESPACIOS = " \t\r\n"
+_ETIQUETA_LONGITUD = b"\x15"  # campo 2 (longitude_i), tipo 5 (32 bits)
+
+
+def detectar_formato(dato: Union[str, bytes]) -> str:
+    """Mira sólo el primer carácter (o los primeros bytes) significativo, sin intentar parsear."""
+    if isinstance(dato, (bytes, bytearray, memoryview)):
+        b = bytes(dato[:6])
+        if not b:
+            return FORMATO_VACIO
+        if b[0] == 0x0D:
+            # 0x0d es "\r" pero también la etiqueta de latitude_i (sfixed32) con la
+            # que empieza todo Position: es texto sólo si sigue "\n" y no la de longitude_i
+            if len(b) > 1 and (b[1:2] != b"\n" or b[5:6] == _ETIQUETA_LONGITUD):
+                return FORMATO_BINARIO
+        elif b[0] < 0x20 and b[0] not in (0x09, 0x0A):
+            return FORMATO_BINARIO  # etiqueta protobuf (0x10 longitude_i, 0x18 altitude...)
+        try:
+            dato = bytes(dato).decode("utf-8")
+        except UnicodeDecodeError:
+            return FORMATO_BINARIO
+    s = dato.lstrip(_ESPACIOS)
+    if not s:
+        return FORMATO_VACIO
+    return FORMATO_JSON if s[0] in "{[" else FORMATO_PROTO_TEXTO
+
+
+def posicion_texto(texto: str) -> Optional[Posicion]:
+    """Posición desde el texto de un mesh_pb2.Position (una o varias líneas)."""
+    if "latitude_i" not in texto:
+        return None
+    campos = dict(_RE_CAMPOS.findall(texto))
+    lat, lon = campos.get("latitude_i"), campos.get("longitude_i")
+    if lat is None or lon is None or "." in lat or "." in lon:
+        return None
+    alt = next((campos[k] for k in _ALTITUDES if k in campos), "0")
+    return int(lat) / 1e7, int(lon) / 1e7, float(alt)
+
+
+def posicion_json(texto: Union[str, bytes]) -> Optional[Posicion]:
+    """Posición desde el JSON {"msg", "lat", "long"|"lon"|"longitude", "alt"} que envía el mapa."""
+    try:
+        payload = json.loads(texto)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    lat = payload.get("lat")
+    lon = payload.get("long") or payload.get("lon") or payload.get("longitude")
+    if lat is None or lon is None:
+        return None
+    try:
+        return float(lat), float(lon), float(payload.get("alt") or 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def posicion_binaria(dato: bytes) -> Optional[Posicion]:
+    """Posición desde un mesh_pb2.Position serializado."""
+    pos = mesh_pb2.Position()
+    try:
+        pos.ParseFromString(bytes(dato))
+    except DecodeError:
+        return None
+    if not (pos.HasField("latitude_i") and pos.HasField("longitude_i")):
+        return None
+    alt = pos.altitude_hae if pos.HasField("altitude_hae") else pos.altitude
+    return pos.latitude_i / 1e7, pos.longitude_i / 1e7, float(alt)
+
+
+_POR_FORMATO = {
+    FORMATO_JSON: posicion_json,
+    FORMATO_PROTO_TEXTO: posicion_texto,
+    FORMATO_BINARIO: posicion_binaria,
+}
+
+
+def parsear_posicion(dato: Union[str, bytes]) -> Optional[Posicion]:
+    """Encamina por formato y devuelve (lat, lon, alt) o None."""
+    fmt = detectar_formato(dato)
+    fn = _POR_FORMATO.get(fmt)
+    if fn is None:
+        return None
+    if fmt == FORMATO_PROTO_TEXTO and not isinstance(dato, str):
+        dato = bytes(dato).decode("utf-8")
+    return fn(dato)
+
+
+# --------------- lotes ---------------
+def parsear_lineas(lineas: Iterable[Union[str, bytes]]) -> List[Optional[Posicion]]:
+    """Una posición (o None) por línea/mensaje."""
+    return [parsear_posicion(l) for l in lineas]
+
+
+def leer_registros(path: str) -> List[dict]:
+    """Registros de data_store.json: array JSON, JSONL, o array seguido de líneas JSONL."""
+    with open(path, "r", encoding="utf-8") as f:
+        contenido = f.read()
+    resto = contenido.lstrip()
+    registros: list = []
+    if resto.startswith("["):
+        registros, fin = json.JSONDecoder().raw_decode(resto)
+        resto = resto[fin:]
+    for linea in resto.splitlines():
+        linea = linea.strip()
+        if linea:
+            try:
+                registros.append(json.loads(linea))
+            except ValueError:
+                continue  # línea truncada
+    return registros
+
+
+def parsear_archivo(path: str) -> List[Tuple[str, Posicion]]:
+    """
+    Posiciones de un data_store.json: [(nodo, (lat, lon, alt))].
+    Los registros nuevos con lat/lon numéricos se toman tal cual.
+    """
+    out = []
+    for r in leer_registros(path):
+        pos = posicion_registro(r)
+        if pos is not None:
+            out.append((r.get("from") or r.get("meshtastic_from") or "?", pos))
+    return out
+
+
+def posicion_registro(r: dict) -> Optional[Posicion]:
+    """Posición de un registro de data_store.json."""
+    if r.get("lat") is not None and r.get("lon") is not None:
+        return float(r["lat"]), float(r["lon"]), float(r.get("alt") or 0.0)
+    texto = r.get("text")
+    return parsear_posicion(texto) if texto else None
+
+
+def tiempo_texto(texto: str) -> Optional[int]:
+    """Campo `time` (epoch) del texto de un Position, si lo trae."""
+    for k, v in _RE_CAMPOS.findall(texto):
+        if k == "time":
+            return int(v)
+    return None
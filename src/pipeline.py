@@ -0,0 +1,208 @@
+from __future__ import annotations
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+MODO_HILOS = "thread"
+MODO_PROCESOS = "process"
+
+_FIN = object()  # centinela de cierre
+
+
+def _run_timed(fn: Callable, topic: str, payload: bytes) -> Tuple[Any, float]:
+    """Ejecuta la etapa de decodificación y devuelve (resultado, segundos)."""
+    t0 = time.perf_counter()
+    res = fn(topic, payload)
+    return res, time.perf_counter() - t0
+
+
+class _Latencia:
+    """Acumulador mínimo de latencias (n, media, máximo) en segundos."""
+    __slots__ = ("n", "total", "max")
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, s: float):
+        self.n += 1
+        self.total += s
+        if s > self.max:
+            self.max = s
+
+    def as_dict(self) -> Dict[str, float]:
+        media = self.total / self.n if self.n else 0.0
+        return {"n": self.n, "avg_ms": media * 1e3, "max_ms": self.max * 1e3}
+
+
+class DecodePipeline:
+    """
+    Tubería de recepción en tres etapas:
+
+      1. `submit(topic, payload)`: el hilo de red sólo encola bytes crudos.
+      2. Un pool (hilos o procesos) ejecuta `decode(topic, payload)`.
+      3. Un hilo de entrega llama a `deliver(resultado)` en orden de llegada
+         (`ordered=True`) o según terminan (`ordered=False`).
+
+    En modo procesos `decode` debe ser una función de módulo (picklable);
+    el estado que necesite se inyecta con `initializer`/`initargs`.
+    """
+
+    def __init__(self, decode: Callable[[str, bytes], Any], deliver: Callable[[Any], None],
+                 workers: int = 4, mode: str = MODO_HILOS, ordered: bool = True,
+                 max_queue: int = 10000, max_inflight: Optional[int] = None,
+                 initializer: Optional[Callable] = None, initargs: tuple = (),
+                 debug: bool = False, latencia=None, descartes=None):
+        if mode not in (MODO_HILOS, MODO_PROCESOS):
+            raise ValueError(f"Modo de tubería desconocido: {mode!r}")
+        self.decode = decode
+        self.deliver = deliver
+        self.workers = workers
+        self.mode = mode
+        self.ordered = ordered
+        self.debug = debug
+        self.latencia = latencia    # histograma (metricas.Histograma) del trabajo de decode
+        self.descartes = descartes  # contador (metricas.Contador) de resultados None
+
+        # Contadores
+        self.submitted = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.errors = 0
+
+        # Latencias por etapa
+        self.lat_queue = _Latencia()    # encolado → enviado al pool
+        self.lat_decode = _Latencia()   # trabajo del pool
+        self.lat_deliver = _Latencia()  # callback + persistencia
+        self.lat_total = _Latencia()    # encolado → entregado
+
+        self._in: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._out: "queue.Queue" = queue.Queue()
+        self._inflight = threading.BoundedSemaphore(max_inflight or workers * 4)
+        self._pending = 0  # enviados al pool y aún no entregados
+        self._pending_lock = threading.Lock()
+        self._closed = False
+
+        if mode == MODO_PROCESOS:
+            self._pool: Executor = ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+        else:
+            self._pool = ThreadPoolExecutor(workers, thread_name_prefix="gw-decode",
+                                            initializer=initializer, initargs=initargs)
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="gw-dispatch", daemon=True)
+        self._deliverer = threading.Thread(target=self._deliver_loop, name="gw-deliver", daemon=True)
+        self._dispatcher.start()
+        self._deliverer.start()
+
+    # -------- API --------
+    def submit(self, topic: str, payload: bytes) -> bool:
+        """Encola un mensaje crudo. No bloquea: si la cola está llena se descarta."""
+        if self._closed:
+            self.dropped += 1
+            return False
+        try:
+            self._in.put_nowait((time.perf_counter(), topic, bytes(payload)))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Procesa todo lo encolado y detiene pool e hilos."""
+        if self._closed:
+            return
+        self._closed = True
+        self._in.put(_FIN)
+        self._dispatcher.join(timeout)
+        self._deliverer.join(timeout)
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "ordered": self.ordered,
+            "queue_depth": self._in.qsize(),
+            "delivery_depth": self._out.qsize(),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "delivered": self.delivered,
+            "errors": self.errors,
+            "latency": {
+                "queue": self.lat_queue.as_dict(),
+                "decode": self.lat_decode.as_dict(),
+                "deliver": self.lat_deliver.as_dict(),
+                "total": self.lat_total.as_dict(),
+            },
+        }
+
+    # -------- etapas --------
+    def _dispatch_loop(self):
+        while True:
+            item = self._in.get()
+            if item is _FIN:
+                self._out.put(_FIN)
+                return
+            t_enq, topic, payload = item
+            self._inflight.acquire()  # contrapresión: no más de max_inflight en el pool
+            self.lat_queue.add(time.perf_counter() - t_enq)
+            with self._pending_lock:
+                self._pending += 1
+            try:
+                fut = self._pool.submit(_run_timed, self.decode, topic, payload)
+            except Exception as e:
+                self._inflight.release()
+                with self._pending_lock:
+                    self._pending -= 1
+                self.errors += 1
+                if self.debug:
+                    print(f"[PIPE] Error al enviar al pool: {e}")
+                continue
+            if self.ordered:
+                self._out.put((t_enq, fut))
+            else:
+                fut.add_done_callback(lambda f, t=t_enq: self._out.put((t, f)))
+
+    def _deliver_loop(self):
+        while True:
+            item = self._out.get()
+            if item is _FIN:
+                # en modo desordenado pueden quedar futuros detrás del centinela
+                while self._pending:
+                    self._deliver_one(*self._out.get())
+                return
+            self._deliver_one(*item)
+
+    def _deliver_one(self, t_enq: float, fut: Future):
+        try:
+            res, t_decode = fut.result()
+        except Exception as e:
+            self.errors += 1
+            if self.debug:
+                print(f"[PIPE] Error decodificando: {e}")
+            return
+        finally:
+            self._inflight.release()
+            with self._pending_lock:
+                self._pending -= 1
+        self.lat_decode.add(t_decode)
+        if self.latencia is not None:
+            self.latencia.observe(t_decode)
+        if res is None:
+            if self.descartes is not None:
+                self.descartes.inc()
+            return
+        t0 = time.perf_counter()
+        try:
+            self.deliver(res)
+            self.delivered += 1
+        except Exception as e:
+            self.errors += 1
+            if self.debug:
+                print(f"[PIPE] Error entregando: {e}")
+        fin = time.perf_counter()
+        self.lat_deliver.add(fin - t0)
+        self.lat_total.add(fin - t_enq)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Set, Tuple
+
+import paho.mqtt.client as mqtt
+
+from exceptions import PublicacionError
+
+
+class PublishTracker:
+    """
+    Ventana de publicaciones en vuelo con futuros de entrega.
+
+    Cada `publish()` ocupa un hueco de la ventana (`max_inflight`) hasta que
+    paho confirma el envío en `on_publish` (QoS 0: escrito en el socket;
+    QoS 1/2: PUBACK/PUBCOMP). El futuro devuelto se resuelve con el `mid`.
+
+    Quien no pueda bloquear (el hilo de un event loop que además atiende el
+    socket) reserva el hueco con `reservar()` sin esperar, y la siguiente
+    `publish()` de ese hilo lo consume; `on_hueco` avisa cada vez que se libera uno.
+    """
+
+    def __init__(self, max_inflight: int = 20, timeout: float = 10.0):
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+
+        self.published = 0
+        self.completed = 0
+        self.failed = 0
+        self._lat_total = 0.0
+        self._lat_max = 0.0
+        self._t_first = 0.0
+        self._t_last = 0.0
+
+        self._window = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._vacio = threading.Condition(self._lock)  # se avisa al quedar _pending vacío
+        self._local = threading.local()                # hueco reservado por este hilo
+        self.on_hueco: Optional[Callable[[], None]] = None
+        self._pending: Dict[int, Tuple[Future, float]] = {}
+        self._early: Set[int] = set()  # on_publish llegó antes de registrar el mid
+
+    def publish(self, send: Callable[[], mqtt.MQTTMessageInfo], qos: int = 0) -> Future:
+        """Espera hueco en la ventana, ejecuta `send()` y devuelve el futuro de entrega."""
+        if getattr(self._local, "reservado", False):
+            self._local.reservado = False
+        elif not self._window.acquire(timeout=self.timeout):
+            raise PublicacionError(f"Ventana de {self.max_inflight} publicaciones llena durante {self.timeout}s")
+        fut: Future = Future()
+        t0 = time.perf_counter()
+        try:
+            info = send()
+        except Exception as e:
+            self._liberar()
+            self.failed += 1
+            raise PublicacionError(f"No se pudo publicar: {e}") from e
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and not (info.rc == mqtt.MQTT_ERR_NO_CONN and qos > 0):
+            # NO_CONN con QoS > 0: paho lo encola y lo enviará al reconectar
+            self._liberar()
+            self.failed += 1
+            fut.set_exception(PublicacionError(mqtt.error_string(info.rc)))
+            return fut
+        with self._lock:
+            self.published += 1
+            if not self._t_first:
+                self._t_first = t0
+            if info.mid in self._early:
+                self._early.discard(info.mid)
+                listo = True
+            else:
+                self._pending[info.mid] = (fut, t0)
+                listo = False
+        if listo:
+            self._complete(fut, info.mid, t0, None)
+        return fut
+
+    def reservar(self) -> bool:
+        """Ocupa un hueco sin esperar; la próxima publish() de este hilo lo usa."""
+        if getattr(self._local, "reservado", False):
+            return True
+        if not self._window.acquire(blocking=False):
+            return False
+        self._local.reservado = True
+        return True
+
+    def anular_reserva(self):
+        """Devuelve el hueco reservado si al final no se ha publicado."""
+        if getattr(self._local, "reservado", False):
+            self._local.reservado = False
+            self._liberar()
+
+    def _liberar(self):
+        self._window.release()
+        if self.on_hueco is not None:
+            self.on_hueco()
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        with self._lock:
+            entrada = self._pending.pop(mid, None)
+            if entrada is None:
+                self._early.add(mid)
+                return
+            if not self._pending:
+                self._vacio.notify_all()
+        fut, t0 = entrada
+        self._complete(fut, mid, t0, reason_code)
+
+    def _complete(self, fut: Future, mid: int, t0: float, reason_code):
+        ahora = time.perf_counter()
+        self._liberar()
+        if reason_code is not None and getattr(reason_code, "is_failure", False):
+            self.failed += 1
+            fut.set_exception(PublicacionError(f"Publicación {mid} rechazada: {reason_code}"))
+            return
+        lat = ahora - t0
+        with self._lock:
+            self.completed += 1
+            self._lat_total += lat
+            if lat > self._lat_max:
+                self._lat_max = lat
+            self._t_last = ahora
+        fut.set_result(mid)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._pending)
+
+    def wait_all(self, timeout: float = None) -> bool:
+        """Espera a que no quede nada en vuelo."""
+        with self._vacio:
+            return self._vacio.wait_for(lambda: not self._pending, timeout)
+
+    def stats(self) -> Dict[str, float]:
+        dur = self._t_last - self._t_first
+        return {
+            "published": self.published,
+            "completed": self.completed,
+            "failed": self.failed,
+            "inflight": self.inflight,
+            "avg_latency_ms": (self._lat_total / self.completed * 1e3) if self.completed else 0.0,
+            "max_latency_ms": self._lat_max * 1e3,
+            "rate_per_s": (self.completed / dur) if dur > 0 else 0.0,
+        }
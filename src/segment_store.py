@@ -0,0 +1,180 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from codec import CODEC_JSON, CODECS, Codec, codec_de
+
+# Políticas de fsync admitidas
+FSYNC_SIEMPRE = "always"   # fsync tras cada registro
+FSYNC_LOTES = "batch"      # fsync cada `fsync_every` registros o `fsync_interval` segundos
+FSYNC_NUNCA = "none"       # sólo flush al SO
+_POLITICAS = (FSYNC_SIEMPRE, FSYNC_LOTES, FSYNC_NUNCA)
+
+_PREFIJO = "seg-"
+_CODEC_POR_EXTENSION: Dict[str, Codec] = {c.extension: c for c in CODECS.values()}
+
+
+def listar_segmentos(directorio: str) -> List[str]:
+    """
+    Segmentos (de cualquier codec) de `directorio` en orden de escritura. Un
+    número repetido con otra extensión (almacenes anteriores a que la
+    numeración fuera común) se ordena por fecha de modificación.
+    """
+    rutas = [os.path.join(directorio, n) for n in os.listdir(directorio)
+             if n.startswith(_PREFIJO) and os.path.splitext(n)[1] in _CODEC_POR_EXTENSION]
+    rutas.sort(key=lambda r: (SegmentStore._seq_of(r), os.path.getmtime(r)))
+    return rutas
+
+
+def _segment_dir(path: str) -> str:
+    """../data/data_store.json → ../data/data_store.segments"""
+    base, _ = os.path.splitext(path)
+    return base + ".segments"
+
+
+class SegmentStore:
+    """
+    Almacén append-only en segmentos JSONL (o binarios, con codec="bin").
+
+    Cada registro se añade como una línea al segmento activo; al superar
+    `max_bytes` o `max_age` segundos se abre un segmento nuevo. Nunca se
+    reescribe lo ya guardado, así que el coste por registro es O(1).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 8 * 1024 * 1024,
+                 max_age: Optional[float] = None, fsync: str = FSYNC_LOTES,
+                 fsync_every: int = 64, fsync_interval: float = 1.0,
+                 migrate: bool = True, codec: str = CODEC_JSON):
+        if fsync not in _POLITICAS:
+            raise ValueError(f"Política de fsync desconocida: {fsync!r}")
+        self.path = path
+        self.dir = _segment_dir(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync = fsync
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.codec = codec_de(codec)
+        self.sufijo = self.codec.extension  # seg-000001.jsonl / seg-000001.bin
+
+        self._lock = threading.Lock()
+        self._f = None
+        self._seq = 0
+        self._size = 0
+        self._opened_at = 0.0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+        os.makedirs(self.dir, exist_ok=True)
+        if migrate:
+            self._migrate_legacy()
+
+    # -------- API --------
+    def append(self, record: Dict):
+        line = self.codec.codificar(record)
+        with self._lock:
+            if self._f is None or self._must_rotate(len(line)):
+                self._rotate()
+            self._f.write(line)
+            self._size += len(line)
+            self._pending += 1
+            self._sync_if_needed()
+
+    def flush(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.flush()
+                if self.fsync != FSYNC_NUNCA and self._pending:
+                    os.fsync(self._f.fileno())
+                self._pending = 0
+                self._last_sync = time.monotonic()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+    def segments(self) -> List[str]:
+        """Rutas de los segmentos (de cualquier codec) en orden de escritura."""
+        return listar_segmentos(self.dir)
+
+    def __iter__(self) -> Iterator[Dict]:
+        self.flush()
+        for seg in self.segments():
+            with open(seg, "rb") as f:
+                # cada segmento con el codec con que se escribió; lo dañado se salta
+                yield from _CODEC_POR_EXTENSION[os.path.splitext(seg)[1]].leer(f)
+
+    # -------- segmentos --------
+    def _must_rotate(self, extra: int) -> bool:
+        if self.max_bytes and self._size and self._size + extra > self.max_bytes:
+            return True
+        if self.max_age is not None and time.monotonic() - self._opened_at >= self.max_age:
+            return True
+        return False
+
+    def _rotate(self):
+        if self._f is not None:
+            self._f.flush()
+            if self.fsync != FSYNC_NUNCA:
+                os.fsync(self._f.fileno())
+            self._f.close()
+            self._seq += 1
+        else:
+            # primer segmento: continuar tras el último existente (sea cual sea su codec)
+            existentes = self.segments()
+            self._seq = self._seq_of(existentes[-1]) + 1 if existentes else 1
+        seg = os.path.join(self.dir, f"{_PREFIJO}{self._seq:06d}{self.sufijo}")
+        self._f = open(seg, "ab")
+        if self._f.tell() == 0 and self.codec.cabecera:
+            self._f.write(self.codec.cabecera)
+        self._size = self._f.tell()
+        self._opened_at = time.monotonic()
+        self._pending = 0
+
+    @staticmethod
+    def _seq_of(seg: str) -> int:
+        nombre, _ = os.path.splitext(os.path.basename(seg))
+        return int(nombre[len(_PREFIJO):])
+
+    def _sync_if_needed(self):
+        if self.fsync == FSYNC_SIEMPRE:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._pending = 0
+        elif self.fsync == FSYNC_LOTES:
+            ahora = time.monotonic()
+            if self._pending >= self.fsync_every or ahora - self._last_sync >= self.fsync_interval:
+                self._f.flush()
+                os.fsync(self._f.fileno())
+                self._pending = 0
+                self._last_sync = ahora
+        # FSYNC_NUNCA: el buffer se vacía al rotar/cerrar o con flush()
+
+    # -------- migración --------
+    def _migrate_legacy(self):
+        """Importa una sola vez el array JSON antiguo de `path` al primer segmento."""
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            inicio = f.read(64).lstrip()
+            if not inicio.startswith("["):
+                # no es el formato array (p. ej. JSONL del gateway): no se toca
+                return
+            f.seek(0)
+            try:
+                items = json.load(f)
+            except ValueError:
+                return
+        with self._lock:
+            self._rotate()
+            self._f.write(self.codec.codificar_lote(items))
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._size = self._f.tell()
+        os.replace(self.path, self.path + ".migrated")
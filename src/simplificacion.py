@@ -0,0 +1,143 @@
+from __future__ import annotations
+import math
+from array import array
+from typing import List, Optional, Sequence
+
+from track import RADIO_TIERRA, Track, haversine
+
+try:  # NumPy es opcional: si está, RDP calcula las distancias de cada tramo en bloque
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_M_POR_RAD = RADIO_TIERRA
+
+
+class FiltroStreaming:
+    """
+    Filtro de fixes en tiempo real: descarta un fix si está a menos de
+    `min_metros` del último aceptado, salvo que hayan pasado `max_segundos`
+    (latido, para que un nodo parado siga apareciendo). Los fixes que llegan
+    a menos de `min_segundos` del último aceptado se descartan siempre.
+    """
+
+    def __init__(self, min_metros: float = 10.0, min_segundos: float = 0.0,
+                 max_segundos: Optional[float] = 300.0):
+        self.min_metros = min_metros
+        self.min_segundos = min_segundos
+        self.max_segundos = max_segundos
+        self.aceptados = 0
+        self.descartados = 0
+        self._ultimo = None  # (t, lat, lon)
+
+    def acepta(self, t: float, lat: float, lon: float) -> bool:
+        u = self._ultimo
+        if u is not None:
+            dt = t - u[0]
+            if dt < self.min_segundos or (
+                    (self.max_segundos is None or dt < self.max_segundos)
+                    and haversine(u[1], u[2], lat, lon) < self.min_metros):
+                self.descartados += 1
+                return False
+        self._ultimo = (t, lat, lon)
+        self.aceptados += 1
+        return True
+
+    def reset(self):
+        self._ultimo = None
+
+
+def filtrar_track(track: Track, min_metros: float = 10.0, min_segundos: float = 0.0,
+                  max_segundos: Optional[float] = 300.0) -> Track:
+    """Aplica FiltroStreaming a un track ya guardado."""
+    f = FiltroStreaming(min_metros, min_segundos, max_segundos)
+    return track._subset(i for i, (t, la, lo) in enumerate(zip(track.t, track.lat, track.lon))
+                         if f.acepta(t, la, lo))
+
+
+# --------------- Ramer–Douglas–Peucker ---------------
+def rdp(lat: Sequence[float], lon: Sequence[float], tolerancia_m: float) -> List[int]:
+    """
+    Índices de los puntos que conserva RDP con la tolerancia dada (metros).
+    Iterativo (pila explícita), sobre una proyección equirectangular local:
+    sobra precisión para las distancias de un track.
+    """
+    n = len(lat)
+    if n <= 2:
+        return list(range(n))
+    if np is not None:
+        return _rdp_numpy(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64), tolerancia_m)
+
+    coslat = math.cos(math.radians(sum(lat) / n))
+    x = [math.radians(v) * coslat * _M_POR_RAD for v in lon]
+    y = [math.radians(v) * _M_POR_RAD for v in lat]
+    tol2 = tolerancia_m * tolerancia_m
+    conservar = bytearray(n)
+    conservar[0] = conservar[n - 1] = 1
+    pila = [(0, n - 1)]
+    while pila:
+        i, j = pila.pop()
+        if j - i < 2:
+            continue
+        x0, y0 = x[i], y[i]
+        dx, dy = x[j] - x0, y[j] - y0
+        largo2 = dx * dx + dy * dy
+        peor, peor_d2 = -1, tol2
+        for k in range(i + 1, j):
+            px, py = x[k] - x0, y[k] - y0
+            if largo2 > 0:
+                c = px * dy - py * dx
+                d2 = c * c / largo2
+            else:
+                d2 = px * px + py * py
+            if d2 > peor_d2:
+                peor, peor_d2 = k, d2
+        if peor >= 0:
+            conservar[peor] = 1
+            pila.append((i, peor))
+            pila.append((peor, j))
+    return [k for k in range(n) if conservar[k]]
+
+
+def _rdp_numpy(lat, lon, tolerancia_m: float) -> List[int]:
+    n = len(lat)
+    coslat = math.cos(math.radians(float(lat.mean())))
+    x = np.radians(lon) * coslat * _M_POR_RAD
+    y = np.radians(lat) * _M_POR_RAD
+    tol2 = tolerancia_m * tolerancia_m
+    conservar = np.zeros(n, dtype=bool)
+    conservar[0] = conservar[-1] = True
+    pila = [(0, n - 1)]
+    while pila:
+        i, j = pila.pop()
+        if j - i < 2:
+            continue
+        px = x[i + 1:j] - x[i]
+        py = y[i + 1:j] - y[i]
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        largo2 = dx * dx + dy * dy
+        if largo2 > 0:
+            d2 = (px * dy - py * dx) ** 2 / largo2
+        else:
+            d2 = px * px + py * py
+        k = int(d2.argmax())
+        if d2[k] > tol2:
+            k += i + 1
+            conservar[k] = True
+            pila.append((i, k))
+            pila.append((k, j))
+    return np.flatnonzero(conservar).tolist()
+
+
+def simplificar_track(track: Track, tolerancia_m: float = 5.0) -> Track:
+    """Track con los fixes que conserva RDP."""
+    return track._subset(rdp(track.lat, track.lon, tolerancia_m))
+
+
+def simplificar_puntos(puntos: Sequence[tuple], tolerancia_m: float = 5.0) -> list:
+    """RDP sobre una lista de (lat, lon), p. ej. para map_widget.set_path."""
+    if len(puntos) <= 2:
+        return list(puntos)
+    lat = array("d", (p[0] for p in puntos))
+    lon = array("d", (p[1] for p in puntos))
+    return [puntos[i] for i in rdp(lat, lon, tolerancia_m)]
@@ -0,0 +1,224 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dispositivo import Dispositivo
+from historial import FiltroHistorial, iterar_registros, nodo_de, tipo_de, ts_de
+from parseo import posicion_registro
+
+# Backends de persistencia (sección "almacen" de la config)
+BACKEND_JSONL = "jsonl"
+BACKEND_SQLITE = "sqlite"
+BACKENDS = (BACKEND_JSONL, BACKEND_SQLITE)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS registros (
+    id         INTEGER PRIMARY KEY,
+    ts         TEXT,
+    node       TEXT,
+    kind       TEXT,
+    dir        TEXT,
+    channel    TEXT,
+    portnum    INTEGER,
+    topic      TEXT,
+    gateway_id TEXT,
+    packet_id  INTEGER,
+    text       TEXT,
+    lat        REAL,
+    lon        REAL,
+    alt        REAL,
+    raw        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_registros_node_ts ON registros(node, ts);
+CREATE INDEX IF NOT EXISTS ix_registros_ts ON registros(ts);
+CREATE INDEX IF NOT EXISTS ix_registros_portnum ON registros(portnum);
+CREATE INDEX IF NOT EXISTS ix_registros_channel ON registros(channel);
+"""
+
+# Búsqueda de texto completo si el SQLite trae FTS5 (si no, se usa LIKE)
+_ESQUEMA_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS registros_fts USING fts5(text, content='registros', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS registros_fts_ai AFTER INSERT ON registros WHEN new.text IS NOT NULL BEGIN
+    INSERT INTO registros_fts(rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+_INSERT = ("INSERT INTO registros (ts, node, kind, dir, channel, portnum, topic, gateway_id, "
+           "packet_id, text, lat, lon, alt, raw) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def _fila(r: Dict) -> Tuple:
+    texto = r.get("text")
+    if texto is None and "json" in r:
+        texto = json.dumps(r["json"], ensure_ascii=False)
+    portnum = r.get("portnum")
+    tipo = tipo_de(r)
+    # los registros antiguos sólo traen el texto del Position
+    pos = posicion_registro(r) if tipo == "position" else None
+    lat, lon, alt = pos if pos is not None else (None, None, None)
+    return (
+        ts_de(r), nodo_de(r), tipo, r.get("dir"), r.get("channel"),
+        portnum if isinstance(portnum, int) else None,
+        r.get("topic"), r.get("gateway_id"), r.get("id"), texto,
+        lat, lon, alt,
+        json.dumps(r, ensure_ascii=False),
+    )
+
+
+class SqliteStore:
+    """
+    Base de datos SQLite (modo WAL) con los registros de los gateways.
+
+    Se usa como sink de BatchWriter: cada llamada con un lote es una única
+    transacción con executemany. Las consultas aprovechan los índices por
+    (node, ts), ts, portnum y channel.
+    """
+
+    def __init__(self, path: str, fts: bool = True):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        # el hilo escritor de BatchWriter y el que consulta comparten la conexión
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.executescript(_ESQUEMA)
+        self.fts = False
+        if fts:
+            try:
+                self._con.executescript(_ESQUEMA_FTS)
+                self.fts = True
+            except sqlite3.OperationalError:
+                pass
+        self._con.commit()
+
+    # -------- escritura --------
+    def __call__(self, records: List[Dict]):
+        self.insert_many(records)
+
+    def insert_many(self, records: Iterable[Dict]) -> int:
+        filas = [_fila(r) for r in records]
+        with self._lock, self._con:
+            self._con.executemany(_INSERT, filas)
+        return len(filas)
+
+    def close(self):
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    # -------- consultas --------
+    def _consulta(self, sql: str, params: Tuple = (), lote: int = 1000) -> Iterator[Tuple]:
+        """Filas de la consulta en streaming: el lock sólo se toma por cada lote de fetchmany."""
+        with self._lock:
+            cur = self._con.execute(sql, params)
+        try:
+            while True:
+                with self._lock:
+                    filas = cur.fetchmany(lote)
+                if not filas:
+                    return
+                yield from filas
+        finally:
+            with self._lock:
+                if self._con is not None:
+                    cur.close()
+
+    def __len__(self) -> int:
+        return next(self._consulta("SELECT COUNT(*) FROM registros"))[0]
+
+    def conteo_por_nodo(self) -> Dict[str, int]:
+        return dict(self._consulta(
+            "SELECT node, COUNT(*) FROM registros WHERE node IS NOT NULL GROUP BY node ORDER BY 2 DESC"))
+
+    def ultima_vez(self) -> Dict[str, str]:
+        """Último ts visto de cada nodo."""
+        return dict(self._consulta(
+            "SELECT node, MAX(ts) FROM registros WHERE node IS NOT NULL GROUP BY node"))
+
+    def posiciones(self, node: str, since: Optional[str] = None,
+                   until: Optional[str] = None) -> List[Tuple[str, float, float, float]]:
+        """[(ts, lat, lon, alt)] de un nodo, en orden temporal (índice node, ts)."""
+        sql = "SELECT ts, lat, lon, alt FROM registros WHERE node = ? AND lat IS NOT NULL"
+        params: list = [node]
+        if since:
+            sql += " AND ts >= ?"
+            params.append(since)
+        if until:
+            sql += " AND ts < ?"
+            params.append(until)
+        return list(self._consulta(sql + " ORDER BY ts", tuple(params)))
+
+    def buscar(self, texto: str, limit: int = 100) -> List[Dict]:
+        """Registros cuyo texto contiene `texto` (FTS5 si está disponible)."""
+        if self.fts:
+            filas = self._consulta(
+                "SELECT r.raw FROM registros_fts f JOIN registros r ON r.id = f.rowid "
+                "WHERE registros_fts MATCH ? ORDER BY r.id LIMIT ?",
+                ('"' + texto.replace('"', '""') + '"', limit))
+        else:
+            filas = self._consulta("SELECT raw FROM registros WHERE text LIKE ? ORDER BY id LIMIT ?",
+                                   (f"%{texto}%", limit))
+        return [json.loads(f[0]) for f in filas]
+
+    def registros(self, filtro: Optional[FiltroHistorial] = None,
+                  limit: Optional[int] = None) -> Iterator[Dict]:
+        """Mismo filtro que historial.iterar_registros, resuelto con los índices."""
+        filtro = filtro or FiltroHistorial()
+        condiciones, params = [], []
+        for columna, op, valor in (("node", "=", filtro.node), ("kind", "=", filtro.tipo),
+                                   ("ts", ">=", filtro.since), ("ts", "<", filtro.until)):
+            if valor:
+                condiciones.append(f"{columna} {op} ?")
+                params.append(valor)
+        sql = "SELECT raw FROM registros"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for (raw,) in self._consulta(sql, tuple(params)):
+            yield json.loads(raw)
+
+    # -------- importación --------
+    def importar_data_store(self, path: str, lote: int = 5000) -> int:
+        """Importa data_store.json (array, JSONL y segmentos) por lotes."""
+        n = 0
+        buf: List[Dict] = []
+        for r in iterar_registros(path):
+            buf.append(r)
+            if len(buf) >= lote:
+                n += self.insert_many(buf)
+                buf = []
+        return n + self.insert_many(buf)
+
+    def importar_dispositivo(self, path: str) -> int:
+        """Importa el historial y las posiciones de un dispositivo.json."""
+        disp = Dispositivo.cargar(path)
+        registros = [{
+            "ts": _iso_z(m["fecha"]), "proto": disp.protocolo, "dir": "local", "type": "text",
+            "from": disp.nombre, "destination": m.get("destino"), "origen": m.get("origen"),
+            "text": m.get("mensaje"),
+        } for m in disp.historial]
+        registros.extend({
+            "ts": _iso_epoch(t), "proto": disp.protocolo, "dir": "local", "type": "position",
+            "from": disp.nombre, "lat": lat, "lon": lon, "alt": alt,
+        } for t, lat, lon, alt in disp.posiciones.rows())
+        return self.insert_many(registros)
+
+
+def _iso_epoch(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _iso_z(fecha: str) -> str:
+    """isoformat() de Dispositivo (UTC sin zona) → formato de ts de data_store."""
+    return datetime.fromisoformat(fecha).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -0,0 +1,205 @@
+from __future__ import annotations
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:  # NumPy es opcional: si está, las consultas se vectorizan
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# Formato binario: cabecera de 8 bytes + registros (t, lat, lon, alt) en float64 little-endian
+MAGIC = b"TRK1\x00\x00\x00\x00"
+_REG = struct.Struct("<dddd")
+RADIO_TIERRA = 6371008.8  # metros
+
+
+def _iso(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _epoch(fecha: str) -> float:
+    return datetime.fromisoformat(fecha).replace(tzinfo=timezone.utc).timestamp()
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia en metros entre dos puntos (grados)."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * RADIO_TIERRA * math.asin(math.sqrt(a))
+
+
+class Track:
+    """
+    Track de posiciones en columnas paralelas array('d'): tiempo (epoch s),
+    lat, lon y alt. Añadir es O(1) y cuesta 32 bytes por fix.
+
+    Se asume que los fixes llegan en orden temporal (como en registrar_posicion),
+    lo que permite consultas por tiempo con búsqueda binaria.
+    """
+    __slots__ = ("t", "lat", "lon", "alt")
+
+    def __init__(self):
+        self.t = array("d")
+        self.lat = array("d")
+        self.lon = array("d")
+        self.alt = array("d")
+
+    # -------- construcción --------
+    def append(self, t: float, lat: float, lon: float, alt: float = 0.0):
+        self.t.append(t)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.alt.append(alt)
+
+    def append_dict(self, r: Dict):
+        """Registro antiguo {"fecha", "lat", "lon", "alt"} → fila."""
+        self.append(_epoch(r["fecha"]), r["lat"], r["lon"], r.get("alt", 0.0))
+
+    @classmethod
+    def from_dicts(cls, registros) -> "Track":
+        tr = cls()
+        for r in registros:
+            tr.append_dict(r)
+        return tr
+
+    # -------- compatibilidad con la lista de dicts --------
+    def __len__(self) -> int:
+        return len(self.t)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            tr = Track()
+            tr.t, tr.lat, tr.lon, tr.alt = self.t[i], self.lat[i], self.lon[i], self.alt[i]
+            return tr
+        return {"fecha": _iso(self.t[i]), "lat": self.lat[i], "lon": self.lon[i], "alt": self.alt[i]}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self.t)):
+            yield self[i]
+
+    def __eq__(self, other):
+        if isinstance(other, Track):
+            return (self.t, self.lat, self.lon, self.alt) == (other.t, other.lat, other.lon, other.alt)
+        return NotImplemented
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[float, float, float, float]]:
+        stop = len(self) if stop is None else stop
+        return zip(self.t[start:stop], self.lat[start:stop], self.lon[start:stop], self.alt[start:stop])
+
+    def nbytes(self) -> int:
+        return sum(c.itemsize * len(c) for c in (self.t, self.lat, self.lon, self.alt))
+
+    def _subset(self, indices) -> "Track":
+        tr = Track()
+        for i in indices:
+            tr.append(self.t[i], self.lat[i], self.lon[i], self.alt[i])
+        return tr
+
+    # -------- consultas --------
+    def last(self, n: int) -> "Track":
+        return self[max(0, len(self) - n):]
+
+    def time_range(self, t0: float, t1: float) -> "Track":
+        """Fixes con t0 <= t <= t1 (búsqueda binaria sobre la columna de tiempo)."""
+        return self[bisect_left(self.t, t0):bisect_right(self.t, t1)]
+
+    def bbox(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> "Track":
+        """Fixes dentro del rectángulo."""
+        if np is not None and len(self):
+            lat = np.frombuffer(self.lat, dtype=np.float64)
+            lon = np.frombuffer(self.lon, dtype=np.float64)
+            idx = np.nonzero((lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max))[0]
+            return self._subset(idx.tolist())
+        return self._subset(i for i, (la, lo) in enumerate(zip(self.lat, self.lon))
+                            if lat_min <= la <= lat_max and lon_min <= lo <= lon_max)
+
+    def segment_lengths(self) -> List[float]:
+        """Distancia en metros de cada tramo entre fixes consecutivos."""
+        if len(self) < 2:
+            return []
+        if np is not None:
+            lat = np.radians(np.frombuffer(self.lat, dtype=np.float64))
+            lon = np.radians(np.frombuffer(self.lon, dtype=np.float64))
+            dlat, dlon = np.diff(lat), np.diff(lon)
+            a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+            return (2 * RADIO_TIERRA * np.arcsin(np.sqrt(a))).tolist()
+        la, lo = self.lat, self.lon
+        return [haversine(la[i], lo[i], la[i + 1], lo[i + 1]) for i in range(len(la) - 1)]
+
+    def distance(self) -> float:
+        """Distancia recorrida en metros."""
+        return float(sum(self.segment_lengths()))
+
+    def average_speed(self) -> float:
+        """Velocidad media en m/s (0 si no hay tiempo transcurrido)."""
+        if len(self) < 2:
+            return 0.0
+        dt = self.t[-1] - self.t[0]
+        return self.distance() / dt if dt > 0 else 0.0
+
+    # -------- formato binario --------
+    def save(self, path: str):
+        """Escribe el track completo (temporal + rename atómico)."""
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            self._write_rows(f, 0)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def append_to(self, path: str, start: int):
+        """Añade al fichero las filas desde `start` (O(nuevas))."""
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        with open(path, "r+b" if size else "wb") as f:
+            if size < len(MAGIC):
+                f.seek(0)
+                f.truncate()
+                f.write(MAGIC)
+            else:
+                # descartar un registro final incompleto (corte durante una escritura)
+                f.truncate(len(MAGIC) + (size - len(MAGIC)) // _REG.size * _REG.size)
+                f.seek(0, os.SEEK_END)
+            self._write_rows(f, start)
+
+    def _write_rows(self, f, start: int):
+        f.write(b"".join(_REG.pack(*row) for row in self.rows(start)))
+
+    @classmethod
+    def load(cls, path: str) -> "Track":
+        """Lee un fichero .track vía mmap; ignora un registro final incompleto."""
+        tr = cls()
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        n = max(0, size - len(MAGIC)) // _REG.size
+        if n == 0:
+            return tr
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:4] != MAGIC[:4]:
+                raise ValueError(f"{path} no es un fichero de track")
+            valores = array("d")
+            datos = memoryview(mm)[len(MAGIC):len(MAGIC) + n * _REG.size]
+            try:
+                valores.frombytes(datos)  # copia plana en C, sin parsear filas
+            finally:
+                datos.release()
+        if sys.byteorder == "big":
+            valores.byteswap()
+        tr.t, tr.lat, tr.lon, tr.alt = (valores[k::4] for k in range(4))
+        return tr
+
+    @staticmethod
+    def map(path: str):
+        """Vista NumPy (n, 4) memory-mapped del fichero, sin copiar (requiere NumPy)."""
+        if np is None:
+            raise RuntimeError("Track.map requiere NumPy")
+        size = os.path.getsize(path)
+        n = max(0, size - len(MAGIC)) // _REG.size
+        return np.memmap(path, dtype="<f8", mode="r", offset=len(MAGIC), shape=(n, 4))
@@ -0,0 +1,53 @@
+import os
+import sys
+import types
+
+import pytest
+
+# Los módulos del proyecto se importan planos desde src/ (como en main.py)
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+
+@pytest.fixture
+def crear_gateway(tmp_path):
+    """
+    Fábrica de MeshtasticGateway sin broker que persisten en tmp_path (nunca
+    en data/), sin ventana de duplicados y con los topics ya calculados. Al
+    acabar el test se cierran tubería, captura y escritor.
+    """
+    from meshtastic_client import MeshtasticGateway
+
+    creados = []
+
+    def crear(**kw) -> MeshtasticGateway:
+        kw.setdefault("persist_path", str(tmp_path / "ds.json"))
+        kw.setdefault("dedup_window", 0)
+        gw = MeshtasticGateway(**kw)
+        gw._set_topics()
+        creados.append(gw)
+        return gw
+
+    yield crear
+    for gw in creados:
+        gw._stop_pipeline()
+        gw.stop_capture()
+        gw.close_store()
+
+
+@pytest.fixture
+def mensaje_mqtt():
+    """
+    Mensaje como el de paho para gw._on_message: payload en bytes tal cual, o
+    un ServiceEnvelope de `gw` con `data` (mesh_pb2.Data) o con un texto.
+    """
+    def crear(gw, data=None, texto=None, payload=None, destino=0xFFFFFFFF, gateway_id=None):
+        if payload is None:
+            env = gw._make_envelope(destino, data if data is not None else gw._text_data(texto))
+            if gateway_id is not None:
+                env.gateway_id = gateway_id  # retransmitido por otro nodo
+            payload = env.SerializeToString()
+        return types.SimpleNamespace(topic=gw._publish_topic, payload=payload)
+
+    return crear
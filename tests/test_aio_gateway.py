@@ -0,0 +1,67 @@
+import asyncio
+import socket
+import time
+
+import paho.mqtt.client as mqtt
+
+from aio_gateway import AsyncMeshtasticGateway
+from meshtastic_client import MeshtasticGateway
+
+
+class _LoopFalso:
+    def add_reader(self, sock, fn):
+        pass
+
+
+def _sndbuf_tras_abrir(tmp_path, **kw) -> int:
+    agw = AsyncMeshtasticGateway(MeshtasticGateway(persist_path=str(tmp_path / "ds.json")), **kw)
+    agw._loop = _LoopFalso()
+    with socket.socket() as s:
+        antes = s.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        agw._on_socket_open(agw.gw._client, None, s)
+        despues = s.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+    agw.gw.close_store()
+    return antes, despues
+
+
+def test_sndbuf_del_sistema_por_defecto(tmp_path):
+    antes, despues = _sndbuf_tras_abrir(tmp_path)
+    assert antes == despues
+
+
+def test_sndbuf_configurable(tmp_path):
+    antes, despues = _sndbuf_tras_abrir(tmp_path, sndbuf=4096)
+    assert despues != antes
+
+
+class _ClienteDiferido:
+    """publish() de paho cuyo on_publish llega después, desde el propio event loop."""
+
+    def __init__(self, loop, tracker):
+        self.loop = loop
+        self.tracker = tracker
+        self.mid = 0
+
+    def publish(self, topic, payload, qos=0):
+        self.mid += 1
+        self.loop.call_later(0.001, self.tracker.on_publish, self, None, self.mid, None, None)
+        info = mqtt.MQTTMessageInfo(self.mid)
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+        return info
+
+
+def test_rafaga_mayor_que_la_ventana_no_bloquea_el_loop(tmp_path):
+    gw = MeshtasticGateway(persist_path=str(tmp_path / "ds.json"), max_inflight=2, publish_timeout=2.0)
+    agw = AsyncMeshtasticGateway(gw)
+
+    async def rafaga():
+        agw._loop = asyncio.get_running_loop()
+        gw._client = _ClienteDiferido(agw._loop, gw._tracker)
+        t0 = time.monotonic()
+        mids = await asyncio.gather(*(agw.send_text(f"m{i}") for i in range(20)))
+        return mids, time.monotonic() - t0
+
+    mids, dt = asyncio.run(rafaga())
+    gw.close_store()
+    assert sorted(mids) == list(range(1, 21))
+    assert dt < 1.0  # antes: el loop se quedaba en acquire() hasta publish_timeout
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from almacen import POLITICA_LRU, POLITICA_TTL, Almacen
+
+
+def _por_nodo(**kw) -> Almacen:
+    return Almacen(indices={"nodo": lambda r: r.get("nodo")}, **kw)
+
+
+def test_anillo_expulsa_el_mas_antiguo():
+    a = Almacen(capacidad=3)
+    for i in range(5):
+        a.agregar(i)
+    assert list(a) == [2, 3, 4] and a.expulsados == 2
+    assert a.ultimo() == 4 and list(a.ultimos(2)) == [3, 4]
+
+
+def test_lru_obtener_cuenta_como_uso():
+    a = Almacen(capacidad=2, politica=POLITICA_LRU, clave=lambda r: r["id"])
+    a.agregar({"id": "a"})
+    a.agregar({"id": "b"})
+    assert a.obtener("a") == {"id": "a"}
+    a.agregar({"id": "c"})
+    assert "b" not in a and [r["id"] for r in a] == ["a", "c"]
+
+
+def test_ttl_caduca(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: reloj[0])
+    a = Almacen(politica=POLITICA_TTL, ttl=10)
+    a.agregar("viejo")
+    reloj[0] += 6
+    a.agregar("nuevo")
+    reloj[0] += 5
+    assert list(a) == ["nuevo"] and len(a) == 1
+
+
+def test_clave_sustituye():
+    a = Almacen(clave=lambda r: r["id"])
+    a.agregar({"id": 1, "v": "a"})
+    a.agregar({"id": 1, "v": "b"})
+    assert len(a) == 1 and a.obtener(1)["v"] == "b"
+
+
+def test_vista_por_indice_es_viva():
+    a = _por_nodo(capacidad=2)
+    vista = a.por("nodo", "!a")          # aún no hay ninguno con ese valor
+    assert len(vista) == 0
+    a.agregar({"nodo": "!a", "n": 1})
+    assert [r["n"] for r in vista] == [1]
+    a.agregar({"nodo": "!b", "n": 2})
+    a.agregar({"nodo": "!b", "n": 3})    # expulsa el único de !a: la cadena se queda vacía
+    assert len(vista) == 0 and list(vista) == []
+    a.agregar({"nodo": "!a", "n": 4})
+    assert [r["n"] for r in vista] == [4]
+    assert [r["n"] for r in a.por("nodo", "!b")[-1:]] == [3]
+    assert a.contar("nodo", "!b") == 1 and sorted(a.valores("nodo")) == ["!a", "!b"]
+
+
+def test_vistas_indexan_y_cortan_como_listas():
+    a = _por_nodo()
+    for i in range(10):
+        a.agregar({"nodo": "!a" if i % 2 else "!b", "n": i})
+    impares = a.por("nodo", "!a")
+    assert [r["n"] for r in impares] == [1, 3, 5, 7, 9]
+    assert impares[-1]["n"] == 9 and impares[0]["n"] == 1
+    assert [r["n"] for r in impares[1:3]] == [3, 5]
+    assert [r["n"] for r in reversed(impares)] == [9, 7, 5, 3, 1]
+    with pytest.raises(IndexError):
+        impares[5]
+
+
+def test_indice_anadido_despues():
+    a = Almacen()
+    a.extender([{"p": 1}, {"p": 3}, {"p": 1}])
+    a.agregar_indice("puerto", lambda r: r["p"])
+    assert len(a.por("puerto", 1)) == 2
+
+
+def test_iterador_sobrevive_a_expulsiones():
+    a = Almacen(capacidad=3)
+    a.extender(range(3))
+    it = iter(a)
+    assert next(it) == 0
+    a.extender([3, 4])                   # expulsa 0 y 1 con el iterador parado en 0
+    resto = list(it)
+    assert resto[0] == 2 and 1 not in resto  # lo nuevo puede verlo o no
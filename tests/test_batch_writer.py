@@ -0,0 +1,86 @@
+import json
+import threading
+
+from batch_writer import LLENA_BLOQUEAR, BatchWriter, JsonlSink
+
+
+class _SinkLento:
+    """Sink que no escribe hasta que se le deja (para llenar la cola)."""
+
+    def __init__(self):
+        self.lotes = []
+        self.puerta = threading.Event()
+
+    def __call__(self, lote):
+        self.puerta.wait()
+        self.lotes.append(list(lote))
+
+
+def test_agrupa_en_lotes_y_close_vacia_la_cola(tmp_path):
+    path = tmp_path / "out.jsonl"
+    w = BatchWriter(JsonlSink(str(path)), batch_size=4, flush_interval=10)
+    for i in range(10):
+        assert w.append({"n": i})
+    w.close()
+    lineas = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(l)["n"] for l in lineas] == list(range(10))
+    assert w.stats()["written"] == 10 and w.stats()["dropped"] == 0
+
+
+def test_flush_espera_a_lo_encolado():
+    sink = _SinkLento()
+    w = BatchWriter(sink, flush_interval=0.01)
+    w.append({"n": 0})
+    assert not w.flush(timeout=0.05)
+    sink.puerta.set()
+    assert w.flush(timeout=1)
+    w.close()
+    assert sink.lotes == [[{"n": 0}]]
+
+
+def test_cola_llena_descarta_y_cuenta():
+    sink = _SinkLento()
+    w = BatchWriter(sink, max_queue=2, batch_size=1, flush_interval=0)
+    resultados = [w.append({"n": i}) for i in range(10)]
+    assert not all(resultados)
+    assert w.stats()["dropped"] == resultados.count(False)
+    sink.puerta.set()
+    w.close()
+    assert sum(len(l) for l in sink.lotes) == resultados.count(True)
+
+
+def test_cola_llena_bloquear_espera_y_luego_descarta():
+    sink = _SinkLento()
+    w = BatchWriter(sink, max_queue=1, batch_size=1, flush_interval=0,
+                    on_full=LLENA_BLOQUEAR, block_timeout=0.01)
+    for i in range(5):
+        w.append({"n": i})
+    assert w.stats()["blocked"] > 0
+    assert w.stats()["dropped"] > 0
+    sink.puerta.set()
+    w.close()
+
+
+def test_tras_close_se_descarta():
+    w = BatchWriter(lambda lote: None)
+    w.close()
+    assert not w.append({"n": 0})
+    assert w.stats()["dropped"] == 1
+
+
+def test_error_del_sink_no_para_el_hilo():
+    lotes = []
+
+    def sink(lote):
+        if not lotes:
+            lotes.append(None)
+            raise OSError("disco lleno")
+        lotes.append(list(lote))
+
+    w = BatchWriter(sink, batch_size=1, flush_interval=0)
+    w.append({"n": 0})
+    w.flush(timeout=1)
+    w.append({"n": 1})
+    w.close()
+    assert w.stats()["errors"] == 1
+    assert lotes[-1] == [{"n": 1}]
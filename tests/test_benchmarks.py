@@ -0,0 +1,48 @@
+import pytest
+
+from benchmarks.__main__ import _aplanar, comparar
+
+
+def _resultado(por_s: float, p95_us: float, max_us: float) -> dict:
+    return {"ts": "2025-10-22T13:00:00Z", "rapido": True, "entorno": {"python": "3.11"},
+            "resultados": {
+                "recepcion": {"paquetes_por_s": por_s, "n": 2000, "ok": True,
+                              "latencia": {"p95_us": p95_us, "max_us": max_us}},
+                "mqtt": {"publicaciones_por_s": 1000.0, "tramos": [1.0, 2.0]},
+            }}
+
+
+def test_aplanar_solo_metricas_comparables():
+    plano = _aplanar(_resultado(5000, 80, 900)["resultados"])
+    # n, booleanos, listas y max_us no se comparan
+    assert plano == {"recepcion.paquetes_por_s": 5000.0,
+                     "recepcion.latencia.p95_us": 80.0,
+                     "mqtt.publicaciones_por_s": 1000.0}
+    assert _aplanar({"a": {"b": {"media_us": 3}}}, "x") == {"x.a.b.media_us": 3.0}
+
+
+def test_dentro_del_umbral():
+    anterior = _resultado(5000, 80, 900)
+    actual = _resultado(4500, 90, 5000)  # -10 % de ritmo, +12.5 % de p95; el max no cuenta
+    assert comparar(anterior, actual, 0.15) == []
+    assert comparar(anterior, anterior, 0.0) == []
+
+
+def test_por_encima_del_umbral():
+    anterior = _resultado(5000, 80, 900)
+    actual = _resultado(4000, 100, 900)  # -20 % de ritmo, +25 % de p95
+    peores = comparar(anterior, actual, 0.15)
+    assert [(k, a, b) for k, a, b, _ in peores] == [
+        ("recepcion.latencia.p95_us", 80.0, 100.0),
+        ("recepcion.paquetes_por_s", 5000.0, 4000.0),
+    ]
+    assert [c for *_, c in peores] == pytest.approx([0.25, -0.2])
+    # mejorar nunca es una regresión, por mucho que cambie
+    assert comparar(actual, anterior, 0.15) == []
+
+
+def test_metricas_nuevas_o_a_cero_se_ignoran():
+    anterior = _resultado(0, 80, 900)
+    actual = _resultado(4000, 80, 900)
+    del actual["resultados"]["mqtt"]
+    assert comparar(anterior, actual, 0.0) == []
@@ -0,0 +1,62 @@
+import base64
+
+import pytest
+
+from exceptions import ConfigError
+
+OTRA_CLAVE = base64.b64encode(bytes(range(32))).decode()
+
+
+def test_topics_de_suscripcion_son_una_lista(crear_gateway):
+    gw = crear_gateway(root_topic="msh/EU/", channel="A")
+    assert gw._sub_topics == ["msh/EU/A/#"]
+    gw.add_channel("B", OTRA_CLAVE)
+    assert gw._sub_topics == ["msh/EU/A/#", "msh/EU/B/#"]
+    gw.remove_channel("B")
+    assert gw._sub_topics == ["msh/EU/A/#"]
+    gw.listen_root = True
+    gw._set_topics()
+    assert gw._sub_topics == ["msh/EU/#"]
+
+
+def test_descifra_con_el_anillo_de_claves(crear_gateway, mensaje_mqtt):
+    emisor = crear_gateway(channel="B", key_b64=OTRA_CLAVE, node_name="!00000001")
+    receptor = crear_gateway(channel="A", node_name="!00000002")
+    textos = []
+    receptor.on_text = lambda src, t: textos.append(t)
+    receptor._on_message(None, None, mensaje_mqtt(emisor, texto="sin clave"))
+    receptor.add_channel("B", OTRA_CLAVE)
+    receptor._on_message(None, None, mensaje_mqtt(emisor, texto="con clave"))
+    assert any("con clave" in t for t in textos)
+    assert not any("sin clave" in t for t in textos)
+
+
+def test_no_se_quita_el_canal_principal(crear_gateway):
+    gw = crear_gateway(channel="A")
+    with pytest.raises(ConfigError):
+        gw.remove_channel("A")
+
+
+def test_refresh_crypto_recalcula_al_cambiar_canal_o_clave(crear_gateway, mensaje_mqtt):
+    gw = crear_gateway(channel="A")
+    aes, hash_a = gw._aes, gw._channel_hash
+    gw._refresh_crypto()
+    assert gw._aes is aes  # sin cambios: se reutiliza
+
+    gw.channel = "C"
+    gw._refresh_crypto()
+    assert gw._aes is not aes and gw._aes.key == aes.key
+    assert gw._channel_hash != hash_a
+    assert set(gw._keyring) == {gw._channel_hash}  # el hash viejo sale del anillo
+
+    gw.key_b64 = OTRA_CLAVE
+    gw._refresh_crypto()
+    assert gw._aes.key == bytes(range(32))
+    assert gw._keyring[gw._channel_hash].key_b64 == OTRA_CLAVE
+
+    # lo que cifra con la clave nueva lo descifra un receptor con esa misma clave
+    receptor = crear_gateway(channel="C", key_b64=OTRA_CLAVE, node_name="!00000002")
+    textos = []
+    receptor.on_text = lambda src, t: textos.append(t)
+    receptor._on_message(None, None, mensaje_mqtt(gw, texto="clave nueva"))
+    assert any("clave nueva" in t for t in textos)
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+import main
+from captura import MAGIA_CAPTURA, Capturador, leer_captura, reproducir
+from exceptions import ConexionError
+from meshtastic_client import MeshtasticGateway
+
+S = 1_000_000_000  # ns
+
+
+def _grabar(path, tramas, t0=0):
+    cap = Capturador(str(path))
+    for k, (topic, payload) in enumerate(tramas):
+        cap.escribir(topic, payload, t_ns=t0 + k * S // 2)
+    cap.close()
+
+
+def _leidas(path, **kw):
+    return [(tr.topic, tr.payload) for tr in leer_captura(str(path), **kw)]
+
+
+TRAMAS = [("msh/a", b"\x01\x02"), ("msh/b", b"x" * 300), ("msh/a", b"")]
+
+
+def test_ida_y_vuelta_y_sesiones(tmp_path):
+    path = tmp_path / "c.mshc"
+    _grabar(path, TRAMAS)
+    _grabar(path, TRAMAS[:1])  # segunda sesión: la tabla de topics empieza de nuevo
+    assert path.read_bytes().startswith(MAGIA_CAPTURA)
+    assert _leidas(path) == TRAMAS + TRAMAS[:1]
+    assert _leidas(path, bloque=5) == TRAMAS + TRAMAS[:1]
+    assert [tr.t for tr in leer_captura(str(path))] == [0.0, 0.5, 1.0, 1.0]
+
+
+def test_reabrir_tras_un_corte_recorta_la_trama_truncada(tmp_path):
+    path = tmp_path / "c.mshc"
+    _grabar(path, TRAMAS)
+    path.write_bytes(path.read_bytes()[:-150 - 1])  # corte a mitad del payload de msh/b... y del último
+    assert _leidas(path) == TRAMAS[:1]
+    _grabar(path, TRAMAS[2:])
+    assert _leidas(path) == TRAMAS[:1] + TRAMAS[2:]
+
+
+def test_registro_danado_salta_a_la_sesion_siguiente(tmp_path):
+    path = tmp_path / "c.mshc"
+    _grabar(path, TRAMAS)
+    otra = tmp_path / "otra.mshc"
+    _grabar(otra, TRAMAS[1:2])
+    path.write_bytes(path.read_bytes() + b"\x07basura\x00" + otra.read_bytes()[len(MAGIA_CAPTURA):])
+    assert _leidas(path) == TRAMAS + TRAMAS[1:2]
+    assert _leidas(path, bloque=3) == TRAMAS + TRAMAS[1:2]
+
+
+def test_no_es_una_captura(tmp_path):
+    path = tmp_path / "x.bin"
+    path.write_bytes(b"no es una captura")
+    with pytest.raises(ValueError):
+        list(leer_captura(str(path)))
+    with pytest.raises(ValueError):
+        Capturador(str(path))
+    assert path.read_bytes() == b"no es una captura"
+
+
+def test_reproducir_en_streaming(tmp_path):
+    path = tmp_path / "c.mshc"
+    _grabar(path, TRAMAS)
+    vistas = []
+    res = reproducir(str(path), lambda topic, payload: vistas.append(topic), velocidad=0, limite=2)
+    assert vistas == ["msh/a", "msh/b"]
+    assert res["tramas"] == 2 and res["bytes"] == 302 and res["duracion_captura_s"] == 0.5
+
+
+def test_connect_reanuda_la_captura(tmp_path, monkeypatch):
+    gw = MeshtasticGateway(persist_path=str(tmp_path / "ds.json"), capture_path=str(tmp_path / "c.mshc"))
+    gw.disconnect()
+    assert gw._capture is None
+
+    def sin_broker(*a, **kw):
+        raise OSError("sin broker")
+
+    monkeypatch.setattr(gw._client, "connect", sin_broker)
+    with pytest.raises(ConexionError):
+        gw.connect()
+    assert gw._capture is not None
+    gw.stop_capture()
+    gw.close_store()
+
+
+def _cfg(tmp_path):
+    gw = MeshtasticGateway(persist_path=str(tmp_path / "tmp.json"))
+    return gw, {
+        "meshtastic": {"root_topic": gw.root_topic, "channel": gw.channel, "key": gw.key_b64},
+        "almacen": {"archivo": str(tmp_path / "produccion.json")},
+        "metricas": {},
+    }
+
+
+def test_replay_no_toca_el_almacen_de_produccion(tmp_path, capsys):
+    gw, cfg = _cfg(tmp_path)
+    gw._set_topics()
+    captura = tmp_path / "c.mshc"
+    payload = gw._make_envelope(0xFFFFFFFF, gw._text_data("hola")).SerializeToString()
+    _grabar(captura, [(gw._publish_topic, payload)])
+    gw.close_store()
+
+    main.replay_meshtastic(cfg, str(captura), 0)
+    assert not (tmp_path / "produccion.json").exists()
+
+    destino = tmp_path / "replay.json"
+    main.replay_meshtastic(cfg, str(captura), 0, persistir=str(destino))
+    registros = [json.loads(l) for l in destino.read_text(encoding="utf-8").splitlines()]
+    assert [r["text"] for r in registros] == ["hola"]
+    assert not (tmp_path / "produccion.json").exists()
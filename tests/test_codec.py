@@ -0,0 +1,75 @@
+import io
+
+import pytest
+
+from codec import CODEC_BINARIO, CODEC_JSON, CODECS, MAGIA, Codec, Decodificador, codec_de
+from mensaje import Mensaje
+
+REGISTROS = [
+    {"ts": "2025-10-22T13:40:00Z", "from": "!0000000b", "portnum": 3, "lat": 40.4168, "lon": -3.7038,
+     "alt": -12, "text": None, "ok": True},
+    {"ts": "2025-10-22 15:29:00", "topic": "msh/EU_868", "json": {"a": [1, 2.5, "ñ"]}, "clave rara": b"\x00\x01"},
+    {"ts": "no es una fecha", "id": 2 ** 40, "neg": -3},
+]
+
+
+@pytest.mark.parametrize("nombre", [CODEC_JSON, CODEC_BINARIO])
+def test_ida_y_vuelta(nombre):
+    codec = codec_de(nombre)
+    registros = REGISTROS if nombre == CODEC_BINARIO else REGISTROS[::2]
+    f = io.BytesIO()
+    codec.escribir(f, registros)
+    codec.escribir(f, registros[:1])  # append: la cabecera sólo va al principio
+    assert list(codec.leer(io.BytesIO(f.getvalue()), bloque=7)) == registros + registros[:1]
+
+
+def test_binario_empieza_con_la_cabecera():
+    datos = CODECS[CODEC_BINARIO].codificar_lote(REGISTROS)
+    f = io.BytesIO()
+    CODECS[CODEC_BINARIO].escribir(f, REGISTROS)
+    assert f.getvalue() == MAGIA + datos
+
+
+@pytest.mark.parametrize("nombre", [CODEC_JSON, CODEC_BINARIO])
+def test_ultimo_registro_truncado_se_ignora(nombre):
+    codec = codec_de(nombre)
+    f = io.BytesIO()
+    codec.escribir(f, REGISTROS[::2])
+    datos = f.getvalue()[:-3]
+    dec = codec.decodificador()
+    assert dec.alimentar(datos) + dec.terminar() == REGISTROS[:1]
+    assert dec.corruptos == 1
+
+
+@pytest.mark.parametrize("corte", [1, 5, 20])
+def test_binario_append_tras_registro_truncado(corte):
+    codec = CODECS[CODEC_BINARIO]
+    f = io.BytesIO()
+    codec.escribir(f, REGISTROS[:1])
+    inicio = f.tell()
+    codec.escribir(f, REGISTROS[1:2])
+    f.truncate(inicio + corte)       # corte a mitad del segundo registro
+    f.seek(0, io.SEEK_END)
+    codec.escribir(f, REGISTROS[2:])  # y se sigue añadiendo
+    leidos = list(codec.leer(io.BytesIO(f.getvalue()), bloque=16))
+    assert leidos == [REGISTROS[0], REGISTROS[2]]
+
+
+def test_basura_en_medio_no_detiene_la_lectura():
+    codec = CODECS[CODEC_BINARIO]
+    datos = MAGIA + codec.codificar(REGISTROS[0]) + b"\xff\xff\xff\xff\x07basura" + codec.codificar(REGISTROS[2])
+    dec = codec.decodificador()
+    assert dec.alimentar(datos) + dec.terminar() == [REGISTROS[0], REGISTROS[2]]
+    assert dec.corruptos >= 1
+
+
+def test_clases_base_abstractas():
+    with pytest.raises(TypeError):
+        Codec()
+    with pytest.raises(TypeError):
+        Decodificador()
+
+
+def test_mensaje_es_hashable():
+    a, b = Mensaje("hola", ts=10), Mensaje("hola", ts=10)
+    assert a == b and len({a, b, Mensaje("hola", ts=11)}) == 2
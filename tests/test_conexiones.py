@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from conexiones import GatewayPool
+from exceptions import ConfigError
+from meshtastic_client import MeshtasticGateway
+
+SESION = {"broker": "localhost", "port": 1883, "username": "u", "password": "p",
+          "root_topic": "msh/EU_868/ES/2/e/", "channel": "TestMQTT",
+          "key": "ymACgCy9Tdb8jHbLxUxZ/4ADX+BWLOGVihmKHcHTVyo="}
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    """Pool sin broker: ensure_connected sólo cuenta las llamadas."""
+    conexiones = []
+
+    def ensure_connected(gw):
+        conexiones.append(gw)
+
+    monkeypatch.setattr(MeshtasticGateway, "ensure_connected", ensure_connected)
+    p = GatewayPool()
+    p.conexiones = conexiones
+    p.opciones = {"persist_path": str(tmp_path / "ds.json"), "dedup_window": 0}
+    yield p
+    for gw in p._gateways.values():
+        gw.close_store()
+
+
+def test_reutiliza_por_sesion(pool):
+    a = pool.connected(SESION, **pool.opciones)
+    b = pool.connected(dict(SESION), **pool.opciones)
+    otro = pool.connected(dict(SESION, channel="Otro"), **pool.opciones)
+    assert a is b
+    assert otro is not a
+    assert (a.broker, a.channel, otro.channel) == ("localhost", "TestMQTT", "Otro")
+    assert pool.conexiones == [a, a, otro]
+    assert pool.get(SESION) is a  # sin opciones: el que ya existe
+
+
+def test_callback_nuevo_se_engancha(pool):
+    tx = pool.get(SESION, debug=True, **pool.opciones)
+    assert tx.on_packet is None
+    recibidos = []
+    rx = pool.connected(SESION, debug=True, on_packet=recibidos.append, **pool.opciones)
+    assert rx is tx
+    assert tx.on_packet == recibidos.append
+    # pedirlo otra vez con el mismo callback no es un conflicto
+    assert pool.get(SESION, on_packet=recibidos.append) is tx
+
+
+def test_opciones_en_conflicto(pool):
+    gw = pool.get(SESION, **pool.opciones)
+    with pytest.raises(ConfigError, match="debug"):
+        pool.get(SESION, debug=True)
+    gw.on_packet = print
+    with pytest.raises(ConfigError, match="on_packet"):
+        pool.connected(SESION, on_packet=repr)
+    assert gw.debug is False and gw.on_packet is print
+    assert pool.conexiones == []
+
+
+def test_conecta_bajo_el_lock(pool, monkeypatch):
+    dentro = []
+    max_dentro = []
+
+    def ensure_connected(gw):
+        dentro.append(gw)
+        max_dentro.append(len(dentro))
+        time.sleep(0.05)
+        dentro.pop()
+
+    monkeypatch.setattr(MeshtasticGateway, "ensure_connected", ensure_connected)
+    pool.get(SESION, **pool.opciones)
+    hilos = [threading.Thread(target=pool.connected, args=(SESION,)) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert max_dentro == [1, 1, 1, 1]
+
+
+def test_close_all(pool, monkeypatch):
+    cerrados = []
+    monkeypatch.setattr(MeshtasticGateway, "disconnect", lambda gw: cerrados.append(gw) or 1 / 0)
+    a = pool.get(SESION, **pool.opciones)
+    b = pool.get(dict(SESION, channel="Otro"), **pool.opciones)
+    pool.close_all()  # un disconnect que falla no impide cerrar los demás
+    assert cerrados == [a, b]
+    assert pool._gateways == {}
+    a.close_store()
+    b.close_store()
@@ -0,0 +1,80 @@
+import pytest
+
+import dedup
+from dedup import DedupCache
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj monotónico controlado por el test."""
+    ahora = [1000.0]
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: ahora[0])
+    return ahora
+
+
+def test_aciertos_y_fallos():
+    c = DedupCache()
+    assert c.check(1, 10) is False
+    assert c.check(1, 10) is True
+    assert c.check(1, 11) is False
+    assert c.check(2, 10) is False  # mismo id, otro emisor: paquete distinto
+    assert c.check(2, 10) is True
+    assert c.stats() == {"size": 3, "hits": 2, "misses": 3, "evictions": 0}
+
+
+def test_caducidad(reloj):
+    c = DedupCache(window=60)
+    assert c.check(1, 10) is False
+    reloj[0] += 59
+    assert c.check(1, 10) is True
+    # un duplicado no alarga la ventana: caduca a los 60 s del primero
+    reloj[0] += 1
+    assert c.check(1, 10) is False
+    assert c.stats()["evictions"] == 1
+    assert len(c) == 1
+
+
+def test_caducidad_en_orden(reloj):
+    c = DedupCache(window=10)
+    c.check(1, 1)
+    reloj[0] += 5
+    c.check(1, 2)
+    reloj[0] += 6  # caduca sólo el primero
+    assert c.check(1, 3) is False
+    assert len(c) == 2
+    assert c.check(1, 2) is True
+    assert c.check(1, 1) is False
+
+
+def test_max_entries_expulsa_el_mas_antiguo():
+    c = DedupCache(max_entries=3)
+    for i in range(5):
+        assert c.check(1, i) is False
+    assert len(c) == 3
+    assert c.stats()["evictions"] == 2
+    assert c.check(1, 4) is True
+    assert c.check(1, 2) is True
+    assert c.check(1, 0) is False  # ya expulsado: se ve como nuevo
+
+
+def test_relays():
+    c = DedupCache(track_relays=True)
+    assert c.check(1, 10, "!gw1") is False
+    assert c.check(1, 10, "!gw2") is True
+    assert c.check(1, 10, "!gw1") is True
+    assert c.check(1, 10) is True
+    assert c.relays(1, 10) == {"!gw1", "!gw2"}
+    assert c.relays(1, 99) == set()
+    # la copia devuelta no altera la caché
+    c.relays(1, 10).add("!otro")
+    assert c.relays(1, 10) == {"!gw1", "!gw2"}
+
+
+def test_relays_desactivado_y_clear():
+    c = DedupCache()
+    c.check(1, 10, "!gw1")
+    c.check(1, 10, "!gw2")
+    assert c.relays(1, 10) == set()
+    c.clear()
+    assert len(c) == 0
+    assert c.check(1, 10) is False
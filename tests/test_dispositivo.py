@@ -0,0 +1,117 @@
+import pytest
+
+import dispositivo
+from codec import CODEC_BINARIO
+from dispositivo import Dispositivo, _journal_path
+
+
+def _con_mensajes(n: int, desde: int = 0) -> Dispositivo:
+    d = Dispositivo("nodo")
+    for i in range(desde, desde + n):
+        d.registrar_mensaje(f"m{i}")
+    return d
+
+
+def test_guardado_incremental_y_carga(tmp_path):
+    ruta = str(tmp_path / "disp.json")
+    d = _con_mensajes(2)
+    d.registrar_posicion(40.0, -3.0, 600.0)
+    d.guardar_datos(ruta)                     # primera vez: instantánea
+    d.registrar_mensaje("m2")
+    d.registrar_posicion(40.1, -3.1, 610.0)
+    d.conectar()
+    d.guardar_datos(ruta)                     # después: sólo el journal
+    assert _journal_path(tmp_path / "disp.json").stat().st_size > 0
+
+    c = Dispositivo.cargar(ruta)
+    assert [m["mensaje"] for m in c.historial] == ["m0", "m1", "m2"]
+    assert len(c.posiciones) == 2
+    assert c.conectado and c.nombre == "nodo"
+
+
+def test_compacta_cada_n_registros(tmp_path, monkeypatch):
+    monkeypatch.setattr(Dispositivo, "COMPACTAR_CADA", 5)
+    ruta = str(tmp_path / "disp.json")
+    d = Dispositivo("nodo")
+    for i in range(12):
+        d.registrar_mensaje(f"m{i}")
+        d.guardar_datos(ruta)
+    assert d._journal_registros <= 5
+    assert [m["mensaje"] for m in Dispositivo.cargar(ruta).historial] == [f"m{i}" for i in range(12)]
+
+
+def test_corte_entre_instantanea_y_journal_no_duplica(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "disp.json")
+    d = Dispositivo("nodo")
+    d.guardar_datos(ruta)
+    for i in range(3):
+        d.registrar_mensaje(f"m{i}")
+    d.guardar_datos(ruta)                     # 3 mensajes en el journal
+
+    escribir = dispositivo._escribir_atomico
+
+    def escribir_y_cortar(path, data):
+        escribir(path, data)
+        raise KeyboardInterrupt("corte tras os.replace")
+
+    monkeypatch.setattr(dispositivo, "_escribir_atomico", escribir_y_cortar)
+    with pytest.raises(KeyboardInterrupt):
+        d.compactar(ruta)
+    monkeypatch.undo()
+
+    c = Dispositivo.cargar(ruta)
+    assert [m["mensaje"] for m in c.historial] == ["m0", "m1", "m2"]
+    # y se puede seguir guardando sobre ese estado
+    c.registrar_mensaje("m3")
+    c.guardar_datos(ruta)
+    assert len(Dispositivo.cargar(ruta).historial) == 4
+
+
+def test_journal_binario_y_cambio_de_formato(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "disp.json")
+    d = _con_mensajes(1)
+    d.guardar_datos(ruta)
+    d.registrar_mensaje("m1")
+    d.guardar_datos(ruta)                     # journal JSONL
+    monkeypatch.setattr(Dispositivo, "CODEC_JOURNAL", CODEC_BINARIO)
+    d = Dispositivo.cargar(ruta)
+    d.registrar_mensaje("m2")
+    d.guardar_datos(ruta)                     # journal binario
+    assert [m["mensaje"] for m in Dispositivo.cargar(ruta).historial] == ["m0", "m1", "m2"]
+    d.compactar(ruta)
+    assert not _journal_path(tmp_path / "disp.json").exists()
+    assert [m["mensaje"] for m in Dispositivo.cargar(ruta).historial] == ["m0", "m1", "m2"]
+
+
+def test_journal_truncado_pierde_solo_el_ultimo(tmp_path):
+    ruta = str(tmp_path / "disp.json")
+    d = _con_mensajes(1)
+    d.guardar_datos(ruta)
+    d.registrar_mensaje("m1")
+    d.registrar_mensaje("m2")
+    d.guardar_datos(ruta)
+    journal = _journal_path(tmp_path / "disp.json")
+    journal.write_bytes(journal.read_bytes()[:-5])
+    assert [m["mensaje"] for m in Dispositivo.cargar(ruta).historial] == ["m0", "m1"]
+
+
+def test_journal_antiguo_sin_generacion(tmp_path):
+    ruta = tmp_path / "disp.json"
+    ruta.write_text('{"nombre": "nodo", "historial": [], "posiciones_archivo": "disp.track"}', encoding="utf-8")
+    _journal_path(ruta).write_text('{"t": "m", "mensaje": "viejo"}\n', encoding="utf-8")
+    assert [m["mensaje"] for m in Dispositivo.cargar(str(ruta)).historial] == ["viejo"]
+
+
+def test_journal_binario_truncado_y_ampliado(tmp_path, monkeypatch):
+    monkeypatch.setattr(Dispositivo, "CODEC_JOURNAL", CODEC_BINARIO)
+    ruta = str(tmp_path / "disp.json")
+    d = _con_mensajes(1)
+    d.guardar_datos(ruta)
+    d.registrar_mensaje("m1")
+    d.guardar_datos(ruta)
+    journal = _journal_path(tmp_path / "disp.json", CODEC_BINARIO)
+    journal.write_bytes(journal.read_bytes()[:-5])   # corte a mitad de m1
+    c = Dispositivo.cargar(ruta)
+    c.registrar_mensaje("m2")
+    c.guardar_datos(ruta)                            # se añade tras el registro roto
+    assert [m["mensaje"] for m in Dispositivo.cargar(ruta).historial] == ["m0", "m2"]
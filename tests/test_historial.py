@@ -0,0 +1,77 @@
+import json
+import time
+
+import pytest
+
+import historial
+from codec import CODECS, CODEC_BINARIO
+from historial import FiltroHistorial, iterar_registros, normalizar_fecha, ts_de, ts_utc
+
+
+@pytest.fixture
+def madrid(monkeypatch):
+    """Zona horaria con desfase respecto a UTC (+02:00 en octubre)."""
+    monkeypatch.setenv("TZ", "Europe/Madrid")
+    time.tzset()
+    historial._local_a_utc.cache_clear()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+    historial._local_a_utc.cache_clear()
+
+
+REGISTROS = [
+    {"ts": "2025-10-22 15:29:00", "from": "!0000000a", "portnum": 1, "text": "local antiguo"},
+    {"ts": "2025-10-22T13:40:00Z", "from": "!0000000b", "portnum": 3, "lat": 40.4, "lon": -3.7, "alt": 0},
+    {"ts": "2025-10-22T14:00:00Z", "topic": "t", "json": {"a": 1}},
+]
+
+
+def _jsonl(tmp_path, registros=REGISTROS) -> str:
+    path = tmp_path / "ds.json"
+    path.write_text("".join(json.dumps(r) + "\n" for r in registros), encoding="utf-8")
+    return str(path)
+
+
+def test_ts_local_del_gateway_se_pasa_a_utc(madrid):
+    assert ts_utc("2025-10-22 15:29:00") == "2025-10-22T13:29:00Z"
+    assert ts_utc("2025-01-10 15:29:00") == "2025-01-10T14:29:00Z"  # horario de invierno
+    assert ts_utc("2025-10-22T13:29:00Z") == "2025-10-22T13:29:00Z"
+    assert ts_de(REGISTROS[0]) == "2025-10-22T13:29:00Z"
+
+
+def test_since_until_con_ts_local(madrid, tmp_path):
+    path = _jsonl(tmp_path)
+    f = FiltroHistorial(since=normalizar_fecha("2025-10-22T13:00:00Z"),
+                        until=normalizar_fecha("2025-10-22T13:30:00Z"))
+    assert [r["text"] for r in iterar_registros(path, f)] == ["local antiguo"]
+    # el prefiltro sobre bytes y acepta() coinciden
+    f = FiltroHistorial(since="2025-10-22T13:30:00Z")
+    assert [r["ts"] for r in iterar_registros(path, f)] == ["2025-10-22T13:40:00Z", "2025-10-22T14:00:00Z"]
+
+
+def test_filtros_nodo_y_tipo(tmp_path):
+    path = _jsonl(tmp_path)
+    assert [r["from"] for r in iterar_registros(path, FiltroHistorial(node="!0000000b"))] == ["!0000000b"]
+    assert [r["topic"] for r in iterar_registros(path, FiltroHistorial(tipo="json"))] == ["t"]
+    assert len(list(iterar_registros(path, FiltroHistorial(tipo="position")))) == 1
+
+
+def test_array_antiguo_y_binario(tmp_path):
+    (tmp_path / "ds.json").write_text(json.dumps(REGISTROS[:2], indent=2), encoding="utf-8")
+    with open(tmp_path / "ds.bin", "wb") as f:
+        CODECS[CODEC_BINARIO].escribir(f, REGISTROS[2:])
+    assert list(iterar_registros(str(tmp_path / "ds.json"))) == REGISTROS
+
+
+def test_normalizar_fecha():
+    assert normalizar_fecha("2025-10-22") == "2025-10-22T00:00:00Z"
+    assert normalizar_fecha("2025-10-22T15:00:00+02:00") == "2025-10-22T13:00:00Z"
+    assert normalizar_fecha("0") == "1970-01-01T00:00:00Z"
+
+
+def test_el_gateway_escribe_utc(tmp_path):
+    from meshtastic_client import _now_iso
+    ts = _now_iso()
+    assert ts.endswith("Z") and ts_utc(ts) == ts
+    assert abs(time.mktime(time.strptime(ts, "%Y-%m-%dT%H:%M:%SZ")) - time.mktime(time.gmtime())) < 5
@@ -0,0 +1,89 @@
+import json
+
+from codec import CODECS, CODEC_BINARIO
+from indice_espacial import IndicePosiciones
+from track import haversine
+
+
+def _indice(cell_deg=0.01) -> IndicePosiciones:
+    ix = IndicePosiciones(cell_deg=cell_deg)
+    ix.add("!a", 40.000, -3.700, t=100)
+    ix.add("!b", 40.005, -3.705, t=200)
+    ix.add("!c", 40.050, -3.650, t=300)
+    ix.add("!a", 40.001, -3.701, t=400)
+    return ix
+
+
+def test_bbox_y_tiempo():
+    ix = _indice()
+    assert sorted((f.node, f.t) for f in ix.bbox(39.99, 40.01, -3.71, -3.69)) == \
+        [("!a", 100), ("!a", 400), ("!b", 200)]
+    assert [f.t for f in ix.bbox(39.99, 40.01, -3.71, -3.69, t0=150, t1=300)] == [200]
+    assert ix.bbox(41, 42, -3.71, -3.69) == []
+    assert [f.t for f in ix.time_range(200, 300)] == [200, 300]
+
+
+def test_bbox_bordes_incluidos():
+    # puntos justo en el borde del rectángulo y de una celda de la rejilla
+    ix = IndicePosiciones(cell_deg=0.01)
+    ix.add("!a", 40.0, -3.7, t=1)
+    ix.add("!b", 40.01, -3.69, t=2)
+    assert {f.node for f in ix.bbox(40.0, 40.01, -3.7, -3.69)} == {"!a", "!b"}
+    assert {f.node for f in ix.bbox(40.0, 40.0, -3.7, -3.7)} == {"!a"}
+    assert ix.bbox(40.0000001, 40.0099999, -3.7, -3.69) == []
+
+
+def test_bbox_grande_recorre_celdas_ocupadas():
+    ix = _indice(cell_deg=0.0001)
+    assert len(ix.bbox(-90, 90, -180, 180)) == 4
+
+
+def test_radius_frente_a_fuerza_bruta():
+    ix = _indice()
+    for metros in (0.0, 100.0, 800.0, 10_000.0):
+        esperado = sorted(f.t for f in (ix.fix(i) for i in range(len(ix)))
+                          if haversine(40.0, -3.7, f.lat, f.lon) <= metros)
+        assert sorted(f.t for f in ix.radius(40.0, -3.7, metros)) == esperado
+    assert [f.t for f in ix.radius(40.0, -3.7, 800.0, t0=150)] == [200, 400]
+
+
+def test_knn_usa_la_ultima_posicion():
+    ix = _indice()
+    cercanos = ix.nearest_nodes(40.0, -3.7, k=2)
+    assert [f.node for d, f in cercanos] == ["!a", "!b"]
+    assert cercanos[0][1].t == 400  # última posición de !a, no la primera
+    assert cercanos[0][0] <= cercanos[1][0]
+    assert [f.node for d, f in ix.nearest_nodes(40.0, -3.7, k=10)] == ["!a", "!b", "!c"]
+    assert {f.node for f in ix.nodes_within(40.0, -3.7, 1000)} == {"!a", "!b"}
+    assert IndicePosiciones().nearest_nodes(0, 0) == []
+
+
+def test_knn_nodo_que_se_mueve_cambia_de_celda():
+    ix = IndicePosiciones(cell_deg=0.01)
+    ix.add("!a", 40.0, -3.7, t=1)
+    ix.add("!a", 41.0, -3.7, t=2)
+    ix.add("!a", 39.0, -3.7, t=0)  # fix antiguo que llega tarde: no es la última
+    assert ix.last_fix("!a").lat == 41.0
+    assert ix.nodes_within(40.0, -3.7, 1000) == []
+    assert [f.lat for f in ix.nodes_within(41.0, -3.7, 1000)] == [41.0]
+    # el índice temporal sigue ordenado aunque lleguen desordenados
+    assert [f.t for f in ix.time_range(0, 2)] == [0, 1, 2]
+
+
+def test_load_history_todos_los_almacenes(tmp_path):
+    path = tmp_path / "ds.json"
+    registros = [
+        {"ts": "2025-10-22T13:40:00Z", "from": "!0000000b", "portnum": 3, "lat": 40.4, "lon": -3.7, "alt": 0},
+        {"ts": "2025-10-22T13:41:00Z", "from": "!0000000a", "portnum": 1, "text": "hola"},
+        {"ts": "2025-10-22T13:42:00Z", "from": "!0000000c",
+         "text": "latitude_i: 404000000\nlongitude_i: -37000000\ntime: 1761140520\n"},
+    ]
+    path.write_text(json.dumps(registros[:2]) + "\n" + json.dumps(registros[2]) + "\n", encoding="utf-8")
+    with open(tmp_path / "ds.bin", "wb") as f:
+        CODECS[CODEC_BINARIO].escribir(f, [{"ts": "2025-10-22T13:43:00Z", "from": "!0000000d",
+                                           "portnum": 3, "lat": 40.5, "lon": -3.6, "alt": 0}])
+    ix = IndicePosiciones()
+    assert ix.load_history(str(path)) == 3
+    assert sorted(ix.nodes()) == ["!0000000b", "!0000000c", "!0000000d"]
+    assert ix.last_fix("!0000000c").t == 1761140520
+    assert ix.load_history(str(tmp_path / "no_existe.json")) == 0
@@ -0,0 +1,44 @@
+import types
+
+from metricas import Metricas
+from mqtt_client import MqttClient
+
+
+def test_tuberia_registra_decode_y_descartes(crear_gateway, mensaje_mqtt):
+    gw = crear_gateway(metrics=Metricas(), pipeline_workers=2)
+    gw._start_pipeline()
+    gw._on_message(None, None, mensaje_mqtt(gw, texto="hola"))
+    gw._on_message(None, None, mensaje_mqtt(gw, payload=b"\xff no es un ServiceEnvelope"))
+    gw._stop_pipeline()
+    snap = gw.metrics.snapshot()
+    assert snap["histograms"]["gw_decode_seconds"]["n"] == 2
+    assert snap["counters"]["gw_rx_dropped_total"] == 1
+    assert snap["counters"]["gw_rx_messages_total"] == 2
+
+
+def test_contadores_de_error_se_crean_una_vez(crear_gateway):
+    gw = crear_gateway(metrics=Metricas())
+    p = types.SimpleNamespace(decoded=False, hash=7, channel="LongFast")
+    for _ in range(3):
+        gw._count_packet(p)
+    assert list(gw._m_decrypt_errors) == ["LongFast"]
+    assert gw.metrics.snapshot()["counters"]['gw_decrypt_errors_total{channel="LongFast"}'] == 3
+
+
+class _ClienteFalso:
+    def __init__(self):
+        self.enviados = []
+
+    def publish(self, topic, payload):
+        self.enviados.append(payload)
+
+
+def test_publish_cuenta_bytes_utf8(tmp_path):
+    c = MqttClient(data_store=str(tmp_path / "ds.json"), metrics=Metricas())
+    c._client = _ClienteFalso()
+    c.publish_text("t", "señal ñ")
+    c.publish_json("t", {"k": "á"})
+    c._store.close()
+    enviados = c._client.enviados
+    assert c.metrics.snapshot()["counters"]["mqtt_tx_bytes_total"] == sum(len(b) for b in enviados)
+    assert len(enviados[0]) == len("señal ñ") + 2
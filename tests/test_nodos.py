@@ -0,0 +1,105 @@
+import json
+import time
+
+from meshtastic.protobuf import mesh_pb2
+
+from nodos import NodeDB, num_de
+from paquete import NODEINFO_APP, POSITION_APP, TEXT_MESSAGE_APP, Paquete
+
+AHORA = time.time()
+
+
+def _texto(num: int, gw: str = "!gw") -> Paquete:
+    return Paquete(sender_num=num, gateway_id=gw, portnum=TEXT_MESSAGE_APP, decoded=True, payload=b"hola")
+
+
+def _nodeinfo(num: int, long_name: str = "", short_name: str = "") -> Paquete:
+    u = mesh_pb2.User(long_name=long_name, short_name=short_name, hw_model=mesh_pb2.HardwareModel.TBEAM)
+    return Paquete(sender_num=num, portnum=NODEINFO_APP, decoded=True, pb=u)
+
+
+def _posicion(num: int, lat: float, lon: float) -> Paquete:
+    pos = mesh_pb2.Position(latitude_i=int(lat * 1e7), longitude_i=int(lon * 1e7), altitude=650)
+    return Paquete(sender_num=num, portnum=POSITION_APP, decoded=True, pb=pos)
+
+
+def test_num_de():
+    assert num_de(123456) == 123456
+    assert num_de("!0001e240") == num_de("0001e240") == 123456
+
+
+def test_nodeinfo_y_posicion_se_fusionan():
+    db = NodeDB()
+    db.observe(_nodeinfo(1, "Nodo uno", "N1"), AHORA)
+    db.observe(_posicion(1, 40.4, -3.7), AHORA + 1)
+    db.observe(_nodeinfo(1, short_name="U1"), AHORA + 2)  # sin long_name: se conserva
+    db.observe(_texto(1, "!gw2"), AHORA + 3)
+    n = db.get("!00000001")
+    assert (n.long_name, n.short_name, n.hw_model) == ("Nodo uno", "U1", "TBEAM")
+    assert (n.lat, n.lon, n.alt) == (40.4, -3.7, 650.0)
+    assert n.last_position == AHORA + 1
+    assert n.last_heard == AHORA + 3
+    assert (n.gateway_id, n.paquetes) == ("!gw2", 4)
+    assert db.nombre(1) == "Nodo uno"
+    assert db.nombre("!00000002") == "!00000002"
+    assert "zz" not in db
+
+
+def test_sin_remitente_se_ignora():
+    db = NodeDB()
+    db.observe(_texto(0), AHORA)
+    assert len(db) == 0
+
+
+def test_lru_max_nodes():
+    db = NodeDB(max_nodes=3, ttl=None)
+    for num in (1, 2, 3):
+        db.observe(_texto(num), AHORA + num)
+    db.observe(_texto(1), AHORA + 4)  # 1 pasa a ser el más reciente
+    db.observe(_texto(4), AHORA + 5)
+    assert [n.num for n in db.nodos()] == [4, 1, 3]
+    assert 2 not in db
+    assert db.stats() == {"nodes": 3, "evictions": 1}
+
+
+def test_ttl():
+    db = NodeDB(ttl=100)
+    db.observe(_texto(1), AHORA)
+    db.observe(_texto(2), AHORA + 50)
+    db.observe(_texto(3), AHORA + 120)  # 1 lleva 120 s sin oírse
+    assert [n.num for n in db.nodos()] == [3, 2]
+    assert db.evictions == 1
+
+
+def test_online():
+    db = NodeDB(ttl=None)
+    db.observe(_texto(1), AHORA - 2000)
+    db.observe(_texto(2), AHORA - 10)
+    assert [n.num for n in db.online(900)] == [2]
+
+
+def test_snapshot_y_carga(tmp_path):
+    path = str(tmp_path / "sub" / "nodos.json")
+    db = NodeDB(snapshot_path=path, snapshot_interval=3600)
+    db.observe(_nodeinfo(1, "Nodo uno"), AHORA - 10)
+    db.observe(_posicion(2, 40.4, -3.7), AHORA - 5)
+    db.observe(_texto(1), AHORA)
+    db.snapshot()
+    assert json.loads(open(path, encoding="utf-8").read())["nodos"][0]["num"] == 2
+
+    otra = NodeDB(snapshot_path=path)  # arranque en caliente
+    assert [n.num for n in otra.nodos()] == [1, 2]
+    assert [n.to_dict() for n in otra.nodos()] == [n.to_dict() for n in db.nodos()]
+
+
+def test_snapshot_periodico_y_purga_al_cargar(tmp_path):
+    path = str(tmp_path / "nodos.json")
+    db = NodeDB(ttl=None, snapshot_path=path, snapshot_interval=0)
+    db.observe(_texto(1), AHORA - 3600)
+    db.observe(_texto(2), AHORA)
+    assert len(json.loads(open(path, encoding="utf-8").read())["nodos"]) == 2
+
+    corta = NodeDB(ttl=60, snapshot_path=path)
+    assert [n.num for n in corta.nodos()] == [2]
+    (tmp_path / "roto.json").write_text("{no es json", encoding="utf-8")
+    assert len(NodeDB(snapshot_path=str(tmp_path / "roto.json"))) == 0
@@ -0,0 +1,62 @@
+import json
+
+from paquete import Paquete
+from parseo import posicion_json
+
+
+def _recibir(crear_gateway, mensaje_mqtt, tmp_path, data_de, **kw):
+    """Pasa un paquete por _on_message y devuelve (paquetes entregados, registros persistidos)."""
+    gw = crear_gateway(**kw)
+    paquetes = []
+    gw.on_packet = paquetes.append
+    gw._on_message(None, None, mensaje_mqtt(gw, data_de(gw)))
+    gw.close_store()
+    registros = [json.loads(l) for l in (tmp_path / "ds.json").read_text(encoding="utf-8").splitlines()]
+    return paquetes, registros
+
+
+def test_posicion_estructurada_sin_renderizar(crear_gateway, mensaje_mqtt, tmp_path):
+    paquetes, registros = _recibir(crear_gateway, mensaje_mqtt, tmp_path,
+                                   lambda gw: gw._position_data(40.4168, -3.7038, 650))
+    p = paquetes[0]
+    assert p.is_position and abs(p.lat - 40.4168) < 1e-6
+    assert p._texto is None  # nadie ha pedido str(pb)
+    assert registros[0]["text"] is None
+    assert abs(registros[0]["lat"] - 40.4168) < 1e-6 and registros[0]["alt"] == 650
+
+
+def test_persist_text_renderiza_el_protobuf(crear_gateway, mensaje_mqtt, tmp_path):
+    _, registros = _recibir(crear_gateway, mensaje_mqtt, tmp_path,
+                            lambda gw: gw._position_data(40.4168, -3.7038, 650), persist_text=True)
+    assert "latitude_i" in registros[0]["text"]
+
+
+def test_mensaje_de_texto_se_guarda_siempre(crear_gateway, mensaje_mqtt, tmp_path):
+    paquetes, registros = _recibir(crear_gateway, mensaje_mqtt, tmp_path, lambda gw: gw._text_data("hola"))
+    assert paquetes[0].pb is None
+    assert registros[0]["text"] == "hola"
+
+
+def test_nodeinfo_guarda_los_nombres(crear_gateway, mensaje_mqtt, tmp_path):
+    _, registros = _recibir(crear_gateway, mensaje_mqtt, tmp_path, lambda gw: gw._nodeinfo_data(False),
+                            client_long="Largo", client_short="LG")
+    assert registros[0]["long_name"] == "Largo" and registros[0]["short_name"] == "LG"
+    assert registros[0]["text"] is None
+
+
+def test_posicion_json_retransmitida_es_del_emisor(crear_gateway, mensaje_mqtt):
+    emisor = crear_gateway(node_name="!0000abcd")
+    receptor = crear_gateway(node_name="!00000002")
+    paquetes = []
+    receptor.on_packet = paquetes.append
+    texto = json.dumps({"msg": "aquí", "lat": 40.4, "long": -3.7, "alt": 650})
+    receptor._on_message(None, None, mensaje_mqtt(emisor, texto=texto, gateway_id="!0000beef"))
+    p = paquetes[0]
+    assert p.gateway_id == "!0000beef"
+    assert p.origen == "!0000abcd" == p.sender  # no el relay
+    assert posicion_json(p.texto) == (40.4, -3.7, 650.0)
+
+
+def test_origen_sin_emisor_usa_el_gateway():
+    assert Paquete(sender_num=0, gateway_id="!0000beef").origen == "!0000beef"
+    assert Paquete().origen == "unknown"
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+from meshtastic.protobuf import mesh_pb2
+
+from parseo import (FORMATO_BINARIO, FORMATO_JSON, FORMATO_PROTO_TEXTO, FORMATO_VACIO, detectar_formato,
+                    leer_registros, parsear_archivo, parsear_posicion, posicion_registro, tiempo_texto)
+
+
+def _position(lat_i: int, lon_i: int, alt: int = 0) -> bytes:
+    p = mesh_pb2.Position()
+    p.latitude_i = lat_i
+    p.longitude_i = lon_i
+    if alt:
+        p.altitude = alt
+    return p.SerializeToString()
+
+
+@pytest.mark.parametrize("dato, formato", [
+    (b"", FORMATO_VACIO),
+    ("  \n", FORMATO_VACIO),
+    ('{"lat": 1, "long": 2}', FORMATO_JSON),
+    (b' [1, 2]', FORMATO_JSON),
+    ("latitude_i: 404168000 longitude_i: -37038000", FORMATO_PROTO_TEXTO),
+    (b"\r\nlatitude_i: 1 longitude_i: 2", FORMATO_PROTO_TEXTO),
+    (_position(404168000, -37038000), FORMATO_BINARIO),
+    (b"\xff\xfe", FORMATO_BINARIO),
+])
+def test_detectar_formato(dato, formato):
+    assert detectar_formato(dato) == formato
+
+
+@pytest.mark.parametrize("lat_i, lon_i", [
+    (0x20202020, 0x20202020),  # los bytes de las coordenadas son ASCII válido
+    (10, 10),                  # lat = 1e-6: 0d 0a 00 00 00 (¡"\r\n"!)
+    (0x0A0A0A0A, 0x41414141),
+])
+def test_position_binaria_que_parece_texto(lat_i, lon_i):
+    datos = _position(lat_i, lon_i, 12)
+    assert datos[0] == 0x0D
+    assert detectar_formato(datos) == FORMATO_BINARIO
+    assert parsear_posicion(datos) == (lat_i / 1e7, lon_i / 1e7, 12.0)
+
+
+def test_parsear_los_cuatro_formatos():
+    assert parsear_posicion('{"msg": "x", "lat": 40.4, "lon": -3.7, "alt": 5}') == (40.4, -3.7, 5.0)
+    assert parsear_posicion("latitude_i: 404000000\nlongitude_i: -37000000\naltitude: 650") == (40.4, -3.7, 650.0)
+    assert parsear_posicion(_position(404000000, -37000000, 650)) == (40.4, -3.7, 650.0)
+    assert parsear_posicion(b"") is None
+    assert parsear_posicion('{"msg": "sin posición"}') is None
+    assert parsear_posicion("latitude_i: 1.5 longitude_i: 2") is None
+
+
+def test_registros_y_archivo(tmp_path):
+    path = tmp_path / "ds.json"
+    antiguo = [{"from": "!a", "text": "latitude_i: 10000000 longitude_i: 20000000 time: 1700000000"}]
+    path.write_text(json.dumps(antiguo) + "\n" + json.dumps({"from": "!b", "lat": 3, "lon": 4}) + "\n{roto",
+                    encoding="utf-8")
+    assert len(leer_registros(str(path))) == 2
+    assert parsear_archivo(str(path)) == [("!a", (1.0, 2.0, 0.0)), ("!b", (3.0, 4.0, 0.0))]
+    assert posicion_registro({"text": None}) is None
+    assert tiempo_texto(antiguo[0]["text"]) == 1700000000
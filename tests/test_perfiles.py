@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from decoradores import RegistroPerfiles, registrar_evento
+from metricas import Contador, Histograma
+
+
+def _hilos(n, fn):
+    hilos = [threading.Thread(target=fn) for _ in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+
+def test_errores_y_llamadas_desde_varios_hilos():
+    registro = RegistroPerfiles(activo=True)
+
+    @registrar_evento("falla", registro=registro)
+    def falla(i):
+        if i % 2:
+            raise ValueError(i)
+
+    def trabajo():
+        for i in range(1000):
+            try:
+                falla(i)
+            except ValueError:
+                pass
+
+    _hilos(4, trabajo)
+    p = falla.perfil
+    assert p.llamadas == 4000 and p.errores == 2000
+    assert p.resumen()["errores"] == 2000
+    assert registro.metricas.snapshot()["counters"]['perfil_errors_total{funcion="falla"}'] == 2000
+    registro.reset()
+    assert p.errores == 0 and p.llamadas == 0 and p.pared.resumen()["n"] == 0
+
+
+def test_muestreo_extrapola_el_total():
+    registro = RegistroPerfiles(activo=True, tasa=0.25)
+
+    @registrar_evento("f", registro=registro)
+    def f():
+        pass
+
+    for _ in range(100):
+        f()
+    r = f.perfil.resumen()
+    assert r["llamadas"] == 100 and r["muestras"] == 25
+    with pytest.raises(ValueError):
+        f.perfil.tasa = 0
+
+
+def test_reset_con_escritores_en_marcha():
+    c, h = Contador("c"), Histograma("h")
+    parar = threading.Event()
+
+    def escribir():
+        while not parar.is_set():
+            c.inc()
+            h.observe(0.001)
+
+    hilos = [threading.Thread(target=escribir) for _ in range(3)]
+    for t in hilos:
+        t.start()
+    for _ in range(200):
+        c.reset()
+        h.reset()
+    parar.set()
+    for t in hilos:
+        t.join()
+    c.reset()
+    h.reset()
+    assert c.valor == 0 and h.resumen()["n"] == 0
+    # tras el reset, cada hilo vuelve a sumar en una celda nueva
+    _hilos(3, lambda: [c.inc() or h.observe(0.002) for _ in range(100)])
+    assert c.valor == 300 and h.resumen()["n"] == 300
+    assert abs(h.resumen()["sum"] - 0.6) < 1e-9
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from meshtastic_client import _decode_worker, _init_decode_worker
+from metricas import Contador
+from paquete import Paquete
+from pipeline import MODO_PROCESOS, DecodePipeline
+
+ESPERAS = [0.3, 0.2, 0.1, 0.0]  # el primero en llegar es el último en terminar
+
+
+def _lento(topic: str, payload: bytes) -> int:
+    i = int(payload)
+    time.sleep(ESPERAS[i])
+    return i
+
+
+def _pipeline(entregados, **kw) -> DecodePipeline:
+    kw.setdefault("workers", len(ESPERAS))
+    return DecodePipeline(kw.pop("decode", _lento), entregados.append, **kw)
+
+
+def test_entrega_ordenada():
+    entregados = []
+    p = _pipeline(entregados, ordered=True)
+    for i in range(len(ESPERAS)):
+        assert p.submit("t", str(i).encode())
+    p.close()
+    assert entregados == [0, 1, 2, 3]
+
+
+def test_entrega_desordenada_segun_terminan():
+    entregados = []
+    p = _pipeline(entregados, ordered=False)
+    for i in range(len(ESPERAS)):
+        p.submit("t", str(i).encode())
+    p.close()
+    assert entregados == [3, 2, 1, 0]
+    assert p.stats()["delivered"] == 4
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_close_drena_lo_encolado(ordered):
+    entregados = []
+
+    def decode(topic, payload):
+        time.sleep(0.005)
+        return int(payload)
+
+    p = _pipeline(entregados, decode=decode, workers=2, ordered=ordered)
+    for i in range(100):
+        p.submit("t", str(i).encode())
+    p.close()
+    assert sorted(entregados) == list(range(100))
+    s = p.stats()
+    assert (s["submitted"], s["delivered"], s["queue_depth"], s["delivery_depth"]) == (100, 100, 0, 0)
+    # cerrada: se descarta sin encolar, y cerrar otra vez no hace nada
+    assert p.submit("t", b"0") is False
+    assert p.stats()["dropped"] == 1
+    p.close()
+
+
+def test_cola_llena_descarta():
+    liberar = threading.Event()
+    entregados = []
+    p = _pipeline(entregados, decode=lambda t, b: liberar.wait(5) and int(b),
+                  workers=1, max_queue=2, max_inflight=1)
+    aceptados = sum(p.submit("t", str(i).encode()) for i in range(10))
+    liberar.set()
+    p.close()
+    assert aceptados < 10
+    assert p.dropped == 10 - aceptados
+    assert len(entregados) == aceptados
+
+
+def test_errores_y_descartes():
+    descartes = Contador("descartes")
+
+    def decode(topic, payload):
+        if payload == b"x":
+            raise ValueError("roto")
+        return None if payload == b"-" else payload
+
+    def deliver(res):
+        if res == b"!":
+            raise RuntimeError("callback")
+        entregados.append(res)
+
+    entregados = []
+    p = DecodePipeline(decode, deliver, workers=2, descartes=descartes)
+    for b in (b"a", b"x", b"-", b"!", b"b"):
+        p.submit("t", b)
+    p.close()
+    assert entregados == [b"a", b"b"]
+    assert p.errors == 2
+    assert descartes.valor == 1
+
+
+def test_modo_desconocido():
+    with pytest.raises(ValueError):
+        DecodePipeline(_lento, print, mode="fibras")
+
+
+def test_modo_procesos_entrega_paquetes(crear_gateway, mensaje_mqtt):
+    gw = crear_gateway()
+    gw._refresh_crypto()
+    canales = [(c.name, c.key_b64, c.tag) for c in gw._keyring.values()]
+    mensajes = [mensaje_mqtt(gw, texto=f"hola {i}") for i in range(20)]
+
+    entregados = []
+    p = DecodePipeline(_decode_worker, entregados.append, workers=2, mode=MODO_PROCESOS,
+                       initializer=_init_decode_worker, initargs=(canales, gw._channel_hash, True))
+    for m in mensajes:
+        p.submit(m.topic, m.payload)
+    p.close()
+    assert all(isinstance(x, Paquete) for x in entregados)
+    assert [x.texto for x in entregados] == [f"hola {i}" for i in range(20)]
+    assert {x.sender_num for x in entregados} == {gw._node_number}
+    assert p.stats()["latency"]["decode"]["n"] == 20
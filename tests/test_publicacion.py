@@ -0,0 +1,61 @@
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from exceptions import PublicacionError
+from publicacion import PublishTracker
+
+
+def _info(mid: int) -> mqtt.MQTTMessageInfo:
+    info = mqtt.MQTTMessageInfo(mid)
+    info.rc = mqtt.MQTT_ERR_SUCCESS
+    return info
+
+
+def test_ventana_llena_falla_tras_el_timeout():
+    t = PublishTracker(max_inflight=2, timeout=0.05)
+    t.publish(lambda: _info(1))
+    t.publish(lambda: _info(2))
+    with pytest.raises(PublicacionError):
+        t.publish(lambda: _info(3))
+    t.on_publish(None, None, 1, None, None)
+    fut = t.publish(lambda: _info(3))
+    assert not fut.done()
+    t.on_publish(None, None, 3, None, None)
+    assert fut.result(0) == 3
+
+
+def test_on_publish_antes_de_registrar_el_mid():
+    t = PublishTracker(max_inflight=1)
+    t.on_publish(None, None, 7, None, None)
+    assert t.publish(lambda: _info(7)).result(0) == 7
+    assert t.inflight == 0
+
+
+def test_reservar_no_bloquea_y_publish_usa_la_reserva():
+    t = PublishTracker(max_inflight=1, timeout=0.05)
+    avisos = []
+    t.on_hueco = lambda: avisos.append(1)
+    assert t.reservar()
+    t.publish(lambda: _info(1))  # consume la reserva: no espera
+    assert not t.reservar()
+    t.on_publish(None, None, 1, None, None)
+    assert avisos == [1]
+    assert t.reservar()
+    t.anular_reserva()
+    assert t.reservar()
+
+
+def test_wait_all_se_despierta_con_on_publish():
+    t = PublishTracker(max_inflight=5)
+    for mid in (1, 2):
+        t.publish(lambda mid=mid: _info(mid))
+    assert not t.wait_all(0.01)
+    hilo = threading.Timer(0.05, lambda: [t.on_publish(None, None, m, None, None) for m in (1, 2)])
+    t0 = time.monotonic()
+    hilo.start()
+    assert t.wait_all(2)
+    assert time.monotonic() - t0 < 1
+    assert t.stats()["completed"] == 2
@@ -0,0 +1,75 @@
+import json
+import os
+
+from segment_store import FSYNC_NUNCA, SegmentStore
+
+
+def test_append_y_lectura_en_orden(tmp_path):
+    s = SegmentStore(str(tmp_path / "ds.json"), fsync=FSYNC_NUNCA)
+    for i in range(10):
+        s.append({"n": i})
+    assert [r["n"] for r in s] == list(range(10))
+    s.close()
+
+
+def test_rota_por_tamano_y_conserva_el_orden(tmp_path):
+    s = SegmentStore(str(tmp_path / "ds.json"), max_bytes=64, fsync=FSYNC_NUNCA)
+    for i in range(20):
+        s.append({"n": i, "texto": "x" * 10})
+    s.close()
+    assert len(s.segments()) > 1
+    assert [r["n"] for r in SegmentStore(str(tmp_path / "ds.json"))] == list(range(20))
+
+
+def test_reabrir_continua_tras_el_ultimo_segmento(tmp_path):
+    path = str(tmp_path / "ds.json")
+    s = SegmentStore(path, fsync=FSYNC_NUNCA)
+    s.append({"n": 0})
+    s.close()
+    s = SegmentStore(path, max_bytes=1, fsync=FSYNC_NUNCA)
+    s.append({"n": 1})
+    s.append({"n": 2})
+    s.close()
+    assert [os.path.basename(p) for p in s.segments()] == ["seg-000001.jsonl", "seg-000002.jsonl",
+                                                        "seg-000003.jsonl"]
+    assert [r["n"] for r in s] == [0, 1, 2]
+
+
+def test_migra_el_array_antiguo_una_sola_vez(tmp_path):
+    path = tmp_path / "ds.json"
+    path.write_text(json.dumps([{"n": 0}, {"n": 1}]), encoding="utf-8")
+    s = SegmentStore(str(path), fsync=FSYNC_NUNCA)
+    s.append({"n": 2})
+    s.close()
+    assert not path.exists()
+    assert (tmp_path / "ds.json.migrated").exists()
+    s = SegmentStore(str(path), fsync=FSYNC_NUNCA)
+    assert [r["n"] for r in s] == [0, 1, 2]
+
+
+def test_no_migra_jsonl(tmp_path):
+    path = tmp_path / "ds.json"
+    path.write_text('{"n": 0}\n', encoding="utf-8")
+    SegmentStore(str(path)).close()
+    assert path.exists()
+
+
+def test_ultima_linea_truncada_se_ignora(tmp_path):
+    s = SegmentStore(str(tmp_path / "ds.json"), fsync=FSYNC_NUNCA)
+    s.append({"n": 0})
+    s.close()
+    with open(s.segments()[-1], "ab") as f:
+        f.write(b'{"n": 1')
+    assert [r["n"] for r in s] == [0]
+
+
+def test_cambiar_de_codec_sigue_la_numeracion(tmp_path):
+    path = str(tmp_path / "ds.json")
+    s = SegmentStore(path, fsync=FSYNC_NUNCA)
+    s.append({"n": 0})
+    s.close()
+    s = SegmentStore(path, fsync=FSYNC_NUNCA, codec="bin")
+    s.append({"n": 1})
+    s.close()
+    assert [os.path.basename(p) for p in s.segments()] == ["seg-000001.jsonl", "seg-000002.bin"]
+    assert [r["n"] for r in SegmentStore(path)] == [0, 1]
@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+import simplificacion
+from simplificacion import FiltroStreaming, filtrar_track, rdp, simplificar_puntos
+from track import Track
+
+
+@pytest.fixture(params=["numpy", "python"])
+def ruta_numpy(request, monkeypatch):
+    """Ejecuta el test con y sin NumPy."""
+    if request.param == "python":
+        monkeypatch.setattr(simplificacion, "np", None)
+    elif simplificacion.np is None:
+        pytest.skip("NumPy no disponible")
+    return request.param
+
+
+def _paseo(n: int, semilla: int):
+    rnd = random.Random(semilla)
+    lat, lon = [40.0], [-3.7]
+    for _ in range(n - 1):
+        lat.append(lat[-1] + rnd.uniform(-0.0005, 0.0005))
+        lon.append(lon[-1] + rnd.uniform(-0.0005, 0.0005))
+    return lat, lon
+
+
+@pytest.mark.parametrize("semilla", range(5))
+@pytest.mark.parametrize("tol", [0.0, 1.0, 10.0, 50.0])
+def test_numpy_y_python_coinciden(monkeypatch, semilla, tol):
+    if simplificacion.np is None:
+        pytest.skip("NumPy no disponible")
+    lat, lon = _paseo(300, semilla)
+    con_numpy = rdp(lat, lon, tol)
+    monkeypatch.setattr(simplificacion, "np", None)
+    assert rdp(lat, lon, tol) == con_numpy
+
+
+def test_pocos_puntos(ruta_numpy):
+    assert rdp([], [], 5.0) == []
+    assert rdp([40.0], [-3.7], 5.0) == [0]
+    assert rdp([40.0, 40.1], [-3.7, -3.6], 5.0) == [0, 1]
+    assert simplificar_puntos([(40.0, -3.7)], 5.0) == [(40.0, -3.7)]
+
+
+def test_colineales(ruta_numpy):
+    # sobre el ecuador y sobre un meridiano la proyección es exacta: distancia 0
+    lon = [0.001 * i for i in range(10)]
+    assert rdp([0.0] * 10, lon, 0.0) == [0, 9]
+    assert rdp([40.0 + 0.001 * i for i in range(10)], [-3.7] * 10, 0.0) == [0, 9]
+    # puntos repetidos (tramo de largo 0)
+    assert rdp([40.0] * 5, [-3.7] * 5, 0.0) == [0, 4]
+
+
+def test_tolerancia_cero_conserva_los_vertices(ruta_numpy):
+    # zigzag: con tolerancia 0 ningún vértice sobra; con una enorme, sólo los extremos
+    lat = [0.0, 0.001, 0.0, 0.001, 0.0]
+    lon = [0.0, 0.001, 0.002, 0.003, 0.004]
+    assert rdp(lat, lon, 0.0) == [0, 1, 2, 3, 4]
+    assert rdp(lat, lon, 1e6) == [0, 4]
+
+
+def test_esquina(ruta_numpy):
+    # una L: se conserva la esquina y se quitan los intermedios
+    lat = [40.0] * 5 + [40.0 + 0.001 * i for i in range(1, 5)]
+    lon = [-3.7 + 0.001 * i for i in range(5)] + [-3.696] * 4
+    assert rdp(lat, lon, 1.0) == [0, 4, 8]
+    assert simplificar_puntos(list(zip(lat, lon)), 1.0) == [(lat[0], lon[0]), (lat[4], lon[4]), (lat[8], lon[8])]
+
+
+def test_filtro_streaming_y_batch():
+    f = FiltroStreaming(min_metros=10.0, min_segundos=1.0, max_segundos=60.0)
+    assert f.acepta(0, 40.0, -3.7)
+    assert not f.acepta(0.5, 40.01, -3.7)     # antes de min_segundos
+    assert not f.acepta(5, 40.00001, -3.7)    # a ~1 m
+    assert f.acepta(10, 40.001, -3.7)         # a ~111 m
+    assert f.acepta(80, 40.001, -3.7)         # parado, pero pasa el latido
+    assert (f.aceptados, f.descartados) == (3, 2)
+
+    tr = Track()
+    for t, la, lo in [(0, 40.0, -3.7), (0.5, 40.01, -3.7), (5, 40.00001, -3.7), (10, 40.001, -3.7), (80, 40.001, -3.7)]:
+        tr.append(t, la, lo)
+    assert filtrar_track(tr, 10.0, 1.0, 60.0).t.tolist() == [0, 10, 80]
+
+
+def test_filtro_streaming_conserva_lo_que_conserva_rdp(ruta_numpy):
+    # Ruta con esquinas separadas y ruido de GPS de ~1 m mientras el nodo
+    # está parado: el filtro en vivo debe emitir todo lo que RDP conservaría
+    # sobre el track completo, y lo que descarta es sólo ruido.
+    rnd = random.Random(7)
+    esquinas = [(40.0, -3.7), (40.0, -3.695), (40.004, -3.695), (40.004, -3.69)]
+    lat, lon = [], []
+    for (a0, o0), (a1, o1) in zip(esquinas, esquinas[1:]):
+        for k in range(10):
+            lat.append(a0 + (a1 - a0) * k / 10)
+            lon.append(o0 + (o1 - o0) * k / 10)
+        for _ in range(5):  # parado en la esquina siguiente
+            lat.append(a1 + rnd.uniform(-5e-6, 5e-6))
+            lon.append(o1 + rnd.uniform(-5e-6, 5e-6))
+    lat.append(esquinas[-1][0])
+    lon.append(esquinas[-1][1])
+
+    f = FiltroStreaming(min_metros=10.0, max_segundos=None)
+    emitidos = [i for i in range(len(lat)) if f.acepta(float(i), lat[i], lon[i])]
+    conservados = rdp(lat, lon, 5.0)
+    # las esquinas que conserva RDP (o un fix a <10 m de cada una) pasan el filtro
+    for i in conservados:
+        assert any(abs(lat[i] - lat[j]) < 1e-4 and abs(lon[i] - lon[j]) < 1e-4 for j in emitidos)
+    # y RDP sobre lo emitido conserva las mismas esquinas
+    sub = rdp([lat[i] for i in emitidos], [lon[i] for i in emitidos], 5.0)
+    assert len(sub) == len(conservados) == len(esquinas)
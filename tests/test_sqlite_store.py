@@ -0,0 +1,45 @@
+from historial import FiltroHistorial
+from mqtt_client import MqttClient
+from sqlite_store import BACKEND_SQLITE, SqliteStore
+
+
+def _registros(n: int, desde: int = 0):
+    return [{"ts": f"2025-10-22T10:{i // 60:02d}:{i % 60:02d}Z", "from": "!0000000a",
+             "portnum": 1, "text": f"m{i}"} for i in range(desde, desde + n)]
+
+
+def test_consulta_en_streaming_no_bloquea_al_escritor(tmp_path):
+    db = SqliteStore(str(tmp_path / "ds.db"))
+    db.insert_many(_registros(2500))
+    it = db.registros(FiltroHistorial(node="!0000000a"))
+    assert next(it)["text"] == "m0"
+    db.insert_many(_registros(1, desde=2500))  # con la consulta a medias
+    assert sum(1 for _ in it) >= 2499
+    assert len(db) == 2501
+    assert db.conteo_por_nodo() == {"!0000000a": 2501}
+    it = db.registros()
+    next(it)
+    it.close()
+    db.close()
+
+
+def test_filtros_y_busqueda(tmp_path):
+    db = SqliteStore(str(tmp_path / "ds.db"))
+    db.insert_many(_registros(3) + [{"ts": "2025-10-22T11:00:00Z", "from": "!0000000b", "portnum": 3,
+                                     "lat": 40.4, "lon": -3.7, "alt": 600}])
+    assert [r["text"] for r in db.registros(FiltroHistorial(since="2025-10-22T10:00:01Z", tipo="text"))] == ["m1", "m2"]
+    assert db.posiciones("!0000000b") == [("2025-10-22T11:00:00Z", 40.4, -3.7, 600.0)]
+    assert [r["text"] for r in db.buscar("m2")] == ["m2"]
+    db.close()
+
+
+def test_mqtt_client_sqlite_sigue_persistiendo_tras_desconectar(tmp_path):
+    ruta = str(tmp_path / "ds.db")
+    c = MqttClient(backend=BACKEND_SQLITE, sqlite_path=ruta, data_store=str(tmp_path / "ds.json"))
+    c._persist({"topic": "t", "text": "antes", "ts": "2025-10-22T10:00:00Z"})
+    c.disconnect()
+    c._persist({"topic": "t", "text": "después", "ts": "2025-10-22T10:00:01Z"})
+    c.disconnect()
+    db = SqliteStore(ruta)
+    assert [r["text"] for r in db.registros()] == ["antes", "después"]
+    db.close()
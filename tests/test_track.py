@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+import track
+from track import MAGIC, Track, _REG, haversine
+
+
+def _track(n=10) -> Track:
+    tr = Track()
+    for i in range(n):
+        tr.append(1000.0 + 10 * i, 40.0 + 0.001 * i, -3.7 - 0.001 * i, float(i))
+    return tr
+
+
+@pytest.fixture(params=["numpy", "python"])
+def ruta_numpy(request, monkeypatch):
+    """Ejecuta el test con y sin NumPy."""
+    if request.param == "python":
+        monkeypatch.setattr(track, "np", None)
+    elif track.np is None:
+        pytest.skip("NumPy no disponible")
+    return request.param
+
+
+def test_time_range():
+    tr = _track()
+    assert list(tr.time_range(1020, 1050).t) == [1020, 1030, 1040, 1050]
+    assert len(tr.time_range(1021, 1029)) == 0
+    assert len(tr.time_range(0, 10_000)) == 10
+    assert tr.last(3).t.tolist() == [1070, 1080, 1090]
+
+
+def test_bbox(ruta_numpy):
+    tr = _track()
+    sub = tr.bbox(40.002, 40.004, -3.705, -3.7)
+    assert sub.t.tolist() == [1020, 1030, 1040]
+    assert len(tr.bbox(41, 42, 0, 1)) == 0
+    assert len(Track().bbox(-90, 90, -180, 180)) == 0
+
+
+def test_distancia(ruta_numpy):
+    tr = _track(3)
+    esperado = [haversine(tr.lat[i], tr.lon[i], tr.lat[i + 1], tr.lon[i + 1]) for i in range(2)]
+    assert tr.segment_lengths() == pytest.approx(esperado)
+    assert tr.average_speed() == pytest.approx(sum(esperado) / 20)
+    assert _track(1).segment_lengths() == []
+
+
+def test_dicts_ida_y_vuelta():
+    tr = _track(3)
+    assert Track.from_dicts(list(tr)) == tr
+    assert tr[0] == {"fecha": "1970-01-01T00:16:40", "lat": 40.0, "lon": -3.7, "alt": 0.0}
+
+
+def test_save_y_load(tmp_path):
+    path = str(tmp_path / "a.track")
+    tr = _track()
+    tr.save(path)
+    assert os.path.getsize(path) == len(MAGIC) + 10 * _REG.size
+    assert not os.path.exists(path + ".tmp")
+    assert Track.load(path) == tr
+    assert len(Track.load(str(tmp_path / "no_existe.track"))) == 0
+
+
+def test_append_to_incremental(tmp_path):
+    path = str(tmp_path / "a.track")
+    tr = _track(4)
+    tr.append_to(path, 0)  # fichero nuevo: escribe la cabecera
+    for i in range(4, 10):
+        tr.append(1000.0 + 10 * i, 40.0, -3.7)
+    tr.append_to(path, 4)
+    assert Track.load(path) == tr
+
+
+def test_registro_final_roto(tmp_path):
+    path = str(tmp_path / "a.track")
+    tr = _track(5)
+    tr.save(path)
+    with open(path, "ab") as f:
+        f.write(b"\x01" * (_REG.size - 3))  # corte a mitad de un registro
+    assert Track.load(path) == tr
+    # append_to recorta la cola rota antes de añadir
+    tr.append(2000.0, 41.0, -3.0)
+    tr.append_to(path, 5)
+    assert os.path.getsize(path) == len(MAGIC) + 6 * _REG.size
+    assert Track.load(path) == tr
+
+
+def test_load_rechaza_otro_formato(tmp_path):
+    path = tmp_path / "x.track"
+    path.write_bytes(b"NOPE" + b"\x00" * (4 + _REG.size))
+    with pytest.raises(ValueError):
+        Track.load(str(path))
+
+
+def test_map_memoria(tmp_path):
+    if track.np is None:
+        pytest.skip("NumPy no disponible")
+    path = str(tmp_path / "a.track")
+    tr = _track()
+    tr.save(path)
+    vista = Track.map(path)
+    assert vista.shape == (10, 4)
+    assert vista[:, 0].tolist() == tr.t.tolist()
+    assert vista[3].tolist() == [1030.0, tr.lat[3], tr.lon[3], 3.0]
+    del vista